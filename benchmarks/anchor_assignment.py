@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+# Allow running the benchmark from a source checkout.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from keras_retinanet.utils.anchors import anchors_for_shape, anchor_targets_bbox  # noqa: E402
+
+
+def random_annotations(count, image_shape, min_size, max_size, num_classes, prng):
+    """ Create `count` random annotations of (x1, y1, x2, y2, label) that lie inside the image. """
+    height, width = image_shape[:2]
+    sizes   = prng.uniform(min_size, max_size, (count, 2))
+    x1      = prng.uniform(0, width - sizes[:, 0])
+    y1      = prng.uniform(0, height - sizes[:, 1])
+    labels  = prng.randint(0, num_classes, count)
+    return np.stack([x1, y1, x1 + sizes[:, 0], y1 + sizes[:, 1], labels], axis=1)
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Benchmark dense vs. sparse anchor assignment in anchor_targets_bbox.')
+    parser.add_argument('--image-min-side', help='Height of the benchmarked image.', type=int, default=800)
+    parser.add_argument('--image-max-side', help='Width of the benchmarked image.', type=int, default=1333)
+    parser.add_argument('--counts',         help='Comma separated list of annotation counts.', default='1,10,50,100,300,500')
+    parser.add_argument('--min-box-size',   help='Minimum annotation side in pixels.', type=float, default=10)
+    parser.add_argument('--max-box-size',   help='Maximum annotation side in pixels.', type=float, default=100)
+    parser.add_argument('--repeat',         help='Number of timed runs per measurement (best is reported).', type=int, default=3)
+    parser.add_argument('--use-P2',         help='Include the P2 pyramid level.', dest='P2', action='store_true')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_args(args)
+
+    image_shape    = (args.image_min_side, args.image_max_side, 3)
+    pyramid_levels = [2, 3, 4, 5, 6, 7] if args.P2 else [3, 4, 5, 6, 7]
+    num_classes    = 80
+    prng           = np.random.RandomState(0)
+
+    anchors = anchors_for_shape(image_shape, pyramid_levels=pyramid_levels)
+    print('image shape: {}, anchors: {}'.format(image_shape, anchors.shape[0]))
+    print('{:>12} {:>12} {:>12} {:>9} {:>10}'.format('annotations', 'dense (ms)', 'sparse (ms)', 'speedup', 'identical'))
+
+    for count in [int(c) for c in args.counts.split(',')]:
+        annotations = random_annotations(count, image_shape, args.min_box_size, args.max_box_size, num_classes, prng)
+
+        def run(assignment):
+            return anchor_targets_bbox(image_shape, annotations, num_classes, pyramid_levels=pyramid_levels, assignment=assignment)
+
+        dense  = min(timeit.repeat(lambda: run('dense'), number=1, repeat=args.repeat))
+        sparse = min(timeit.repeat(lambda: run('sparse'), number=1, repeat=args.repeat))
+
+        identical = all(np.array_equal(d, s) for d, s in zip(run('dense'), run('sparse')))
+        print('{:>12} {:>12.1f} {:>12.1f} {:>8.1f}x {:>10}'.format(count, dense * 1000, sparse * 1000, dense / sparse, str(identical)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+import keras
+import numpy as np
+import tensorflow as tf
+
+# Allow running the benchmark from a source checkout.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from keras_retinanet.layers import FilterDetections  # noqa: E402
+
+MODES = [
+    ('per class', dict()),
+    ('batched', dict(batched_nms=True)),
+    ('agnostic', dict(class_specific_filter=False)),
+    ('vectorized', dict(vectorized=True)),
+]
+
+
+def random_detections(num_boxes, num_classes, score_density, prng):
+    """ Create random boxes in a 1333x800 image and sparse classification scores, like a trained model produces. """
+    xy             = prng.uniform(0, 1000, (num_boxes, 2))
+    boxes          = np.concatenate([xy, xy + prng.uniform(10, 300, (num_boxes, 2))], axis=1)
+    classification = prng.uniform(0, 1, (num_boxes, num_classes)) * (prng.uniform(0, 1, (num_boxes, num_classes)) < score_density)
+    return boxes.astype(keras.backend.floatx()), classification.astype(keras.backend.floatx())
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Benchmark per class, batched, class agnostic and vectorized filtering in FilterDetections.')
+    parser.add_argument('--num-boxes',     help='Number of boxes (anchors) per image.', type=int, default=120000)
+    parser.add_argument('--batch-size',    help='Number of images per batch.', type=int, default=1)
+    parser.add_argument('--classes',       help='Comma separated list of class counts.', default='1,20,80,200,600')
+    parser.add_argument('--score-density', help='Fraction of scores that is non zero.', type=float, default=0.001)
+    parser.add_argument('--repeat',        help='Number of timed runs per measurement (best is reported).', type=int, default=5)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_args(args)
+
+    prng = np.random.RandomState(0)
+
+    print('batch size: {}, boxes: {}, score density: {}'.format(args.batch_size, args.num_boxes, args.score_density))
+    print('{:>8} {:>10} {:>12} {:>10} {:>12} {:>10}'.format('classes', 'mode', 'graph ops', 'build (s)', 'run (ms)', 'identical'))
+
+    for num_classes in [int(c) for c in args.classes.split(',')]:
+        detections     = [random_detections(args.num_boxes, num_classes, args.score_density, prng) for _ in range(args.batch_size)]
+        boxes          = np.stack([d[0] for d in detections])
+        classification = np.stack([d[1] for d in detections])
+        expected       = None
+
+        for name, kwargs in MODES:
+            graph = tf.Graph()
+            with graph.as_default():
+                session = tf.Session(graph=graph)
+                keras.backend.set_session(session)
+
+                boxes_input          = tf.placeholder(keras.backend.floatx(), (None, None, 4))
+                classification_input = tf.placeholder(keras.backend.floatx(), (None, None, num_classes))
+
+                start   = timeit.default_timer()
+                outputs = FilterDetections(**kwargs)([boxes_input, classification_input])
+                build   = timeit.default_timer() - start
+
+                feed = {boxes_input: boxes, classification_input: classification}
+                run  = min(timeit.repeat(lambda: session.run(outputs, feed), number=1, repeat=args.repeat))
+
+                result = session.run(outputs, feed)
+                if expected is None:
+                    expected = result
+                identical = all(np.array_equal(r, e) for r, e in zip(result, expected))
+
+                print('{:>8} {:>10} {:>12} {:>10.2f} {:>12.1f} {:>10}'.format(
+                    num_classes, name, len(graph.get_operations()), build, run * 1000, str(identical) if name != 'agnostic' else '-'
+                ))
+                session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+from PIL import Image
+
+# Allow running the benchmark from a source checkout.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from keras_retinanet.bin.pack_records import generator_args  # noqa: E402
+from keras_retinanet.preprocessing.csv_generator import CSVGenerator  # noqa: E402
+from keras_retinanet.preprocessing.record_generator import RecordGenerator  # noqa: E402
+from keras_retinanet.preprocessing.records import write_records  # noqa: E402
+
+
+def write_dataset(directory, num_images, prng):
+    """ Write random JPEG images with one annotation each and their CSV files, returns the (annotations, classes) paths. """
+    rows = []
+    for i in range(num_images):
+        height, width = prng.randint(300, 600), prng.randint(300, 800)
+        image = prng.randint(0, 256, size=(height, width, 3)).astype(np.uint8)
+        name  = 'image_{:06d}.jpg'.format(i)
+        Image.fromarray(image).save(os.path.join(directory, name), quality=90)
+        rows.append('{},{},{},{},{},{}\n'.format(name, 10, 10, width // 2, height // 2, 'object'))
+
+    annotations = os.path.join(directory, 'annotations.csv')
+    classes     = os.path.join(directory, 'classes.csv')
+    with open(annotations, 'w') as f:
+        f.writelines(rows)
+    with open(classes, 'w') as f:
+        f.write('object,0\n')
+    return annotations, classes
+
+
+def read_epoch(generator):
+    """ Load the images and annotations of one epoch, in the order the generator produces its batches. """
+    generator.shuffle_group_order()
+    for group in generator.groups:
+        for image_index in group:
+            generator.load_image(image_index)
+            generator.load_annotations(image_index)
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Benchmark reading a dataset from record files against reading it through the CSV generator.')
+    parser.add_argument('--annotations', help='CSV annotations file of an existing dataset (a random dataset is generated by default).')
+    parser.add_argument('--classes',     help='CSV classes file of an existing dataset.')
+    parser.add_argument('--num-images',  help='Number of images of the generated dataset.', type=int, default=1000)
+    parser.add_argument('--shard-size',  help='Size of a record file in MB.', type=float, default=64)
+    parser.add_argument('--batch-size',  help='Number of images per batch.', type=int, default=1)
+    parser.add_argument('--repeat',      help='Number of timed epochs per generator (best is reported).', type=int, default=3)
+    parser.add_argument('--work-dir',    help='Directory for the generated dataset and the record files (defaults to a temporary directory).')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_args(args)
+
+    work_dir = args.work_dir or tempfile.mkdtemp()
+    try:
+        if args.annotations:
+            annotations, classes = args.annotations, args.classes
+        else:
+            dataset_dir = os.path.join(work_dir, 'images')
+            if not os.path.isdir(dataset_dir):
+                os.makedirs(dataset_dir)
+            annotations, classes = write_dataset(dataset_dir, args.num_images, np.random.RandomState(0))
+
+        common_args = dict(batch_size=args.batch_size, args=generator_args())
+        csv_generator = CSVGenerator(annotations, classes, group_method='random', index_cache=False, image_metadata_cache=False, **common_args)
+
+        records_dir = os.path.join(work_dir, 'records')
+        start       = timeit.default_timer()
+        num_shards  = write_records(csv_generator, records_dir, shard_size=int(args.shard_size * 2 ** 20))
+        print('packed {} images into {} shards in {:.1f}s'.format(csv_generator.size(), num_shards, timeit.default_timer() - start))
+
+        record_generator = RecordGenerator(records_dir, **common_args)
+
+        print('{:>8} {:>10} {:>10}'.format('source', 'epoch (s)', 'images/s'))
+        for name, generator in [('csv', csv_generator), ('records', record_generator)]:
+            epoch = min(timeit.repeat(lambda: read_epoch(generator), number=1, repeat=args.repeat))
+            print('{:>8} {:>10.2f} {:>10.1f}'.format(name, epoch, generator.size() / epoch))
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,52 +1,139 @@
 # -*- coding: utf-8 -*-
 
 import csv
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from optparse import OptionParser
+
 import cv2
 import numpy as np
-from optparse import OptionParser
-def ConvertToRetinaNetFormatMultiCSV(filename, directory='', new='features', channels=3, output_format='.npz', convert_to_npz=True):
+
+from keras_retinanet.preprocessing.raw_images import RawImageWriter
+
+
+def load_stack(filenames):
+    '''
+        Read every channel in grayscale into a preallocated (height, width, channels) uint8 stack.
+    '''
+    stack = None
+    for channel, img_name in enumerate(filenames):
+        temp = cv2.imread(img_name, 0)
+        if temp is None:
+            raise IOError("can't load image : {}".format(img_name))
+        if stack is None:
+            stack = np.empty(temp.shape + (len(filenames),), dtype=np.uint8)
+        elif temp.shape != stack.shape[:2]:
+            raise ValueError('image {} has shape {}, expected {}'.format(img_name, temp.shape, stack.shape[:2]))
+        stack[:, :, channel] = temp
+    return stack
+
+
+def save_npz_atomic(path, img):
+    '''
+        Write a compressed .npz file to a temporary file first and move it in place,
+        so an interrupted conversion never leaves a partially written image.
+    '''
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        np.savez_compressed(f, img)
+    os.replace(temp_path, path)
+
+
+def convert_image(job):
+    '''
+        Pool worker: load the channels of one image and either write them to a .npz file (output is a path)
+        or return the stack to the main process (output is None).
+        Returns a tuple (newname, number of bytes of the stack, stack or None, error message or None).
+    '''
+    newname, filenames, output = job
+    try:
+        img = load_stack(filenames)
+        if output is None:
+            return newname, img.nbytes, img, None
+        save_npz_atomic(output, img)
+        return newname, img.nbytes, None, None
+    except Exception as e:
+        return newname, 0, None, str(e)
+
+
+class Manifest(object):
+    '''
+        Text file with the names of the converted images, one per line, appended as images are converted.
+    '''
+    def __init__(self, path):
+        self.names = set()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                # a trailing line without newline was interrupted while writing
+                self.names = set(line[:-1] for line in f if line.endswith('\n'))
+        self.file = open(path, 'a')
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def add(self, name):
+        self.names.add(name)
+        self.file.write(name + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def ConvertToRetinaNetFormatMultiCSV(filename, directory='', new='features', channels=3, output_format='.npz', convert_to_npz=True, raw_images=None, workers=None, resume=True):
     '''
         Convert dataset in txt format to csv format for retinanet model.
-        Concatenate images in .npz format.
+        Concatenate images in .npz format, or append them to a single uncompressed
+        raw images file (memory-mapped by CSVGeneratorMULTI) when raw_images is given.
+
+        Images are converted in a pool of workers processes (one per cpu by default).
+        With resume, images that were converted by a previous (interrupted) run are skipped:
+        .npz conversions are recorded in a manifest next to the txt file,
+        for a raw images file its index records the converted images.
     '''
+    if raw_images is not None:
+        output_format = ''
+
     found_bg = False
     writer_train = csv.writer(open(filename.replace('.txt', '_train.csv'), "w", newline=''), delimiter=",")
     writer_test = csv.writer(open(filename.replace('.txt', '_test.csv'), "w", newline=''), delimiter=",")
     writer_class = csv.writer(open(filename.replace('.txt', '_classes.csv'), "w", newline=''), delimiter=",")
+    manifest_path = filename.replace('.txt', '_manifest.txt')
     cpt_train = 0
     cpt_test = 0
     class_train_cpt = {}
     class_test_cpt = {}
     class_mapping = {}
     prev = None
-    count = 0
+    images = OrderedDict()
     with open(filename,'r') as f:
         for line in f:
             line_split = line.strip().split(',')
             if channels == 1:
                 (filename1,width, height, x1,y1,x2,y2,class_name, imageset) = line_split
-                filename = [filename1]    
+                filenames = [filename1]
             elif channels == 2:
                 (filename1, filename2, width, height, x1,y1,x2,y2,class_name, imageset) = line_split
-                filename = [filename1, filename2]
+                filenames = [filename1, filename2]
             elif channels == 3:
                 (filename1, filename2,filename3,width, height, x1,y1,x2,y2,class_name, imageset) = line_split
-                filename = [filename1,filename2,filename3]
+                filenames = [filename1,filename2,filename3]
             elif channels == 4:
                 (filename1, filename2,filename3,filename4,width, height, x1,y1,x2,y2,class_name, imageset) = line_split
-                filename = [filename1,filename2,filename3,filename4]
+                filenames = [filename1,filename2,filename3,filename4]
             elif channels == 5:
                 (filename1, filename2,filename3,filename4,filename5,width, height, x1,y1,x2,y2,class_name, imageset) = line_split
-                filename = [filename1,filename2,filename3,filename4,filename5]
-             
-                
+                filenames = [filename1,filename2,filename3,filename4,filename5]
+
             idx = filename1.rfind('_')
-            newname = filename1[:idx+1]+new+output_format    
+            newname = filename1[:idx+1]+new+output_format
             if imageset == 'training':
                     writer_train.writerow([newname,width, height,x1,y1,x2,y2,class_name])
                     if filename1 != prev:
                         cpt_train += 1
-                        
+
                     if class_name in class_train_cpt:
                         class_train_cpt[class_name] += 1
                     else:
@@ -55,55 +142,95 @@ def ConvertToRetinaNetFormatMultiCSV(filename, directory='', new='features', cha
                     writer_test.writerow([newname,width, height,x1,y1,x2,y2,class_name])
                     if filename1 != prev:
                         cpt_test += 1
-               
+
                     if class_name in class_test_cpt:
                         class_test_cpt[class_name] += 1
                     else:
                         class_test_cpt[class_name] = 1
-            # save new data (multi channel) in .npz format            
-            if filename1 != prev and convert_to_npz==True:
-                img = None
-                for img_name in filename:
-                    temp = cv2.imread(img_name, 0)
-                    if temp is None:
-                        print("can't load image :", img_name)
-                        break
-                    temp = np.expand_dims(temp, axis=-1)
-                    if img is None:
-                        img = temp
-                    else:
-                        img = np.concatenate([img, temp], axis=-1)
-                
-                np.savez_compressed(directory+newname, img)
-                count += 1
+            # collect the images to convert to multi channel data
+            if filename1 != prev and convert_to_npz==True and newname not in images:
+                images[newname] = filenames
             prev = filename1
-                    
-                
-                
-                
-                
-                
-            
+
             if class_name not in class_mapping:
                 if class_name == 'bg' and found_bg == False:
                     print('Found class name with special name bg. Will be treated as a background region (this is usually for hard negative mining).')
                     found_bg = True
-                class_mapping[class_name] = len(class_mapping)  
+                class_mapping[class_name] = len(class_mapping)
     for class_, idx_ in class_mapping.items():
         writer_class.writerow([class_, idx_])
     print('number image training :', cpt_train)
     print('number image test :', cpt_test)
-    print('count : ', count)
     print('number of label in train :', class_train_cpt)
-    print('number of label in test :', class_test_cpt)    
+    print('number of label in test :', class_test_cpt)
+
+    if images:
+        convert_images(images, directory, raw_images, manifest_path, workers=workers, resume=resume)
+
+
+def convert_images(images, directory, raw_images, manifest_path, workers=None, resume=True, flush_every=100):
+    '''
+        Convert the images (an ordered dict of new name to channel filenames) in a pool of worker processes.
+    '''
+    if raw_images is not None:
+        # the index of the raw images file is the manifest, images are written by this process in order
+        done = RawImageWriter(directory + raw_images, append=resume)
+        jobs = [(newname, filenames, None) for newname, filenames in images.items() if newname not in done]
+    else:
+        if not resume and os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        done = Manifest(manifest_path)
+        jobs = [
+            (newname, filenames, directory + newname) for newname, filenames in images.items()
+            if newname not in done or not os.path.exists(directory + newname)
+        ]
+
+    print('images to convert :', len(jobs), '(skipping {} converted images)'.format(len(images) - len(jobs)))
+
+    workers = workers or multiprocessing.cpu_count()
+    pool    = multiprocessing.Pool(workers) if workers > 1 and len(jobs) > 1 else None
+    results = pool.imap(convert_image, jobs, chunksize=8) if pool is not None else map(convert_image, jobs)
+
+    start  = time.time()
+    count  = 0
+    failed = 0
+    nbytes = 0
+    try:
+        for newname, size, img, error in results:
+            if error is not None:
+                print(error)
+                failed += 1
+                continue
+
+            if raw_images is not None:
+                done.add(newname, img)
+                if (count + 1) % flush_every == 0:
+                    done.flush()
+            else:
+                done.add(newname)
+            count  += 1
+            nbytes += size
+    finally:
+        if pool is not None:
+            pool.terminate()
+        done.close()
+
+    elapsed = max(time.time() - start, 1e-6)
+    print('count : ', count)
+    print('failed : ', failed)
+    print('throughput : {:.1f} images/s, {:.1f} MB/s ({:.1f}s)'.format(count / elapsed, nbytes / elapsed / 2 ** 20, elapsed))
 
-parser = OptionParser()
-parser.add_option('-f', "--filename", dest="filename", help='.txt filename to convert in .csv format (retinanet)', default='raccoon.txt')        
-parser.add_option('-d', "--dir", dest="dir", help='directory where images are', default='')
-parser.add_option('-c', "--channels",  help='number of channels', type=int,default=3)
-parser.add_option('-n', '--newname', help='name of the new data', default='new')
-parser.add_option('--npz', help="convert to .npz format", action="store_true")
-(options, args) = parser.parse_args()
 
-ConvertToRetinaNetFormatMultiCSV('labels/raccoon.txt', directory='', new=options.newname,channels=options.channels, convert_to_npz=options.npz)
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-f', "--filename", dest="filename", help='.txt filename to convert in .csv format (retinanet)', default='raccoon.txt')
+    parser.add_option('-d', "--dir", dest="dir", help='directory where images are', default='')
+    parser.add_option('-c', "--channels",  help='number of channels', type=int,default=3)
+    parser.add_option('-n', '--newname', help='name of the new data', default='new')
+    parser.add_option('--npz', help="convert to .npz format", action="store_true")
+    parser.add_option('--raw', help="store the converted images in this raw images file instead of .npz files, implies --npz", default=None)
+    parser.add_option('-w', '--workers', help='number of worker processes (defaults to the number of cpus)', type=int, default=None)
+    parser.add_option('--no-resume', help='convert all images again instead of skipping images converted by a previous run', dest='resume', action='store_false', default=True)
+    (options, args) = parser.parse_args()
 
+    ConvertToRetinaNetFormatMultiCSV(options.filename, directory=options.dir, new=options.newname,channels=options.channels, convert_to_npz=options.npz or options.raw is not None, raw_images=options.raw, workers=options.workers, resume=options.resume)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+from PIL import Image
+
+# Allow relative imports when being executed as script.
+if __name__ == "__main__" and __package__ is None:
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+    import keras_retinanet.bin  # noqa: F401
+    __package__ = "keras_retinanet.bin"
+
+# Change these to absolute imports if you copy this script outside the keras_retinanet package.
+from .train import create_generators, parse_args as parse_train_args
+from ..utils.args import configure_anchor_targets
+
+# (stage name, generator methods timed as that stage)
+STAGES = [
+    ('load_image',       ['load_image']),
+    ('load_annotations', ['load_annotations_group']),
+    ('filter',           ['filter_annotations']),
+    ('preprocess',       ['preprocess_image']),
+    ('transform',        ['random_transform_group_entry']),
+    ('resize',           ['resize_image']),
+    ('fused_resize',     ['fused_preprocess_group_entry']),
+    ('compute_inputs',   ['compute_inputs']),
+    ('compute_targets',  ['compute_targets']),
+]
+
+
+def write_synthetic_dataset(directory, num_images, num_classes=2, seed=0):
+    """ Write a dataset of random JPEG images with random annotations in the CSV format.
+
+    Returns
+        A tuple (annotations, classes) with the paths of the CSV annotations and classes files.
+    """
+    prng = np.random.RandomState(seed)
+    rows = []
+    for i in range(num_images):
+        height, width = prng.randint(400, 800), prng.randint(400, 1000)
+        name          = 'image_{:06d}.jpg'.format(i)
+        Image.fromarray(prng.randint(0, 256, size=(height, width, 3)).astype(np.uint8)).save(os.path.join(directory, name))
+
+        for _ in range(prng.randint(1, 6)):
+            x1, y1 = prng.randint(0, width - 50), prng.randint(0, height - 50)
+            x2, y2 = prng.randint(x1 + 20, width), prng.randint(y1 + 20, height)
+            rows.append('{},{},{},{},{},class_{}\n'.format(name, x1, y1, x2, y2, prng.randint(num_classes)))
+
+    annotations = os.path.join(directory, 'annotations.csv')
+    classes     = os.path.join(directory, 'classes.csv')
+    with open(annotations, 'w') as f:
+        f.writelines(rows)
+    with open(classes, 'w') as f:
+        f.writelines('class_{},{}\n'.format(c, c) for c in range(num_classes))
+    return annotations, classes
+
+
+class StageTimer(object):
+    """ Measures the time spent in generator methods by wrapping them on the generator instance.
+
+    Stages report exclusive time: time spent in a nested stage (for example preprocess_image called by
+    fused_preprocess_group_entry) is only counted for the nested stage.
+    """
+    def __init__(self, generator, stages=STAGES):
+        self.totals = collections.OrderedDict((name, 0.0) for name, _ in stages)
+        self.calls  = collections.OrderedDict((name, 0) for name, _ in stages)
+        self.stack  = []
+
+        for name, methods in stages:
+            for method in methods:
+                setattr(generator, method, self._wrap(name, getattr(generator, method)))
+
+    def _wrap(self, name, method):
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            # the second entry collects the time spent in nested stages
+            entry = [timeit.default_timer(), 0.0]
+            self.stack.append(entry)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.stack.pop()
+                elapsed = timeit.default_timer() - entry[0]
+                if self.stack:
+                    self.stack[-1][1] += elapsed
+                self.totals[name] += elapsed - entry[1]
+                self.calls[name]  += 1
+        return timed
+
+    def reset(self):
+        for name in self.totals:
+            self.totals[name] = 0.0
+            self.calls[name]  = 0
+
+
+def run(generator, num_batches, warmup=0):
+    """ Produce batches with generator.next and measure their latency and the time spent per stage.
+
+    Returns
+        A tuple (latencies, stage_timer), with latencies the duration in seconds of every timed batch.
+    """
+    timer = StageTimer(generator)
+
+    for _ in range(warmup):
+        generator.next()
+    timer.reset()
+
+    latencies = np.zeros(num_batches)
+    for i in range(num_batches):
+        start        = timeit.default_timer()
+        generator.next()
+        latencies[i] = timeit.default_timer() - start
+
+    return latencies, timer
+
+
+def report(latencies, timer, batch_size):
+    total = latencies.sum()
+    print('batches: {}, batch size: {}, total: {:.2f}s'.format(len(latencies), batch_size, total))
+    print('throughput: {:.2f} batches/s, {:.2f} images/s'.format(len(latencies) / total, len(latencies) * batch_size / total))
+    print('batch latency (ms): p50 {:.1f}, p95 {:.1f}, p99 {:.1f}, max {:.1f}'.format(
+        *(1000 * np.percentile(latencies, [50, 95, 99, 100]))
+    ))
+
+    print('{:<18} {:>8} {:>10} {:>16} {:>7}'.format('stage', 'calls', 'total (s)', 'per batch (ms)', 'share'))
+    rows = list(timer.totals.items()) + [('other', total - sum(timer.totals.values()))]
+    for name, seconds in rows:
+        print('{:<18} {:>8} {:>10.3f} {:>16.2f} {:>6.1f}%'.format(
+            name, timer.calls.get(name, '-'), seconds, 1000 * seconds / len(latencies), 100 * seconds / total
+        ))
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the training data pipeline without a model. '
+                    'All arguments that are not listed here are passed to the argument parser of train.py, '
+                    'for example: retinanet-benchmark-generator --num-batches 100 --batch-size 2 csv annotations.csv classes.csv'
+    )
+    parser.add_argument('--num-batches',      help='Number of timed batches.', type=int, default=100)
+    parser.add_argument('--warmup',           help='Number of batches produced before timing.', type=int, default=5)
+    parser.add_argument('--validation',       help='Benchmark the validation generator instead of the training generator.', action='store_true')
+    parser.add_argument('--synthetic',        help='Generate a CSV dataset with this number of random images (no dataset type has to be given).', type=int, default=None)
+    parser.add_argument('--synthetic-dir',    help='Directory of the synthetic dataset (defaults to a temporary directory).')
+    return parser.parse_known_args(args)
+
+
+def main(args=None):
+    # parse arguments
+    if args is None:
+        args = sys.argv[1:]
+    args, train_args = parse_args(args)
+
+    synthetic_dir = None
+    if args.synthetic:
+        synthetic_dir = args.synthetic_dir or tempfile.mkdtemp()
+        if not os.path.isdir(synthetic_dir):
+            os.makedirs(synthetic_dir)
+        annotations, classes = write_synthetic_dataset(synthetic_dir, args.synthetic)
+        train_args = list(train_args) + ['csv', annotations, classes, '--no-index-cache']
+
+    try:
+        train_args = parse_train_args(train_args)
+
+        # create the generators like train.py
+        train_generator, validation_generator = create_generators(train_args)
+        generator = validation_generator if args.validation else train_generator
+        if generator is None:
+            raise ValueError('No validation generator was created, provide validation annotations.')
+
+        # there is no model, so the backbone layer shapes are guessed
+        configure_anchor_targets([generator], train_args)
+
+        latencies, timer = run(generator, args.num_batches, warmup=args.warmup)
+        report(latencies, timer, generator.batch_size)
+    finally:
+        if synthetic_dir is not None and not args.synthetic_dir:
+            shutil.rmtree(synthetic_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -44,6 +44,10 @@ def parse_args(args):
     parser.add_argument('model_out', help='Path to save the converted model to.')
     parser.add_argument('--backbone', help='The backbone of the model to convert.', default='resnet50')
     parser.add_argument('--no-nms', help='Disables non maximum suppression.', dest='nms', action='store_false')
+    parser.add_argument('--no-class-specific-filter', help='Disables class specific filtering, only the best scoring class of every box is kept.', dest='class_specific_filter', action='store_false')
+    parser.add_argument('--pre-nms-top-k', help='Only decode and filter the anchors with the highest score per pyramid level (1000 in the RetinaNet paper, defaults to all anchors).', type=int, default=None)
+    parser.add_argument('--vectorized-filter', help='Filter the detections of all images in a batch at once, instead of one image at a time (faster for large batches on CPU).', action='store_true')
+    parser.add_argument('--batched-nms', help='Perform the class specific non maximum suppression in a single operation for all classes (faster with many classes).', action='store_true')
     parser.add_argument('--use-P2', help='Use P2 layer in the network for prediction.', dest='P2', type=boolean_string, default=None)
     parser.add_argument('--scales', help='Choose the different scales for the anchor.', dest='scales', type=list_callbacks, default='2 ** 0, 2 ** (1.0 / 3.0), 2 ** (2.0 / 3.0)')
     parser.add_argument('--ratios', help='Choose the different ratios for the anchor.', dest='ratios', type=list_callbacks, default='0.5,1,2')
@@ -64,10 +68,10 @@ def main(args=None):
         pyramid_levels = [2, 3, 4, 5, 6, 7] if args.P2 == True else [3, 4, 5, 6, 7]
         strides = [2 ** x for x in pyramid_levels]
         sizes = [2 ** (x + 2) for x in pyramid_levels]
-        model = models.load_model(args.model_in, convert=True, backbone_name=args.backbone, nms=args.nms, P2_layer=args.P2, sizes=sizes, strides=strides, ratios=args.ratios, scales=args.scales)      
+        model = models.load_model(args.model_in, convert=True, backbone_name=args.backbone, nms=args.nms, class_specific_filter=args.class_specific_filter, batched_nms=args.batched_nms, pre_nms_top_k=args.pre_nms_top_k, vectorized_filter=args.vectorized_filter, P2_layer=args.P2, sizes=sizes, strides=strides, ratios=args.ratios, scales=args.scales)      
     else:
     
-        model = models.load_model(args.model_in, convert=True, backbone_name=args.backbone, nms=args.nms)
+        model = models.load_model(args.model_in, convert=True, backbone_name=args.backbone, nms=args.nms, class_specific_filter=args.class_specific_filter, batched_nms=args.batched_nms, pre_nms_top_k=args.pre_nms_top_k, vectorized_filter=args.vectorized_filter)
 
     # save model
     model.save(args.model_out)
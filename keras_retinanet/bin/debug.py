@@ -31,11 +31,12 @@ if __name__ == "__main__" and __package__ is None:
 # Change these to absolute imports if you copy this script outside the keras_retinanet package.
 from ..preprocessing.pascal_voc import PascalVocGenerator
 from ..preprocessing.csv_generator import CSVGenerator
-from ..preprocessing.csv_multi_generator import CSVGeneratorMULTI
+from ..preprocessing.csv_generator_multi import CSVGeneratorMULTI
 from ..preprocessing.kitti import KittiGenerator
 from ..preprocessing.open_images import OpenImagesGenerator
 from ..utils.transform import random_transform_generator
 from ..utils.visualization import draw_annotations, draw_boxes
+from ..utils.args import list_callbacks, set_pyramid_args
 
 
 def create_generator(args):
@@ -61,16 +62,14 @@ def create_generator(args):
             args.coco_path,
             args.coco_set,
             transform_generator=transform_generator,
-            mean = args.mean,
-            normalize = args.normalize
+            args=args,
         )
     elif args.dataset_type == 'pascal':
         generator = PascalVocGenerator(
             args.pascal_path,
             args.pascal_set,
             transform_generator=transform_generator,
-            mean = args.mean,
-            normalize = args.normalize
+            args=args,
         )
     elif args.dataset_type == 'csv':
         generator = CSVGenerator(
@@ -78,18 +77,17 @@ def create_generator(args):
             args.classes,
             base_dir=args.dataset_dir,
             transform_generator=transform_generator,
-            mean = args.mean,
-            normalize = args.normalize
+            args=args,
         )
     elif args.dataset_type == 'csv_multi':
         generator = CSVGeneratorMULTI(
-                args.annotations,
-                args.classes,
-                base_dir=args.dataset_dir,
-                transform_generator=transform_generator,
-                mean = args.mean,
-                normalize = args.normalize
-            )
+            args.annotations,
+            args.classes,
+            base_dir=args.dataset_dir,
+            raw_images=args.raw_images,
+            transform_generator=transform_generator,
+            args=args,
+        )
     elif args.dataset_type == 'oid':
         generator = OpenImagesGenerator(
             args.main_dir,
@@ -99,16 +97,14 @@ def create_generator(args):
             fixed_labels=args.fixed_labels,
             annotation_cache_dir=args.annotation_cache_dir,
             transform_generator=transform_generator,
-            mean = args.mean,
-            normalize = args.normalize
+            args=args,
         )
     elif args.dataset_type == 'kitti':
         generator = KittiGenerator(
             args.kitti_path,
             subset=args.subset,
             transform_generator=transform_generator,
-            mean = args.mean,
-            normalize = args.normalize
+            args=args,
         )
     else:
         raise ValueError('Invalid data type received: {}'.format(args.dataset_type))
@@ -153,6 +149,7 @@ def parse_args(args):
     csv_multi_parser.add_argument('annotations', help='Path to CSV file containing annotations for training.')
     csv_multi_parser.add_argument('classes', help='Path to a CSV file containing class label mapping.')
     csv_multi_parser.add_argument('--dataset_dir', help='path to the dataset', default=None)
+    csv_multi_parser.add_argument('--raw-images', help='Read the images from this raw images file (relative to the dataset directory) instead of from .npz files.')
     
     parser.add_argument('-l', '--loop', help='Loop forever, even if the dataset is exhausted.', action='store_true')
     parser.add_argument('--no-resize', help='Disable image resizing.', dest='resize', action='store_false')
@@ -161,7 +158,25 @@ def parse_args(args):
     parser.add_argument('--random-transform', help='Randomly transform image and annotations.', action='store_true')
     parser.add_argument('--remove-mean', dest='mean', help='Preprocessing : remove mean, default False', type=bool, default=False)
     parser.add_argument('--normalize', dest='norm', help='Preprocessing : normalize image, if 1 then value = [0, 1], if -1 then value = [-1, 1] else no normalization', type=int, default=0)
-    return parser.parse_args(args)
+    parser.add_argument('--use-P2', dest='P2', help='Use P2 layer (more consuming) for training and testing in the FPN (only for resnet).', action='store_true')
+    parser.add_argument('--scale', help='list of the scale use in the network.', type=list_callbacks, default='2 ** 0, 2 ** (1.0 / 3.0), 2 ** (2.0 / 3.0)')
+    parser.add_argument('--ratio', help='list of the ratio use in the network.', type=list_callbacks, default='0.5, 1, 2')
+
+    return set_pyramid_args(parser.parse_args(args))
+
+
+def compute_anchor_targets(generator, image, annotations):
+    """ Compute the anchor targets of an image with the pyramid levels and anchor parameters of the generator. """
+    return generator.compute_anchor_targets(
+        image.shape,
+        annotations,
+        generator.num_classes(),
+        pyramid_levels=generator.pyramid_levels,
+        ratios=generator.anchor_ratio,
+        scales=generator.anchor_scale,
+        strides=generator.anchor_stride,
+        sizes=generator.anchor_size,
+    )
 
 
 def run(generator, args):
@@ -180,9 +195,13 @@ def run(generator, args):
             image, image_scale = generator.resize_image(image)
             annotations[:, :4] *= image_scale
 
+        # images of a raw images file are read only views, draw on a copy
+        if not image.flags.writeable:
+            image = image.copy()
+
         # draw anchors on the image
         if args.anchors:
-            labels, _, anchors = generator.compute_anchor_targets(image.shape, annotations, generator.num_classes())
+            labels, _, anchors = compute_anchor_targets(generator, image, annotations)
             draw_boxes(image, anchors[np.max(labels, axis=1) == 1], (255, 255, 0), thickness=1)
 
         # draw annotations on the image
@@ -192,7 +211,7 @@ def run(generator, args):
 
             # draw regressed anchors in green to override most red annotations
             # result is that annotations without anchors are red, with anchors are green
-            labels, boxes, _ = generator.compute_anchor_targets(image.shape, annotations, generator.num_classes())
+            labels, boxes, _ = compute_anchor_targets(generator, image, annotations)
             draw_boxes(image, boxes[np.max(labels, axis=1) == 1], (0, 255, 0))
 
         cv2.imshow('Image', image)
@@ -32,10 +32,12 @@ if __name__ == "__main__" and __package__ is None:
 # Change these to absolute imports if you copy this script outside the keras_retinanet package.
 from .. import models
 from ..preprocessing.csv_generator import CSVGenerator
-from ..preprocessing.csv_multi_generator import CSVGeneratorMULTI
+from ..preprocessing.csv_generator_multi import CSVGeneratorMULTI
 from ..preprocessing.pascal_voc import PascalVocGenerator
-from ..utils.eval import evaluate
+from ..preprocessing.record_generator import RecordGenerator
+from ..utils.eval import COCO_IOU_THRESHOLDS, average_precision_table, evaluate
 from ..utils.keras_version import check_keras_version
+from ..utils.args import list_callbacks, set_pyramid_args
 
 
 def get_session():
@@ -54,8 +56,7 @@ def create_generator(args):
             'val2017',
             image_min_side=args.image_min_side,
             image_max_side=args.image_max_side,
-            mean = args.mean,
-            normalize = args.normalize
+            args=args,
         )
     elif args.dataset_type == 'pascal':
         validation_generator = PascalVocGenerator(
@@ -63,8 +64,7 @@ def create_generator(args):
             'test',
             image_min_side=args.image_min_side,
             image_max_side=args.image_max_side,
-            mean = args.mean,
-            normalize = args.normalize
+            args=args,
         )
     elif args.dataset_type == 'csv':
         validation_generator = CSVGenerator(
@@ -73,19 +73,25 @@ def create_generator(args):
             base_dir=args.dataset_dir,
             image_min_side=args.image_min_side,
             image_max_side=args.image_max_side,
-            mean = args.mean,
-            normalize = args.normalize
+            args=args,
         )
     elif args.dataset_type == 'csv_multi':
         validation_generator = CSVGeneratorMULTI(
-                args.annotations,
-                args.classes,
-                base_dir=args.dataset_dir,
-                image_min_side=args.image_min_side,
-                image_max_side=args.image_max_side,
-                mean = args.mean,
-                normalize = args.normalize
-            )
+            args.annotations,
+            args.classes,
+            base_dir=args.dataset_dir,
+            raw_images=args.raw_images,
+            image_min_side=args.image_min_side,
+            image_max_side=args.image_max_side,
+            args=args,
+        )
+    elif args.dataset_type == 'records':
+        validation_generator = RecordGenerator(
+            args.records_path,
+            image_min_side=args.image_min_side,
+            image_max_side=args.image_max_side,
+            args=args,
+        )
     else:
         raise ValueError('Invalid data type received: {}'.format(args.dataset_type))
 
@@ -112,20 +118,35 @@ def parse_args(args):
     csv_multi_parser.add_argument('annotations', help='Path to CSV file containing annotations for training.')
     csv_multi_parser.add_argument('classes', help='Path to a CSV file containing class label mapping.')
     csv_multi_parser.add_argument('--dataset_dir', help='path to the dataset', default=None)
+    csv_multi_parser.add_argument('--raw-images', help='Read the images from this raw images file (relative to the dataset directory) instead of from .npz files.')
+
+    records_parser = subparsers.add_parser('records')
+    records_parser.add_argument('records_path', help='Path to a directory of record files written by retinanet-pack-records.')
     
     parser.add_argument('model',             help='Path to RetinaNet model.')
     parser.add_argument('--convert-model',   help='Convert the model to an inference model (ie. the input is a training model).', action='store_true')
     parser.add_argument('--backbone',        help='The backbone of the model.', default='resnet50')
+    parser.add_argument('--pre-nms-top-k',   help='Only decode and filter the anchors with the highest score per pyramid level of a converted model (defaults to all anchors).', type=int, default=None)
+    parser.add_argument('--batched-nms',     help='Perform the class specific non maximum suppression of a converted model in a single operation.', action='store_true')
     parser.add_argument('--gpu',             help='Id of the GPU to use (as reported by nvidia-smi).')
     parser.add_argument('--score-threshold', help='Threshold on score to filter detections with (defaults to 0.05).', default=0.05, type=float)
-    parser.add_argument('--iou-threshold',   help='IoU Threshold to count for a positive detection (defaults to 0.5).', default=0.5, type=float)
+    parser.add_argument('--iou-threshold',   help='IoU Threshold to count for a positive detection (defaults to 0.5). Several thresholds are evaluated in one pass.', default=[0.5], type=float, nargs='+')
+    parser.add_argument('--coco-iou-thresholds', help='Evaluate at the IoU thresholds 0.5:0.05:0.95 and report mAP@[.5:.95].', action='store_true')
     parser.add_argument('--max-detections',  help='Max Detections per image (defaults to 100).', default=100, type=int)
     parser.add_argument('--save-path',       help='Path for saving images with detections.')
     parser.add_argument('--image-min-side',  help='Rescale the image so the smallest side is min_side.', type=int, default=800)
     parser.add_argument('--image-max-side',  help='Rescale the image if the largest side is larger than max_side.', type=int, default=1333)
+    parser.add_argument('--eval-prefetch', help='Number of batches loaded and preprocessed ahead by a pool of threads while the model runs (defaults to 0).', default=0, type=int)
+    parser.add_argument('--eval-batch-size', help='Number of images per prediction (defaults to 1).', default=1, type=int)
+    parser.add_argument('--detection-cache', help='Directory to store the raw detections of the model in, so evaluating the same model again (for example with another --score-threshold or --iou-threshold) does not run the model again. Note that the model itself already filters detections with a score below 0.05.')
+    parser.add_argument('--n-jobs',          help='Number of processes used to compute the average precisions (defaults to 1).', default=1, type=int)
     parser.add_argument('--remove-mean', dest='mean', help='Preprocessing : remove mean, default False', type=bool, default=False)
     parser.add_argument('--normalize', dest='norm', help='Preprocessing : normalize image, if 1 then value = [0, 1], if -1 then value = [-1, 1] else no normalization', type=int, default=0)
-    return parser.parse_args(args)
+    parser.add_argument('--use-P2', dest='P2', help='Use P2 layer (more consuming) for training and testing in the FPN (only for resnet).', action='store_true')
+    parser.add_argument('--scale', help='list of the scale use in the network.', type=list_callbacks, default='2 ** 0, 2 ** (1.0 / 3.0), 2 ** (2.0 / 3.0)')
+    parser.add_argument('--ratio', help='list of the ratio use in the network.', type=list_callbacks, default='0.5, 1, 2')
+
+    return set_pyramid_args(parser.parse_args(args))
 
 
 def main(args=None):
@@ -151,25 +172,57 @@ def main(args=None):
 
     # load the model
     print('Loading model, this may take a second...')
-    model = models.load_model(args.model, backbone_name=args.backbone, convert=args.convert_model)
+    model = models.load_model(
+        args.model,
+        backbone_name=args.backbone,
+        convert=args.convert_model,
+        batched_nms=args.batched_nms,
+        pre_nms_top_k=args.pre_nms_top_k,
+        P2_layer=args.P2,
+        sizes=args.size,
+        strides=args.stride,
+        ratios=args.ratio,
+        scales=args.scale,
+    )
 
     # print model summary
     # print(model.summary())
 
     # start evaluation
+    if args.coco_iou_thresholds:
+        iou_thresholds = list(COCO_IOU_THRESHOLDS)
+    else:
+        iou_thresholds = args.iou_threshold
+
     average_precisions = evaluate(
         generator,
         model,
-        iou_threshold=args.iou_threshold,
+        iou_threshold=iou_thresholds if len(iou_thresholds) > 1 else iou_thresholds[0],
         score_threshold=args.score_threshold,
         max_detections=args.max_detections,
-        save_path=args.save_path
+        save_path=args.save_path,
+        n_jobs=args.n_jobs,
+        batch_size=args.eval_batch_size,
+        prefetch=args.eval_prefetch,
+        cache_dir=args.detection_cache,
     )
 
     # print evaluation
-    for label, average_precision in average_precisions.items():
-        print(generator.label_to_name(label), '{:.4f}'.format(average_precision))
-    print('mAP: {:.4f}'.format(sum(average_precisions.values()) / len(average_precisions)))
+    if len(iou_thresholds) == 1:
+        for label, average_precision in average_precisions.items():
+            print(generator.label_to_name(label), '{:.4f}'.format(average_precision))
+        print('mAP: {:.4f}'.format(sum(average_precisions.values()) / len(average_precisions)))
+        return
+
+    # one row per class, one column per IoU threshold
+    table = average_precision_table(average_precisions)
+    names = [generator.label_to_name(label) for label in sorted(average_precisions)]
+    width = max(len(name) for name in names + ['mAP'])
+    print(' ' * width, ' '.join('{:>6.2f}'.format(t) for t in iou_thresholds))
+    for name, row in zip(names, table.T):
+        print(name.ljust(width), ' '.join('{:>6.4f}'.format(ap) for ap in row))
+    print('mAP'.ljust(width), ' '.join('{:>6.4f}'.format(ap) for ap in table.mean(axis=1)))
+    print('mAP@[{:.2f}:{:.2f}]: {:.4f}'.format(min(iou_thresholds), max(iou_thresholds), table.mean()))
 
 
 if __name__ == '__main__':
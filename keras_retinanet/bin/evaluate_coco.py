@@ -33,6 +33,7 @@ if __name__ == "__main__" and __package__ is None:
 # Change these to absolute imports if you copy this script outside the keras_retinanet package.
 from .. import models
 from ..preprocessing.coco import CocoGenerator
+from ..utils.args import list_callbacks, set_pyramid_args
 from ..utils.coco_eval import evaluate_coco
 from ..utils.keras_version import check_keras_version
 
@@ -49,14 +50,22 @@ def parse_args(args):
     parser.add_argument('coco_path',         help='Path to COCO directory (ie. /tmp/COCO).')
     parser.add_argument('--convert-model',   help='Convert the model to an inference model (ie. the input is a training model).', action='store_true')
     parser.add_argument('--backbone',        help='The backbone of the model.', default='resnet50')
+    parser.add_argument('--pre-nms-top-k',   help='Only decode and filter the anchors with the highest score per pyramid level of a converted model (defaults to all anchors).', type=int, default=None)
+    parser.add_argument('--batched-nms',     help='Perform the class specific non maximum suppression of a converted model in a single operation.', action='store_true')
     parser.add_argument('--gpu',             help='Id of the GPU to use (as reported by nvidia-smi).')
     parser.add_argument('--set',             help='Name of the set file to evaluate (defaults to val2017).', default='val2017')
     parser.add_argument('--score-threshold', help='Threshold on score to filter detections with (defaults to 0.05).', default=0.05, type=float)
     parser.add_argument('--image-min-side',  help='Rescale the image so the smallest side is min_side.', type=int, default=800)
     parser.add_argument('--image-max-side',  help='Rescale the image if the largest side is larger than max_side.', type=int, default=1333)
+    parser.add_argument('--results-path',    help='Write the detections in the COCO results format to this JSON file (for example val2017_bbox_results.json).')
+    parser.add_argument('--eval-prefetch', help='Number of batches loaded and preprocessed ahead by a pool of threads while the model runs (defaults to 0).', default=0, type=int)
+    parser.add_argument('--eval-batch-size', help='Number of images per prediction (defaults to 1).', default=1, type=int)
     parser.add_argument('--remove-mean', dest='mean', help='Preprocessing : remove mean, default False', type=bool, default=False)
     parser.add_argument('--normalize', dest='norm', help='Preprocessing : normalize image, if 1 then value = [0, 1], if -1 then value = [-1, 1] else no normalization', type=int, default=0)
-    return parser.parse_args(args)
+    parser.add_argument('--use-P2', dest='P2', help='Use P2 layer (more consuming) for training and testing in the FPN (only for resnet).', action='store_true')
+    parser.add_argument('--scale', help='list of the scale use in the network.', type=list_callbacks, default='2 ** 0, 2 ** (1.0 / 3.0), 2 ** (2.0 / 3.0)')
+    parser.add_argument('--ratio', help='list of the ratio use in the network.', type=list_callbacks, default='0.5, 1, 2')
+    return set_pyramid_args(parser.parse_args(args))
 
 
 def main(args=None):
@@ -75,7 +84,18 @@ def main(args=None):
 
     # create the model
     print('Loading model, this may take a second...')
-    model = models.load_model(args.model, backbone_name=args.backbone, convert=args.convert_model)
+    model = models.load_model(
+        args.model,
+        backbone_name=args.backbone,
+        convert=args.convert_model,
+        batched_nms=args.batched_nms,
+        pre_nms_top_k=args.pre_nms_top_k,
+        P2_layer=args.P2,
+        sizes=args.size,
+        strides=args.stride,
+        ratios=args.ratio,
+        scales=args.scale,
+    )
 
     # create a generator for testing data
     test_generator = CocoGenerator(
@@ -83,11 +103,10 @@ def main(args=None):
         args.set,
         image_min_side=args.image_min_side,
         image_max_side=args.image_max_side,
-        mean = args.mean,
-        normalize = args.normalize
+        args=args,
     )
 
-    evaluate_coco(test_generator, model, args.score_threshold)
+    evaluate_coco(test_generator, model, args.score_threshold, batch_size=args.eval_batch_size, prefetch=args.eval_prefetch, results_path=args.results_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+# Allow relative imports when being executed as script.
+if __name__ == "__main__" and __package__ is None:
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+    import keras_retinanet.bin  # noqa: F401
+    __package__ = "keras_retinanet.bin"
+
+# Change these to absolute imports if you copy this script outside the keras_retinanet package.
+from ..preprocessing.csv_generator import CSVGenerator
+from ..preprocessing.kitti import KittiGenerator
+from ..preprocessing.open_images import OpenImagesGenerator
+from ..preprocessing.pascal_voc import PascalVocGenerator
+from ..preprocessing.records import write_records
+from ..utils.args import add_generator_args, set_pyramid_args
+
+
+def generator_args():
+    """ Generator arguments with the defaults of train.py, only needed to construct a generator, they do not influence the packed data. """
+    return set_pyramid_args(add_generator_args(argparse.ArgumentParser()).parse_args([]))
+
+
+def create_generator(args):
+    # the packed images are shuffled by write_records, don't read the (possibly remote) images to group them by ratio
+    common_args = {
+        'group_method'   : 'none',
+        'shuffle_groups' : False,
+        'args'           : generator_args(),
+    }
+
+    if args.dataset_type == 'coco':
+        # import here to prevent unnecessary dependency on cocoapi
+        from ..preprocessing.coco import CocoGenerator
+
+        generator = CocoGenerator(args.coco_path, args.coco_set, **common_args)
+    elif args.dataset_type == 'pascal':
+        generator = PascalVocGenerator(args.pascal_path, args.pascal_set, **common_args)
+    elif args.dataset_type == 'csv':
+        generator = CSVGenerator(args.annotations, args.classes, base_dir=args.dataset_dir, **common_args)
+    elif args.dataset_type == 'oid':
+        generator = OpenImagesGenerator(
+            args.main_dir,
+            subset=args.subset,
+            version=args.version,
+            labels_filter=args.labels_filter,
+            annotation_cache_dir=args.annotation_cache_dir,
+            fixed_labels=args.fixed_labels,
+            **common_args
+        )
+    elif args.dataset_type == 'kitti':
+        generator = KittiGenerator(args.kitti_path, subset=args.subset, **common_args)
+    else:
+        raise ValueError('Invalid data type received: {}'.format(args.dataset_type))
+
+    return generator
+
+
+def parse_args(args):
+    parser     = argparse.ArgumentParser(description='Pack a dataset into sharded record files for the records dataset type.')
+    subparsers = parser.add_subparsers(help='Arguments for specific dataset types.', dest='dataset_type')
+    subparsers.required = True
+
+    coco_parser = subparsers.add_parser('coco')
+    coco_parser.add_argument('coco_path',  help='Path to dataset directory (ie. /tmp/COCO).')
+    coco_parser.add_argument('--coco-set', help='Name of the set to pack (defaults to train2017).', default='train2017')
+
+    pascal_parser = subparsers.add_parser('pascal')
+    pascal_parser.add_argument('pascal_path',  help='Path to dataset directory (ie. /tmp/VOCdevkit).')
+    pascal_parser.add_argument('--pascal-set', help='Name of the set to pack (defaults to trainval).', default='trainval')
+
+    kitti_parser = subparsers.add_parser('kitti')
+    kitti_parser.add_argument('kitti_path', help='Path to dataset directory (ie. /tmp/kitti).')
+    kitti_parser.add_argument('subset',     help='Argument for loading a subset from train/val.')
+
+    def csv_list(string):
+        return string.split(',')
+
+    oid_parser = subparsers.add_parser('oid')
+    oid_parser.add_argument('main_dir', help='Path to dataset directory.')
+    oid_parser.add_argument('subset', help='Argument for loading a subset from train/validation/test.')
+    oid_parser.add_argument('--version',  help='The current dataset version is v4.', default='v4')
+    oid_parser.add_argument('--labels-filter',  help='A list of labels to filter.', type=csv_list, default=None)
+    oid_parser.add_argument('--annotation-cache-dir', help='Path to store annotation cache.', default='.')
+    oid_parser.add_argument('--fixed-labels', help='Use the exact specified labels.', default=False)
+
+    csv_parser = subparsers.add_parser('csv')
+    csv_parser.add_argument('annotations',   help='Path to CSV file containing annotations.')
+    csv_parser.add_argument('classes',       help='Path to a CSV file containing class label mapping.')
+    csv_parser.add_argument('--dataset_dir', help='path to the dataset', default=None)
+
+    parser.add_argument('output',       help='Output directory of the record files and their index.')
+    parser.add_argument('--shard-size', help='Size of a record file in MB.', type=float, default=256)
+    parser.add_argument('--no-shuffle', help='Store the images in dataset order instead of a random order.', dest='shuffle', action='store_false')
+    parser.add_argument('--seed',       help='Seed of the random order of the images.', type=int, default=0)
+
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    # parse arguments
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_args(args)
+
+    generator = create_generator(args)
+    size      = generator.size()
+    start     = time.time()
+
+    def progress(count):
+        if count % 1000 == 0 or count == size:
+            print('\r{}/{} images'.format(count, size), end='')
+            sys.stdout.flush()
+
+    num_shards = write_records(
+        generator,
+        args.output,
+        shard_size=int(args.shard_size * 2 ** 20),
+        shuffle=args.shuffle,
+        seed=args.seed,
+        progress=progress,
+    )
+    print('\nwrote {} images to {} shards in {:.1f}s'.format(size, num_shards, time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -17,7 +17,6 @@ limitations under the License.
 """
 
 import argparse
-import functools
 import os
 import sys
 import warnings
@@ -39,13 +38,15 @@ from .. import losses
 from .. import models
 from ..callbacks import RedirectModel
 from ..callbacks.eval import Evaluate
-from ..models.retinanet import retinanet_bbox, AnchorParameters
+from ..models.retinanet import retinanet_bbox, retinanet_preprocessing, AnchorParameters
 from ..preprocessing.csv_generator import CSVGenerator
 from ..preprocessing.csv_generator_multi import CSVGeneratorMULTI
 from ..preprocessing.kitti import KittiGenerator
+from ..preprocessing.multiprocess import MultiprocessGenerator
 from ..preprocessing.open_images import OpenImagesGenerator
 from ..preprocessing.pascal_voc import PascalVocGenerator
-from ..utils.anchors import make_shapes_callback, anchor_targets_bbox
+from ..preprocessing.record_generator import RecordGenerator
+from ..utils.args import add_generator_args, configure_anchor_targets, set_pyramid_args
 from ..utils.keras_version import check_keras_version
 from ..utils.model import freeze as freeze_model
 from ..utils.transform import random_transform_generator
@@ -67,8 +68,6 @@ def makedirs(path):
         if not os.path.isdir(path):
             raise
 
-def list_callbacks(parse):
-    return np.array([eval(s) for s in parse.split(',')])
 def get_session():
     config = tf.ConfigProto()
     config.gpu_options.allow_growth = True
@@ -81,22 +80,30 @@ def model_with_weights(model, weights, skip_mismatch):
     return model
 
 
-def create_models(backbone_retinanet, num_classes, weights, args, multi_gpu=0, freeze_backbone=False, shape=(None, None, 3), opt=keras.optimizers.adam(lr=1e-5, clipnorm=0.001)):
+def create_models(backbone_retinanet, num_classes, weights, args, multi_gpu=0, freeze_backbone=False, shape=(None, None, 3), opt=keras.optimizers.adam(lr=1e-5, clipnorm=0.001), preprocessing=None):
+    """ Creates the model that is saved, the model that is trained and the model used for evaluation.
+
+    If preprocessing is a dict (with the arguments of retinanet_preprocessing), the training and prediction models
+    take uint8 images and preprocess them in the graph. The saved model always takes preprocessed images.
+    """
     modifier = freeze_model if freeze_backbone else None
 
     # Keras recommends initialising a multi-gpu model on the CPU to ease weight sharing, and to prevent OOM errors.
     # optionally wrap in a parallel model
     if multi_gpu > 1:
         with tf.device('/cpu:0'):
-            model = model_with_weights(backbone_retinanet(num_classes, modifier=modifier, shape=shape, num_anchors=len(args.ratio)*len(args.scale)), weights=weights, skip_mismatch=True)
-        training_model = multi_gpu_model(model, gpus=multi_gpu)
+            model          = model_with_weights(backbone_retinanet(num_classes, modifier=modifier, shape=shape, num_anchors=len(args.ratio)*len(args.scale)), weights=weights, skip_mismatch=True)
+            training_model = retinanet_preprocessing(model, **preprocessing) if preprocessing else model
+        training_model = multi_gpu_model(training_model, gpus=multi_gpu)
     else:
         model          = model_with_weights(backbone_retinanet(num_classes, modifier=modifier, shape=shape, num_anchors=len(args.ratio)*len(args.scale)), weights=weights, skip_mismatch=True)
-        training_model = model
+        training_model = retinanet_preprocessing(model, **preprocessing) if preprocessing else model
 
     # make prediction model
     anchors_param = AnchorParameters(sizes=args.size, strides=args.stride, ratios=args.ratio, scales=args.scale)
-    prediction_model = retinanet_bbox(model=model, anchor_parameters=anchors_param, P2_layer=args.P2)
+    prediction_model = retinanet_bbox(model=model, anchor_parameters=anchors_param, P2_layer=args.P2, pre_nms_top_k=args.pre_nms_top_k)
+    if preprocessing:
+        prediction_model = retinanet_preprocessing(prediction_model, **preprocessing)
 
     # compile model
     training_model.compile(
@@ -134,9 +141,9 @@ def create_callbacks(model, training_model, prediction_model, validation_generat
             from ..callbacks.coco import CocoEval
 
             # use prediction model for evaluation
-            evaluation = CocoEval(validation_generator, tensorboard=tensorboard_callback)
+            evaluation = CocoEval(validation_generator, tensorboard=tensorboard_callback, batch_size=args.eval_batch_size, prefetch=args.eval_prefetch)
         else:
-            evaluation = Evaluate(validation_generator, tensorboard=tensorboard_callback, tensorboard_image=tensorboard_image, number_images=args.tensorboxes, separate_channels=args.tensorboxes_channels)
+            evaluation = Evaluate(validation_generator, tensorboard=tensorboard_callback, tensorboard_image=tensorboard_image, number_images=args.tensorboxes, separate_channels=args.tensorboxes_channels, n_jobs=args.eval_n_jobs, batch_size=args.eval_batch_size, prefetch=args.eval_prefetch)
         evaluation = RedirectModel(evaluation, prediction_model)
         callbacks.append(evaluation)
 
@@ -200,6 +207,9 @@ def create_generators(args):
     else:
         transform_generator = random_transform_generator(flip_x_chance=0.5)
 
+    # memory budget in bytes of the decoded image cache of every generator, None disables the cache
+    image_cache = int(args.image_cache_size * 2 ** 20) if args.image_cache_size else None
+
     if args.dataset_type == 'coco':
         # import here to prevent unnecessary dependency on cocoapi
         from ..preprocessing.coco import CocoGenerator
@@ -211,6 +221,11 @@ def create_generators(args):
             batch_size=args.batch_size,
             image_min_side=args.image_min_side,
             image_max_side=args.image_max_side,
+            fused_resize=args.fused_resize,
+            preprocess_in_model=args.preprocess_in_model,
+            image_cache=image_cache,
+            image_cache_resized=args.image_cache_resized,
+            image_metadata_cache=args.image_metadata_cache,
             args=args,
         )
 
@@ -220,6 +235,11 @@ def create_generators(args):
             batch_size=args.batch_size,
             image_min_side=args.image_min_side,
             image_max_side=args.image_max_side,
+            fused_resize=args.fused_resize,
+            preprocess_in_model=args.preprocess_in_model,
+            image_cache=image_cache,
+            image_cache_resized=args.image_cache_resized,
+            image_metadata_cache=args.image_metadata_cache,
             args=args,
         )
     elif args.dataset_type == 'pascal':
@@ -230,6 +250,11 @@ def create_generators(args):
             batch_size=args.batch_size,
             image_min_side=args.image_min_side,
             image_max_side=args.image_max_side,
+            fused_resize=args.fused_resize,
+            preprocess_in_model=args.preprocess_in_model,
+            image_cache=image_cache,
+            image_cache_resized=args.image_cache_resized,
+            image_metadata_cache=args.image_metadata_cache,
             args=args,
         )
 
@@ -239,6 +264,11 @@ def create_generators(args):
             batch_size=args.batch_size,
             image_min_side=args.image_min_side,
             image_max_side=args.image_max_side,
+            fused_resize=args.fused_resize,
+            preprocess_in_model=args.preprocess_in_model,
+            image_cache=image_cache,
+            image_cache_resized=args.image_cache_resized,
+            image_metadata_cache=args.image_metadata_cache,
             args=args,
         )
     elif args.dataset_type == 'csv':
@@ -246,10 +276,16 @@ def create_generators(args):
             args.annotations,
             args.classes,
             base_dir=args.dataset_dir,
+            index_cache=args.index_cache,
             transform_generator=transform_generator,
             batch_size=args.batch_size,
             image_min_side=args.image_min_side,
             image_max_side=args.image_max_side,
+            fused_resize=args.fused_resize,
+            preprocess_in_model=args.preprocess_in_model,
+            image_cache=image_cache,
+            image_cache_resized=args.image_cache_resized,
+            image_metadata_cache=args.image_metadata_cache,
             args=args,
         )
         print('training generator loaded')
@@ -258,9 +294,15 @@ def create_generators(args):
                 args.val_annotations,
                 args.classes,
                 base_dir=args.dataset_dir,
+                index_cache=args.index_cache,
                 batch_size=args.batch_size,
                 image_min_side=args.image_min_side,
                 image_max_side=args.image_max_side,
+                fused_resize=args.fused_resize,
+                preprocess_in_model=args.preprocess_in_model,
+                image_cache=image_cache,
+                image_cache_resized=args.image_cache_resized,
+                image_metadata_cache=args.image_metadata_cache,
                 args=args,
             )
             print('validating generator loaded')
@@ -271,10 +313,17 @@ def create_generators(args):
             args.annotations,
             args.classes,
             base_dir=args.dataset_dir,
+            index_cache=args.index_cache,
+            raw_images=args.raw_images,
             transform_generator=transform_generator,
             batch_size=args.batch_size,
             image_min_side=args.image_min_side,
             image_max_side=args.image_max_side,
+            fused_resize=args.fused_resize,
+            preprocess_in_model=args.preprocess_in_model,
+            image_cache=image_cache,
+            image_cache_resized=args.image_cache_resized,
+            image_metadata_cache=args.image_metadata_cache,
             args=args,
         )
 
@@ -283,9 +332,16 @@ def create_generators(args):
                 args.val_annotations,
                 args.classes,
                 base_dir=args.dataset_dir,
+                index_cache=args.index_cache,
+                raw_images=args.raw_images,
                 batch_size=args.batch_size,
                 image_min_side=args.image_min_side,
                 image_max_side=args.image_max_side,
+                fused_resize=args.fused_resize,
+                preprocess_in_model=args.preprocess_in_model,
+                image_cache=image_cache,
+                image_cache_resized=args.image_cache_resized,
+                image_metadata_cache=args.image_metadata_cache,
                 args=args,
             )
         else:
@@ -303,6 +359,11 @@ def create_generators(args):
             batch_size=args.batch_size,
             image_min_side=args.image_min_side,
             image_max_side=args.image_max_side,
+            fused_resize=args.fused_resize,
+            preprocess_in_model=args.preprocess_in_model,
+            image_cache=image_cache,
+            image_cache_resized=args.image_cache_resized,
+            image_metadata_cache=args.image_metadata_cache,
             args=args,
         )
 
@@ -316,6 +377,11 @@ def create_generators(args):
             batch_size=args.batch_size,
             image_min_side=args.image_min_side,
             image_max_side=args.image_max_side,
+            fused_resize=args.fused_resize,
+            preprocess_in_model=args.preprocess_in_model,
+            image_cache=image_cache,
+            image_cache_resized=args.image_cache_resized,
+            image_metadata_cache=args.image_metadata_cache,
             args=args,
         )
     elif args.dataset_type == 'kitti':
@@ -326,6 +392,11 @@ def create_generators(args):
             batch_size=args.batch_size,
             image_min_side=args.image_min_side,
             image_max_side=args.image_max_side,
+            fused_resize=args.fused_resize,
+            preprocess_in_model=args.preprocess_in_model,
+            image_cache=image_cache,
+            image_cache_resized=args.image_cache_resized,
+            image_metadata_cache=args.image_metadata_cache,
             args=args,
         )
 
@@ -335,13 +406,53 @@ def create_generators(args):
             batch_size=args.batch_size,
             image_min_side=args.image_min_side,
             image_max_side=args.image_max_side,
+            fused_resize=args.fused_resize,
+            preprocess_in_model=args.preprocess_in_model,
+            image_cache=image_cache,
+            image_cache_resized=args.image_cache_resized,
+            image_metadata_cache=args.image_metadata_cache,
+            args=args,
+        )
+    elif args.dataset_type == 'records':
+        train_generator = RecordGenerator(
+            args.records_path,
+            buffer_size=int(args.read_buffer_size * 2 ** 20),
+            interleave=args.interleave_shards,
+            transform_generator=transform_generator,
+            batch_size=args.batch_size,
+            image_min_side=args.image_min_side,
+            image_max_side=args.image_max_side,
+            fused_resize=args.fused_resize,
+            preprocess_in_model=args.preprocess_in_model,
+            image_cache=image_cache,
+            image_cache_resized=args.image_cache_resized,
+            image_metadata_cache=args.image_metadata_cache,
             args=args,
         )
+
+        if args.val_records:
+            validation_generator = RecordGenerator(
+                args.val_records,
+                buffer_size=int(args.read_buffer_size * 2 ** 20),
+                interleave=args.interleave_shards,
+                batch_size=args.batch_size,
+                image_min_side=args.image_min_side,
+                image_max_side=args.image_max_side,
+                fused_resize=args.fused_resize,
+                preprocess_in_model=args.preprocess_in_model,
+                image_cache=image_cache,
+                image_cache_resized=args.image_cache_resized,
+                image_metadata_cache=args.image_metadata_cache,
+                args=args,
+            )
+        else:
+            validation_generator = None
     else:
         raise ValueError('Invalid data type received: {}'.format(args.dataset_type))
 
     return train_generator, validation_generator
 
+
 def optimizers(args):
     if args.optimizer == 'adamax':
         opt = Adamax(lr=args.lr, clipnorm=args.clip_norm)
@@ -384,13 +495,13 @@ def check_args(parsed_args):
     if parsed_args.multi_gpu > 1 and not parsed_args.multi_gpu_force:
         raise ValueError("Multi-GPU support is experimental, use at own risk! Run with --multi-gpu-force if you wish to continue.")
 
+    if parsed_args.use_multiprocessing and parsed_args.workers < 1:
+        raise ValueError("--use-multiprocessing requires at least one worker, received --workers {}.".format(parsed_args.workers))
+
     if 'resnet' not in parsed_args.backbone:
         warnings.warn('Using experimental backbone {}. Only resnet50 has been properly tested.'.format(parsed_args.backbone))
-     
-    parsed_args.pyramid_levels = [2, 3, 4, 5, 6, 7] if parsed_args.P2 else [3, 4, 5, 6, 7]
-    parsed_args.stride = [2 ** x for x in parsed_args.pyramid_levels]
-    parsed_args.size = [2 ** (x + 2) for x in parsed_args.pyramid_levels]
-    return parsed_args
+
+    return set_pyramid_args(parsed_args)
 
 
 def parse_args(args):
@@ -422,12 +533,21 @@ def parse_args(args):
     csv_parser.add_argument('classes', help='Path to a CSV file containing class label mapping.')
     csv_parser.add_argument('--val-annotations', help='Path to CSV file containing annotations for validation (optional).')
     csv_parser.add_argument('--dataset_dir', help='path to the dataset', default=None)
+    csv_parser.add_argument('--no-index-cache', help='Always parse the annotations CSV instead of using its compiled index.', dest='index_cache', action='store_false')
     
     csv_multi_parser = subparsers.add_parser('csv_multi')
     csv_multi_parser.add_argument('annotations', help='Path to CSV file containing annotations for training.')
     csv_multi_parser.add_argument('classes', help='Path to a CSV file containing class label mapping.')
     csv_multi_parser.add_argument('--val-annotations', help='Path to CSV file containing annotations for validation (optional).')
     csv_multi_parser.add_argument('--dataset_dir', help='path to the dataset', default=None)
+    csv_multi_parser.add_argument('--raw-images', help='Read the images from this raw images file (relative to the dataset directory) instead of from .npz files.')
+    csv_multi_parser.add_argument('--no-index-cache', help='Always parse the annotations CSV instead of using its compiled index.', dest='index_cache', action='store_false')
+
+    records_parser = subparsers.add_parser('records')
+    records_parser.add_argument('records_path',        help='Path to a directory of record files written by retinanet-pack-records.')
+    records_parser.add_argument('--val-records',       help='Path to a directory of record files for validation (optional).')
+    records_parser.add_argument('--read-buffer-size',  help='Size of the read buffer of a record file in MB.', type=float, default=16)
+    records_parser.add_argument('--interleave-shards', help='Number of record files read at the same time, their images are shuffled together.', type=int, default=4)
     
     group = parser.add_mutually_exclusive_group()
     group.add_argument('--snapshot',          help='Resume training from a snapshot.')
@@ -451,8 +571,7 @@ def parse_args(args):
     parser.add_argument('--image-min-side', help='Rescale the image so the smallest side is min_side.', type=int, default=800)
     parser.add_argument('--image-max-side', help='Rescale the image if the largest side is larger than max_side.', type=int, default=1333)
     parser.add_argument('--channels', dest="channels", help='Number of channels in the input data', type=int, default=3)
-    parser.add_argument('--remove-mean', dest='mean', help='Preprocessing : remove mean, default False', default='False')
-    parser.add_argument('--normalize', dest='norm', help='Preprocessing : normalize image, if 1 then value = [0, 1], if -1 then value = [-1, 1] else no normalization', type=int, default=0)
+    add_generator_args(parser)
     parser.add_argument('--optimizer', help='choose optimizer : sgd, adam, rmsprop, adagrad, adadelta, adamax, nadam. default=adam', default='adam')   
     parser.add_argument('--lr',  help='Choose learning rate value, default = 0.00001.', type=float, default=1e-5)
     parser.add_argument('--clip-norm',  help='Choose clip norm value, default = 0.00001.', type=float, default=0.001)
@@ -460,9 +579,19 @@ def parse_args(args):
     parser.add_argument('--tensorboxes', help='Number of images to store on tensorboard', type=int, default=0)
     parser.add_argument('--tensorboxes-channels', help='display each channels on tensorboard. If --channels is different from 3, True forced.', action='store_true')
     parser.add_argument('--use-val-loss', dest='val_loss',  help='Compute validation loss', action='store_true')
-    parser.add_argument('--use-P2', dest='P2', help='Use P2 layer (more consuming) for training and testing in the FPN (only for resnet).', action='store_true')
-    parser.add_argument('--scale', help='list of the scale use in the network.', type=list_callbacks, default='2 ** 0, 2 ** (1.0 / 3.0), 2 ** (2.0 / 3.0)')
-    parser.add_argument('--ratio', help='list of the ratio use in the network.', type=list_callbacks, default='0.5, 1, 2')
+    parser.add_argument('--workers', help='Number of worker processes producing training batches (0 produces them in the training process).', type=int, default=0)
+    parser.add_argument('--prefetch', help='Number of training batches produced ahead by the workers (defaults to twice the number of workers). Every prefetched batch has a shared memory buffer sized for the largest possible batch.', type=int, default=None)
+    parser.add_argument('--use-multiprocessing', help='Let Keras produce batches in --workers processes, using the generator as a keras.utils.Sequence (instead of the shared memory batch producer).', action='store_true')
+    parser.add_argument('--fused-resize', help='Augment and resize images with a single affine warp, preprocessing the image after resizing.', action='store_true')
+    parser.add_argument('--image-cache-size', help='Memory budget in MB of the decoded image cache of the training and of the validation generator (defaults to 0, no cache). Every worker process has its own cache.', type=float, default=0)
+    parser.add_argument('--image-cache-resized', help='Resize images before they are stored in the image cache, so more images fit in the budget.', action='store_true')
+    parser.add_argument('--no-image-metadata-cache', help='Read the size of every image file instead of using the image metadata cache next to the dataset.', dest='image_metadata_cache', action='store_false')
+    parser.add_argument('--preprocess-in-model', help='Keep images as uint8 up to the model and subtract the mean / normalize them in the model (saved snapshots still expect preprocessed images).', action='store_true')
+    parser.add_argument('--eval-prefetch', help='Number of batches loaded ahead by a pool of threads in the per epoch evaluation.', type=int, default=0)
+    parser.add_argument('--eval-batch-size', help='Number of images per prediction in the per epoch evaluation.', type=int, default=1)
+    parser.add_argument('--pre-nms-top-k', help='Number of anchors with the highest score per pyramid level that the evaluation model decodes and filters (defaults to all anchors).', type=int, default=None)
+    parser.add_argument('--eval-n-jobs', help='Number of processes used to compute the average precisions of the per epoch evaluation.', type=int, default=1)
+    parser.add_argument('--sparse-assignment', help='Only compute IoU of anchor / annotation pairs that can overlap when assigning anchor targets (faster for images with many annotations).', action='store_true')
     return check_args(parser.parse_args(args))
 
 
@@ -493,13 +622,29 @@ def main(args=None):
     if args.steps is None:
         args.steps = int(round(train_generator.size()/args.batch_size))
         
+    # optionally feed uint8 images and preprocess them in the model
+    preprocessing = None
+    if args.preprocess_in_model:
+        preprocessing = {'mean': train_generator.mean, 'normalize': train_generator.normalize}
+
     # create the model
     if args.snapshot is not None:
         print('Loading model, this may take a second...')
         model            = models.load_model(args.snapshot, backbone_name=args.backbone)
         training_model   = model
         anchors_param = AnchorParameters(sizes=args.size, strides=args.stride, ratios=args.ratio, scales=args.scale)
-        prediction_model = retinanet_bbox(model=model, anchor_parameters=anchors_param, P2_layer=args.P2)
+        prediction_model = retinanet_bbox(model=model, anchor_parameters=anchors_param, P2_layer=args.P2, pre_nms_top_k=args.pre_nms_top_k)
+        if preprocessing:
+            # the wrapping model has to be compiled again (with a new optimizer state)
+            training_model   = retinanet_preprocessing(model, **preprocessing)
+            prediction_model = retinanet_preprocessing(prediction_model, **preprocessing)
+            training_model.compile(
+                loss={
+                    'regression'    : losses.smooth_l1(),
+                    'classification': losses.focal()
+                },
+                optimizer=optimizers(args)
+            )
     else:
         weights = args.weights
         # default to imagenet if nothing else is specified
@@ -515,18 +660,15 @@ def main(args=None):
             multi_gpu=args.multi_gpu,
             freeze_backbone=args.freeze_backbone,
             shape=(None, None, int(args.channels)),
-            opt=optimizers(args)
+            opt=optimizers(args),
+            preprocessing=preprocessing,
         )
 
     # print model summary
     model.summary()
 
     # this lets the generator compute backbone layer shapes using the actual backbone model
-    if 'vgg' in args.backbone or 'densenet' in args.backbone:
-        compute_anchor_targets = functools.partial(anchor_targets_bbox, shapes_callback=make_shapes_callback(model))
-        train_generator.compute_anchor_targets = compute_anchor_targets
-        if validation_generator is not None:
-            validation_generator.compute_anchor_targets = compute_anchor_targets
+    configure_anchor_targets([train_generator, validation_generator], args, model=model)
 
     # create the callbacks
     callbacks = create_callbacks(
@@ -539,30 +681,40 @@ def main(args=None):
     )
     #print(callbacks)
     print("remove mean :", args.mean, ' normalize :', args.norm, 'transform: ', args.random_transform, 'separate channels : ', args.tensorboxes_channels)
+    # optionally produce training batches in worker processes
+    if args.workers > 0 and not args.use_multiprocessing:
+        train_generator = MultiprocessGenerator(train_generator, workers=args.workers, prefetch=args.prefetch, seed=seed)
+
     # start training
-    if args.val_loss:
-        
-        training_model.fit_generator(
-            generator=train_generator,
-            steps_per_epoch=args.steps,
-            validation_data=validation_generator,
-            validation_steps= int(round(validation_generator.size()/args.batch_size)),
-            epochs=args.epochs,
-            verbose=1,
-            callbacks=callbacks
-            
-        )
-    else:
-        training_model.fit_generator(
-        generator=train_generator,
-        steps_per_epoch=args.steps,
-        #validation_data=validation_generator,
-        #validation_steps= int(round(validation_generator.size()/args.batch_size)),
-        epochs=args.epochs,
-        verbose=1,
-        callbacks=callbacks
-        
-    )
+    try:
+        if args.val_loss:
+            training_model.fit_generator(
+                generator=train_generator,
+                steps_per_epoch=args.steps,
+                validation_data=validation_generator,
+                validation_steps= int(round(validation_generator.size()/args.batch_size)),
+                epochs=args.epochs,
+                verbose=1,
+                callbacks=callbacks,
+                workers=args.workers if args.use_multiprocessing else 1,
+                use_multiprocessing=args.use_multiprocessing,
+            )
+        else:
+            training_model.fit_generator(
+                generator=train_generator,
+                steps_per_epoch=args.steps,
+                #validation_data=validation_generator,
+                #validation_steps= int(round(validation_generator.size()/args.batch_size)),
+                epochs=args.epochs,
+                verbose=1,
+                callbacks=callbacks,
+                workers=args.workers if args.use_multiprocessing else 1,
+                use_multiprocessing=args.use_multiprocessing,
+            )
+    finally:
+        # stop the batch producing worker processes
+        if isinstance(train_generator, MultiprocessGenerator):
+            train_generator.close()
 
 
 if __name__ == '__main__':
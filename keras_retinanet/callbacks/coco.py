@@ -19,10 +19,12 @@ from ..utils.coco_eval import evaluate_coco
 
 
 class CocoEval(keras.callbacks.Callback):
-    def __init__(self, generator, tensorboard=None, threshold=0.05):
+    def __init__(self, generator, tensorboard=None, threshold=0.05, batch_size=1, prefetch=0):
         self.generator = generator
         self.threshold = threshold
         self.tensorboard = tensorboard
+        self.batch_size = batch_size
+        self.prefetch = prefetch
 
         super(CocoEval, self).__init__()
 
@@ -41,7 +43,7 @@ class CocoEval(keras.callbacks.Callback):
                     'AR @[ IoU=0.50:0.95 | area= small | maxDets=100 ]',
                     'AR @[ IoU=0.50:0.95 | area=medium | maxDets=100 ]',
                     'AR @[ IoU=0.50:0.95 | area= large | maxDets=100 ]']
-        coco_eval_stats = evaluate_coco(self.generator, self.model, self.threshold)
+        coco_eval_stats = evaluate_coco(self.generator, self.model, self.threshold, batch_size=self.batch_size, prefetch=self.prefetch)
         if coco_eval_stats is not None and self.tensorboard is not None and self.tensorboard.writer is not None:
             import tensorflow as tf
             summary = tf.Summary()
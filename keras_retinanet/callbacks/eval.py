@@ -19,7 +19,7 @@ from ..utils.eval import evaluate
 
 
 class Evaluate(keras.callbacks.Callback):
-    def __init__(self, generator, iou_threshold=0.5, score_threshold=0.05, max_detections=100, save_path=None, tensorboard=None, verbose=1, tensorboard_image=None, number_images=0, separate_channels=False):
+    def __init__(self, generator, iou_threshold=0.5, score_threshold=0.05, max_detections=100, save_path=None, tensorboard=None, verbose=1, tensorboard_image=None, number_images=0, separate_channels=False, n_jobs=1, batch_size=1, prefetch=0):
         """ Evaluate a given dataset using a given model at the end of every epoch during training.
 
         # Arguments
@@ -30,6 +30,9 @@ class Evaluate(keras.callbacks.Callback):
             save_path       : The path to save images with visualized detections to.
             tensorboard     : Instance of keras.callbacks.TensorBoard used to log the mAP value.
             verbose         : Set the verbosity level, by default this is set to 1.
+            n_jobs          : Number of processes used to compute the average precisions.
+            batch_size      : Number of images per prediction.
+            prefetch        : Number of batches loaded ahead by a pool of threads, while the model runs.
         """
         self.generator       = generator
         self.iou_threshold   = iou_threshold
@@ -41,6 +44,9 @@ class Evaluate(keras.callbacks.Callback):
         self.tensorboard_image= tensorboard_image
         self.number_images = number_images
         self.separate_channels = separate_channels
+        self.n_jobs            = n_jobs
+        self.batch_size        = batch_size
+        self.prefetch          = prefetch
         super(Evaluate, self).__init__()
 
     def on_epoch_end(self, epoch, logs=None):
@@ -57,7 +63,10 @@ class Evaluate(keras.callbacks.Callback):
             writer=self.tensorboard_image,
             steps=epoch,
             number= self.number_images,
-            separate_channels=self.separate_channels
+            separate_channels=self.separate_channels,
+            n_jobs=self.n_jobs,
+            batch_size=self.batch_size,
+            prefetch=self.prefetch,
         )
 
         self.mean_ap = sum(average_precisions.values()) / len(average_precisions)
@@ -76,3 +85,7 @@ class Evaluate(keras.callbacks.Callback):
             for label, average_precision in average_precisions.items():
                 print(self.generator.label_to_name(label), '{:.4f}'.format(average_precision))
             print('mAP: {:.4f}'.format(self.mean_ap))
+
+            image_cache_info = self.generator.image_cache_info()
+            if image_cache_info is not None:
+                print('image cache: {size} images, {bytes} bytes, hit rate {hit_rate:.2f}'.format(**image_cache_info))
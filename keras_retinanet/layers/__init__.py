@@ -1,2 +1,2 @@
-from ._misc import RegressBoxes, UpsampleLike, Anchors, ClipBoxes  # noqa: F401
+from ._misc import RegressBoxes, UpsampleLike, Anchors, ClipBoxes, PreprocessImage, SelectTopCandidates  # noqa: F401
 from .filter_detections import FilterDetections  # noqa: F401
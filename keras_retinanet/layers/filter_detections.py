@@ -18,17 +18,52 @@ import keras
 from .. import backend
 
 
-def filter_detections(boxes, classification, other=[], nms=True, score_threshold=0.05, max_detections=300, nms_threshold=0.5):
+def _separate_groups(boxes, groups, num_groups, span):
+    """ Shift the boxes of every group by a different offset, so that boxes of different groups never overlap.
+
+    A single NMS over the shifted boxes then gives the same result as one NMS per group. The groups are laid out on
+    a grid instead of a line, which keeps the shifted coordinates small enough for float32 to represent them precisely.
+
+    Args
+        boxes      : Tensor of shape (num_boxes, 4) containing the boxes in (x1, y1, x2, y2) format.
+        groups     : Tensor of shape (num_boxes,) with the (int64) group of every box.
+        num_groups : Total number of groups.
+        span       : Upper bound on the range (maximum minus minimum) of all coordinates, plus one.
+
+    Returns
+        The shifted boxes.
+    """
+    columns = keras.backend.cast(keras.backend.sqrt(keras.backend.cast(num_groups, keras.backend.floatx())), 'int64') + 1
+    x       = keras.backend.cast(groups % columns, keras.backend.dtype(boxes)) * span
+    y       = keras.backend.cast(groups // columns, keras.backend.dtype(boxes)) * span
+    return boxes + keras.backend.stack([x, y, x, y], axis=1)
+
+
+def filter_detections(
+    boxes,
+    classification,
+    other                 = [],
+    class_specific_filter = True,
+    batched_nms           = False,
+    nms                   = True,
+    score_threshold       = 0.05,
+    max_detections        = 300,
+    nms_threshold         = 0.5
+):
     """ Filter detections using the boxes and classification values.
 
     Args
-        boxes           : Tensor of shape (num_boxes, 4) containing the boxes in (x1, y1, x2, y2) format.
-        classification  : Tensor of shape (num_boxes, num_classes) containing the classification scores.
-        other           : List of tensors of shape (num_boxes, ...) to filter along with the boxes and classification scores.
-        nms             : Flag to enable/disable non maximum suppression.
-        score_threshold : Threshold used to prefilter the boxes with.
-        max_detections  : Maximum number of detections to keep.
-        nms_threshold   : Threshold for the IoU value to determine when a box should be suppressed.
+        boxes                 : Tensor of shape (num_boxes, 4) containing the boxes in (x1, y1, x2, y2) format.
+        classification        : Tensor of shape (num_boxes, num_classes) containing the classification scores.
+        other                 : List of tensors of shape (num_boxes, ...) to filter along with the boxes and classification scores.
+        class_specific_filter : Whether to perform filtering per class, or take the best scoring class and filter those.
+        batched_nms           : Whether to perform the per class filtering with a single NMS operation, instead of one per class.
+                                The boxes of every class are shifted by a different offset so that boxes of different classes
+                                never overlap, which gives the same result as NMS per class. Only used if class_specific_filter is True.
+        nms                   : Flag to enable/disable non maximum suppression.
+        score_threshold       : Threshold used to prefilter the boxes with.
+        max_detections        : Maximum number of detections to keep.
+        nms_threshold         : Threshold for the IoU value to determine when a box should be suppressed.
 
     Returns
         A list of [boxes, scores, labels, other[0], other[1], ...].
@@ -38,12 +73,7 @@ def filter_detections(boxes, classification, other=[], nms=True, score_threshold
         other[i] is shaped (max_detections, ...) and contains the filtered other[i] data.
         In case there are less than max_detections detections, the tensors are padded with -1's.
     """
-    all_indices = []
-
-    # perform per class filtering
-    for c in range(int(classification.shape[1])):
-        scores = classification[:, c]
-
+    def _filter_detections(scores, labels):
         # threshold based on score
         indices = backend.where(keras.backend.greater(scores, score_threshold))
 
@@ -58,12 +88,52 @@ def filter_detections(boxes, classification, other=[], nms=True, score_threshold
             indices = keras.backend.gather(indices, nms_indices)
 
         # add indices to list of all indices
-        labels  = c * keras.backend.ones((keras.backend.shape(indices)[0],), dtype='int64')
+        labels  = backend.gather_nd(labels, indices)
         indices = keras.backend.stack([indices[:, 0], labels], axis=1)
-        all_indices.append(indices)
 
-    # concatenate indices to single tensor
-    indices = keras.backend.concatenate(all_indices, axis=0)
+        return indices
+
+    def _batched_filter_detections():
+        # threshold the scores of all classes at once, flat index = box index * num_classes + label
+        num_classes = int(classification.shape[1])
+        scores      = keras.backend.reshape(classification, (-1,))
+        indices     = backend.where(keras.backend.greater(scores, score_threshold))[:, 0]
+        box_indices = indices // num_classes
+        labels      = indices % num_classes
+
+        if nms:
+            filtered_boxes  = keras.backend.gather(boxes, box_indices)
+            filtered_scores = keras.backend.gather(scores, indices)
+
+            # shift the boxes of every class by a different offset, so boxes of different classes never overlap
+            filtered_boxes = _separate_groups(filtered_boxes, labels, num_classes, keras.backend.max(boxes) - keras.backend.min(boxes) + 1)
+
+            # perform NMS for all classes at once
+            nms_indices = backend.non_max_suppression(filtered_boxes, filtered_scores, max_output_size=max_detections, iou_threshold=nms_threshold)
+
+            # filter indices based on NMS
+            box_indices = keras.backend.gather(box_indices, nms_indices)
+            labels      = keras.backend.gather(labels, nms_indices)
+
+        return keras.backend.stack([box_indices, labels], axis=1)
+
+    if class_specific_filter and batched_nms:
+        indices = _batched_filter_detections()
+    elif class_specific_filter:
+        all_indices = []
+
+        # perform per class filtering
+        for c in range(int(classification.shape[1])):
+            scores = classification[:, c]
+            labels = c * keras.backend.ones((keras.backend.shape(scores)[0],), dtype='int64')
+            all_indices.append(_filter_detections(scores, labels))
+
+        # concatenate indices to single tensor
+        indices = keras.backend.concatenate(all_indices, axis=0)
+    else:
+        scores  = keras.backend.max(classification, axis=1)
+        labels  = keras.backend.argmax(classification, axis=1)
+        indices = _filter_detections(scores, labels)
 
     # select top k
     scores              = backend.gather_nd(classification, indices)
@@ -94,30 +164,151 @@ def filter_detections(boxes, classification, other=[], nms=True, score_threshold
     return [boxes, scores, labels] + other_
 
 
+def filter_detections_batch(
+    boxes,
+    classification,
+    other                 = [],
+    class_specific_filter = True,
+    nms                   = True,
+    score_threshold       = 0.05,
+    max_detections        = 300,
+    nms_threshold         = 0.5
+):
+    """ Filter the detections of a whole batch at once, using the boxes and classification values.
+
+    Instead of filtering every image separately, the scores of all images (and classes) are thresholded at once and a
+    single NMS runs over all candidates, with the boxes of every image and class shifted apart (see _separate_groups).
+    The best max_detections detections of every image are then scattered into the padded outputs.
+    This gives the same detections as filter_detections applied to every image.
+
+    Args
+        boxes                 : Tensor of shape (batch_size, num_boxes, 4) containing the boxes in (x1, y1, x2, y2) format.
+        classification        : Tensor of shape (batch_size, num_boxes, num_classes) containing the classification scores.
+        other                 : List of tensors of shape (batch_size, num_boxes, ...) to filter along with the boxes and classification scores.
+        class_specific_filter : Whether to perform filtering per class, or take the best scoring class and filter those.
+        nms                   : Flag to enable/disable non maximum suppression.
+        score_threshold       : Threshold used to prefilter the boxes with.
+        max_detections        : Maximum number of detections to keep per image.
+        nms_threshold         : Threshold for the IoU value to determine when a box should be suppressed.
+
+    Returns
+        A list of [boxes, scores, labels, other[0], other[1], ...], like filter_detections with an extra batch dimension.
+    """
+    batch_size  = keras.backend.shape(classification)[0]
+    num_boxes   = keras.backend.cast(keras.backend.shape(classification)[1], 'int64')
+    num_classes = int(classification.shape[2])
+
+    # threshold based on score, box index = image index * num_boxes + box index in the image
+    if class_specific_filter:
+        scores      = keras.backend.reshape(classification, (-1,))
+        indices     = backend.where(keras.backend.greater(scores, score_threshold))[:, 0]
+        box_indices = indices // num_classes
+        labels      = indices % num_classes
+    else:
+        scores      = keras.backend.reshape(keras.backend.max(classification, axis=2), (-1,))
+        indices     = backend.where(keras.backend.greater(scores, score_threshold))[:, 0]
+        box_indices = indices
+        labels      = keras.backend.gather(keras.backend.reshape(keras.backend.argmax(classification, axis=2), (-1,)), indices)
+
+    scores        = keras.backend.gather(scores, indices)
+    batch_indices = box_indices // num_boxes
+    flat_boxes    = keras.backend.reshape(boxes, (-1, 4))
+
+    if nms:
+        # perform NMS per image (and class) in a single operation
+        if class_specific_filter:
+            groups, num_groups = batch_indices * num_classes + labels, batch_size * num_classes
+        else:
+            groups, num_groups = batch_indices, batch_size
+
+        filtered_boxes = keras.backend.gather(flat_boxes, box_indices)
+        filtered_boxes = _separate_groups(filtered_boxes, groups, num_groups, keras.backend.max(boxes) - keras.backend.min(boxes) + 1)
+        nms_indices    = backend.non_max_suppression(filtered_boxes, scores, max_output_size=keras.backend.shape(scores)[0], iou_threshold=nms_threshold)
+
+        # filter indices based on NMS
+        box_indices   = keras.backend.gather(box_indices, nms_indices)
+        labels        = keras.backend.gather(labels, nms_indices)
+        scores        = keras.backend.gather(scores, nms_indices)
+        batch_indices = keras.backend.gather(batch_indices, nms_indices)
+
+    # sort by score
+    scores, order = backend.top_k(scores, k=keras.backend.shape(scores)[0])
+    box_indices   = keras.backend.gather(box_indices, order)
+    labels        = keras.backend.gather(labels, order)
+    batch_indices = keras.backend.gather(batch_indices, order)
+
+    # rank of every detection within its image, keep the top max_detections of every image
+    images  = keras.backend.one_hot(batch_indices, batch_size)
+    ranks   = keras.backend.cast(keras.backend.sum(keras.backend.cumsum(images, axis=0) * images, axis=1), 'int64') - 1
+    keep    = backend.where(keras.backend.less(ranks, max_detections))[:, 0]
+
+    box_indices   = keras.backend.gather(box_indices, keep)
+    labels        = keras.backend.gather(labels, keep)
+    scores        = keras.backend.gather(scores, keep)
+    positions     = keras.backend.stack([keras.backend.gather(batch_indices, keep), keras.backend.gather(ranks, keep)], axis=1)
+
+    # slots[image, rank] is 1 + the index of the detection at that position, or 0 if there is no detection
+    num_kept = keras.backend.shape(keep)[0]
+    slots    = backend.scatter_nd(
+        positions,
+        keras.backend.cast(backend.range(num_kept), 'int64') + 1,
+        keras.backend.cast(keras.backend.stack([batch_size, max_detections]), 'int64'),
+    )
+
+    # gather the detections into the outputs, index 0 is the padding (-1) value
+    def _gather(values, shape):
+        values = backend.pad(values, [[1, 0]] + [[0, 0] for _ in shape], constant_values=-1)
+        values = keras.backend.gather(values, slots)
+        values.set_shape([None, max_detections] + shape)
+        return values
+
+    other_shapes = [list(keras.backend.int_shape(o)[2:]) for o in other]
+
+    boxes  = _gather(keras.backend.gather(flat_boxes, box_indices), [4])
+    scores = _gather(scores, [])
+    labels = keras.backend.cast(_gather(labels, []), 'int32')
+    other_ = [_gather(keras.backend.gather(keras.backend.reshape(o, [-1] + s), box_indices), s) for o, s in zip(other, other_shapes)]
+
+    return [boxes, scores, labels] + other_
+
+
 class FilterDetections(keras.layers.Layer):
     def __init__(
         self,
-        nms                 = True,
-        nms_threshold       = 0.5,
-        score_threshold     = 0.05,
-        max_detections      = 300,
-        parallel_iterations = 32,
+        nms                   = True,
+        class_specific_filter = True,
+        batched_nms           = False,
+        nms_threshold         = 0.5,
+        score_threshold       = 0.05,
+        max_detections        = 300,
+        parallel_iterations   = 32,
+        vectorized            = False,
         **kwargs
     ):
         """ Filters detections using score threshold, NMS and selecting the top-k detections.
 
         Args
-            nms                 : Flag to enable/disable NMS.
-            nms_threshold       : Threshold for the IoU value to determine when a box should be suppressed.
-            score_threshold     : Threshold used to prefilter the boxes with.
-            max_detections      : Maximum number of detections to keep.
-            parallel_iterations : Number of batch items to process in parallel.
+            nms                   : Flag to enable/disable NMS.
+            class_specific_filter : Whether to perform filtering per class, or take the best scoring class and filter those.
+            batched_nms           : Whether to perform the per class filtering with a single NMS operation for all classes,
+                                    instead of one NMS operation per class. Both give the same detections, but the graph size
+                                    and latency of the per class filtering grow with the number of classes.
+            nms_threshold         : Threshold for the IoU value to determine when a box should be suppressed.
+            score_threshold       : Threshold used to prefilter the boxes with.
+            max_detections        : Maximum number of detections to keep.
+            parallel_iterations   : Number of batch items to process in parallel.
+            vectorized            : Whether to filter all images of the batch at once (see filter_detections_batch),
+                                    instead of one image at a time with map_fn. This is faster with large batches,
+                                    especially on CPU. The class specific NMS is always performed in a single operation.
         """
-        self.nms                 = nms
-        self.nms_threshold       = nms_threshold
-        self.score_threshold     = score_threshold
-        self.max_detections      = max_detections
-        self.parallel_iterations = parallel_iterations
+        self.nms                   = nms
+        self.class_specific_filter = class_specific_filter
+        self.batched_nms           = batched_nms
+        self.nms_threshold         = nms_threshold
+        self.score_threshold       = score_threshold
+        self.max_detections        = max_detections
+        self.parallel_iterations   = parallel_iterations
+        self.vectorized            = vectorized
         super(FilterDetections, self).__init__(**kwargs)
 
     def call(self, inputs, **kwargs):
@@ -130,6 +321,18 @@ class FilterDetections(keras.layers.Layer):
         classification = inputs[1]
         other          = inputs[2:]
 
+        if self.vectorized:
+            return filter_detections_batch(
+                boxes,
+                classification,
+                other,
+                nms=self.nms,
+                class_specific_filter=self.class_specific_filter,
+                score_threshold=self.score_threshold,
+                max_detections=self.max_detections,
+                nms_threshold=self.nms_threshold,
+            )
+
         # wrap nms with our parameters
         def _filter_detections(args):
             boxes          = args[0]
@@ -141,6 +344,8 @@ class FilterDetections(keras.layers.Layer):
                 classification,
                 other,
                 nms=self.nms,
+                class_specific_filter=self.class_specific_filter,
+                batched_nms=self.batched_nms,
                 score_threshold=self.score_threshold,
                 max_detections=self.max_detections,
                 nms_threshold=self.nms_threshold,
@@ -187,11 +392,14 @@ class FilterDetections(keras.layers.Layer):
         """
         config = super(FilterDetections, self).get_config()
         config.update({
-            'nms'                 : self.nms,
-            'nms_threshold'       : self.nms_threshold,
-            'score_threshold'     : self.score_threshold,
-            'max_detections'      : self.max_detections,
-            'parallel_iterations' : self.parallel_iterations,
+            'nms'                   : self.nms,
+            'class_specific_filter' : self.class_specific_filter,
+            'batched_nms'           : self.batched_nms,
+            'nms_threshold'         : self.nms_threshold,
+            'score_threshold'       : self.score_threshold,
+            'max_detections'        : self.max_detections,
+            'parallel_iterations'   : self.parallel_iterations,
+            'vectorized'            : self.vectorized,
         })
 
         return config
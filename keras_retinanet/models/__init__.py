@@ -7,14 +7,16 @@ class Backbone(object):
         from .. import losses
         from .. import initializers
         self.custom_objects = {
-            'UpsampleLike'     : layers.UpsampleLike,
-            'PriorProbability' : initializers.PriorProbability,
-            'RegressBoxes'     : layers.RegressBoxes,
-            'FilterDetections' : layers.FilterDetections,
-            'Anchors'          : layers.Anchors,
-            'ClipBoxes'        : layers.ClipBoxes,
-            '_smooth_l1'       : losses.smooth_l1(),
-            '_focal'           : losses.focal(),
+            'UpsampleLike'        : layers.UpsampleLike,
+            'PriorProbability'    : initializers.PriorProbability,
+            'RegressBoxes'        : layers.RegressBoxes,
+            'FilterDetections'    : layers.FilterDetections,
+            'Anchors'             : layers.Anchors,
+            'ClipBoxes'           : layers.ClipBoxes,
+            'PreprocessImage'     : layers.PreprocessImage,
+            'SelectTopCandidates' : layers.SelectTopCandidates,
+            '_smooth_l1'          : losses.smooth_l1(),
+            '_focal'              : losses.focal(),
         }
 
         self.backbone = backbone
@@ -54,7 +56,7 @@ def backbone(backbone_name, P2=False):
     return b(backbone_name)
 
 
-def load_model(filepath, backbone_name='resnet50', convert=False, nms=True, P2_layer=None, sizes=None, strides=None, ratios=None, scales=None):
+def load_model(filepath, backbone_name='resnet50', convert=False, nms=True, class_specific_filter=True, batched_nms=False, pre_nms_top_k=None, vectorized_filter=False, P2_layer=None, sizes=None, strides=None, ratios=None, scales=None):
     """ Loads a retinanet model using the correct custom objects.
 
     # Arguments
@@ -64,6 +66,10 @@ def load_model(filepath, backbone_name='resnet50', convert=False, nms=True, P2_l
         backbone_name: Backbone with which the model was trained.
         convert: Boolean, whether to convert the model to an inference model.
         nms: Boolean, whether to add NMS filtering to the converted model. Only valid if convert=True.
+        class_specific_filter: Whether to use class specific filtering or filter for the best scoring class only.
+        batched_nms: Boolean, whether to perform the class specific NMS in a single operation for all classes. Only valid if convert=True.
+        pre_nms_top_k: Number of anchors with the highest score per pyramid level to decode and filter, None to use all anchors. Only valid if convert=True.
+        vectorized_filter: Boolean, whether to filter the detections of all images in a batch at once instead of one image at a time. Only valid if convert=True.
 
     # Returns
         A keras.models.Model object.
@@ -79,8 +85,8 @@ def load_model(filepath, backbone_name='resnet50', convert=False, nms=True, P2_l
         from .retinanet import retinanet_bbox, AnchorParameters
         if P2_layer is not None:
             anchors_param = AnchorParameters(sizes=sizes, strides=strides, ratios=ratios, scales=scales)
-            model = retinanet_bbox(model=model, nms=nms, anchor_parameters=anchors_param, P2_layer=P2_layer)
+            model = retinanet_bbox(model=model, nms=nms, class_specific_filter=class_specific_filter, batched_nms=batched_nms, pre_nms_top_k=pre_nms_top_k, vectorized_filter=vectorized_filter, anchor_parameters=anchors_param, P2_layer=P2_layer)
         else:
-            model = retinanet_bbox(model=model, nms=nms)
+            model = retinanet_bbox(model=model, nms=nms, class_specific_filter=class_specific_filter, batched_nms=batched_nms, pre_nms_top_k=pre_nms_top_k, vectorized_filter=vectorized_filter)
 
     return model
@@ -234,12 +234,13 @@ def __build_pyramid(models, features):
     return [__build_model_pyramid(n, m, features) for n, m in models]
 
 
-def __build_anchors(anchor_parameters, features):
+def __build_anchors(anchor_parameters, features, concatenate=True):
     """ Builds anchors for the shape of the features from FPN.
 
     Args
         anchor_parameters : Parameteres that determine how anchors are generated.
         features          : The FPN features.
+        concatenate       : If False, a list with the anchors of every pyramid level is returned instead.
 
     Returns
         A tensor containing the anchors for the FPN features.
@@ -259,6 +260,9 @@ def __build_anchors(anchor_parameters, features):
         )(f) for i, f in enumerate(features)
     ]
 
+    if not concatenate:
+        return anchors
+
     return keras.layers.Concatenate(axis=1, name='anchors')(anchors)
 
 
@@ -313,11 +317,15 @@ def retinanet(
 
 
 def retinanet_bbox(
-    model             = None,
-    anchor_parameters = None,
-    nms               = True,
-    name              = 'retinanet-bbox',
-    P2_layer          = False,
+    model                 = None,
+    anchor_parameters     = None,
+    nms                   = True,
+    class_specific_filter = True,
+    batched_nms           = False,
+    pre_nms_top_k         = None,
+    vectorized_filter     = False,
+    name                  = 'retinanet-bbox',
+    P2_layer              = False,
     **kwargs
 ):
     """ Construct a RetinaNet model on top of a backbone and adds convenience functions to output boxes directly.
@@ -327,9 +335,15 @@ def retinanet_bbox(
 
     Args
         model             : RetinaNet model to append bbox layers to. If None, it will create a RetinaNet model using **kwargs.
-        anchor_parameters : Struct containing configuration for anchor generation (sizes, strides, ratios, scales).
-        name              : Name of the model.
-        *kwargs           : Additional kwargs to pass to the minimal retinanet model.
+        anchor_parameters     : Struct containing configuration for anchor generation (sizes, strides, ratios, scales).
+        nms                   : Whether to use non-maximum suppression for the filtering step.
+        class_specific_filter : Whether to use class specific filtering or filter for the best scoring class only.
+        batched_nms           : Whether to perform the class specific NMS in a single operation (see layers.FilterDetections).
+        pre_nms_top_k         : If set, only the pre_nms_top_k anchors with the highest score of every pyramid level are decoded
+                                and filtered (1000 in the RetinaNet paper), see layers.SelectTopCandidates.
+        vectorized_filter     : Whether to filter the detections of all images in a batch at once (see layers.FilterDetections).
+        name                  : Name of the model.
+        *kwargs               : Additional kwargs to pass to the minimal retinanet model.
 
     Returns
         A keras.models.Model which takes an image as input and outputs the detections on the image.
@@ -352,7 +366,7 @@ def retinanet_bbox(
         features = [model.get_layer(p_name).output for p_name in ['P2', 'P3', 'P4', 'P5', 'P6', 'P7']]
     else:
         features = [model.get_layer(p_name).output for p_name in ['P3', 'P4', 'P5', 'P6', 'P7']]
-    anchors  = __build_anchors(anchor_parameters, features)
+    anchors  = __build_anchors(anchor_parameters, features, concatenate=not pre_nms_top_k)
 
     # we expect the anchors, regression and classification values as first output
     regression     = model.outputs[0]
@@ -361,14 +375,66 @@ def retinanet_bbox(
     # "other" can be any additional output from custom submodels, by default this will be []
     other = model.outputs[2:]
 
+    # only keep the top scoring anchors of every level, so decoding and NMS process fewer boxes
+    if pre_nms_top_k:
+        candidates     = layers.SelectTopCandidates(k=pre_nms_top_k, num_levels=len(features), name='top_candidates')(anchors + [regression, classification] + other)
+        anchors        = candidates[0]
+        regression     = candidates[1]
+        classification = candidates[2]
+        other          = candidates[3:]
+
     # apply predicted regression to anchors
     boxes = layers.RegressBoxes(name='boxes')([anchors, regression])
     boxes = layers.ClipBoxes(name='clipped_boxes')([model.inputs[0], boxes])
 
     # filter detections (apply NMS / score threshold / select top-k)
-    detections = layers.FilterDetections(nms=nms, name='filtered_detections')([boxes, classification] + other)
+    detections = layers.FilterDetections(
+        nms                   = nms,
+        class_specific_filter = class_specific_filter,
+        batched_nms           = batched_nms,
+        vectorized            = vectorized_filter,
+        name                  = 'filtered_detections'
+    )([boxes, classification] + other)
 
     outputs = detections
 
     # construct the model
     return keras.models.Model(inputs=model.inputs, outputs=outputs, name=name)
+
+
+def retinanet_preprocessing(
+    model,
+    mean      = True,
+    normalize = 0,
+    dtype     = 'uint8',
+    name      = None,
+):
+    """ Prepend an image preprocessing layer to a model, so that it takes unprocessed images as input.
+
+    The preprocessing (mean subtraction and normalization) is identical to utils.image.preprocess_image,
+    which lets the generators keep images as uint8 all the way to the model (see Generator's preprocess_in_model).
+
+    The model is used as nested model, so weights are shared with (and should be saved from) the original model.
+    If the output names of the model are unique, they are kept so that losses can still be assigned by name.
+
+    Args
+        model     : The model (retinanet or retinanet_bbox) to prepend the preprocessing to.
+        mean      : Subtract the ImageNet mean from the images.
+        normalize : Normalization of the images, see layers.PreprocessImage.
+        dtype     : The dtype of the images fed to the model.
+        name      : Name of the model, defaults to the name of the original model.
+
+    Returns
+        A keras.models.Model which takes (uint8) images as input and has the same outputs as the original model.
+    """
+    inputs  = keras.layers.Input(shape=keras.backend.int_shape(model.inputs[0])[1:], dtype=dtype, name='image')
+    image   = layers.PreprocessImage(mean=mean, normalize=normalize, name='preprocess_image')(inputs)
+    outputs = model(image)
+    if not isinstance(outputs, list):
+        outputs = [outputs]
+
+    # identity layers that restore the output names of the nested model
+    if len(set(model.output_names)) == len(model.output_names):
+        outputs = [keras.layers.Activation('linear', name=n)(o) for n, o in zip(model.output_names, outputs)]
+
+    return keras.models.Model(inputs=inputs, outputs=outputs, name=name or model.name)
@@ -0,0 +1,79 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+
+class AnnotationStore(object):
+    """ Columnar storage for the annotations of a whole dataset.
+
+    All boxes are stored in one contiguous (N, 4) float64 array and all labels in one (N,) int32 array.
+    The annotations of image i are the rows offsets[i]:offsets[i + 1], so a lookup is a slice (36 bytes per box).
+    Boxes keep float64 precision, since some datasets (for example KITTI) have fractional coordinates.
+
+    Args
+        boxes   : Array of shape (N, 4) with the (x1, y1, x2, y2) of every annotation in the dataset.
+        labels  : Array of shape (N,) with the label of every annotation.
+        offsets : Array of shape (num_images + 1,) with the index of the first annotation of every image.
+    """
+    def __init__(self, boxes, labels, offsets):
+        self.boxes   = np.ascontiguousarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.labels  = np.ascontiguousarray(labels, dtype=np.int32).reshape(-1)
+        self.offsets = np.ascontiguousarray(offsets, dtype=np.int64).reshape(-1)
+
+        if self.boxes.shape[0] != self.labels.shape[0]:
+            raise ValueError('Expected the same number of boxes and labels, received {} and {}.'.format(self.boxes.shape[0], self.labels.shape[0]))
+        if self.offsets[0] != 0 or self.offsets[-1] != self.boxes.shape[0]:
+            raise ValueError('Invalid annotation offsets, expected them to span 0 to {}.'.format(self.boxes.shape[0]))
+
+    @classmethod
+    def from_lists(cls, annotations):
+        """ Create a store from a list (one entry per image) of lists of (x1, y1, x2, y2, label) tuples. """
+        counts  = [len(image_annotations) for image_annotations in annotations]
+        data    = np.array([a for image_annotations in annotations for a in image_annotations], dtype=np.float64).reshape(-1, 5)
+        offsets = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+        return cls(data[:, :4], data[:, 4], offsets)
+
+    @classmethod
+    def from_dicts(cls, image_data, image_names, classes):
+        """ Create a store from parsed CSV annotations.
+
+        Args
+            image_data  : Dict of image name to a list of annotation dicts with keys 'x1', 'y1', 'x2', 'y2' and 'class'.
+            image_names : Image names in the order of the store.
+            classes     : Dict of class name to label.
+        """
+        return cls.from_lists([
+            [(a['x1'], a['y1'], a['x2'], a['y2'], classes[a['class']]) for a in image_data[name]] for name in image_names
+        ])
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    def num_annotations(self, image_index):
+        return int(self.offsets[image_index + 1] - self.offsets[image_index])
+
+    def __getitem__(self, image_index):
+        """ Returns the annotations of an image as a new (n, 5) array of (x1, y1, x2, y2, label).
+
+        A new array is returned since the generators modify annotations in place during preprocessing.
+        """
+        start, end = self.offsets[image_index], self.offsets[image_index + 1]
+
+        result = np.empty((end - start, 5))
+        result[:, :4] = self.boxes[start:end]
+        result[:, 4]  = self.labels[start:end]
+        return result
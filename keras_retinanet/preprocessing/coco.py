@@ -34,6 +34,9 @@ class CocoGenerator(Generator):
 
         super(CocoGenerator, self).__init__(**kwargs)
 
+    def dataset_files(self):
+        return [os.path.join(self.data_dir, 'annotations', 'instances_' + self.set_name + '.json')]
+
     def load_classes(self):
         # load class names (name -> label)
         categories = self.coco.loadCats(self.coco.getCatIds())
@@ -15,10 +15,11 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+from . import csv_index
+from .annotation_store import AnnotationStore
 from .generator import Generator
 from ..utils.image import read_image_bgr
 
-import numpy as np
 from PIL import Image
 from six import raise_from
 
@@ -114,11 +115,20 @@ class CSVGenerator(Generator):
         csv_data_file,
         csv_class_file,
         base_dir=None,
+        index_cache=True,
         **kwargs
     ):
-        self.image_names = []
-        self.image_data  = {}
-        self.base_dir    = base_dir
+        """ Initialize a CSV data generator.
+
+        Args
+            csv_data_file  : Path to the CSV annotations file.
+            csv_class_file : Path to the CSV classes file.
+            base_dir       : Directory w.r.t. where the files are to be searched (defaults to the directory containing the csv_data_file).
+            index_cache    : Load the annotations from a compiled index next to the CSV file (created on first use) instead of parsing the CSV.
+        """
+        self.image_names   = []
+        self.base_dir      = base_dir
+        self.csv_data_file = csv_data_file
 
         # Take base_dir from annotations file if not explicitly specified.
         if self.base_dir is None:
@@ -135,13 +145,21 @@ class CSVGenerator(Generator):
         for key, value in self.classes.items():
             self.labels[value] = key
 
-        # csv with img_path, x1, y1, x2, y2, class_name
-        try:
-            with _open_for_csv(csv_data_file) as file:
-                self.image_data = _read_annotations(csv.reader(file, delimiter=','), self.classes)
-        except ValueError as e:
-            raise_from(ValueError('invalid CSV annotations file: {}: {}'.format(csv_data_file, e)), None)
-        self.image_names = list(self.image_data.keys())
+        index = csv_index.load_index(csv_data_file, csv_class_file) if index_cache else None
+        if index is not None:
+            self.image_names, self.annotation_store, _ = index
+        else:
+            # csv with img_path, x1, y1, x2, y2, class_name
+            try:
+                with _open_for_csv(csv_data_file) as file:
+                    image_data = _read_annotations(csv.reader(file, delimiter=','), self.classes)
+            except ValueError as e:
+                raise_from(ValueError('invalid CSV annotations file: {}: {}'.format(csv_data_file, e)), None)
+            self.image_names      = list(image_data.keys())
+            self.annotation_store = AnnotationStore.from_dicts(image_data, self.image_names, self.classes)
+
+            if index_cache:
+                csv_index.save_index(csv_data_file, csv_class_file, self.image_names, self.annotation_store)
 
         super(CSVGenerator, self).__init__(**kwargs)
 
@@ -160,6 +178,12 @@ class CSVGenerator(Generator):
     def image_path(self, image_index):
         return os.path.join(self.base_dir, self.image_names[image_index])
 
+    def image_paths(self):
+        return [self.image_path(i) for i in range(self.size())]
+
+    def image_metadata_cache_path(self):
+        return self.csv_data_file + '.image_metadata.npz'
+
     def image_aspect_ratio(self, image_index):
         # PIL is fast for metadata
         image = Image.open(self.image_path(image_index))
@@ -169,16 +193,4 @@ class CSVGenerator(Generator):
         return read_image_bgr(self.image_path(image_index))
 
     def load_annotations(self, image_index):
-        path   = self.image_names[image_index]
-        annots = self.image_data[path]
-        boxes  = np.zeros((len(annots), 5))
-
-        for idx, annot in enumerate(annots):
-            class_name = annot['class']
-            boxes[idx, 0] = float(annot['x1'])
-            boxes[idx, 1] = float(annot['y1'])
-            boxes[idx, 2] = float(annot['x2'])
-            boxes[idx, 3] = float(annot['y2'])
-            boxes[idx, 4] = self.name_to_label(class_name)
-
-        return boxes
+        return self.annotation_store[image_index]
@@ -15,7 +15,10 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+from . import csv_index
+from .annotation_store import AnnotationStore
 from .generator import Generator
+from .raw_images import RawImageReader
 from ..utils.image import read_image_bgr
 
 import numpy as np
@@ -115,10 +118,21 @@ class CSVGeneratorMULTI(Generator):
         csv_data_file,
         csv_class_file,
         base_dir=None,
+        index_cache=True,
+        raw_images=None,
         **kwargs
     ):
+        """ Initialize a multi-channel CSV data generator.
+
+        Args
+            csv_data_file  : Path to the CSV annotations file.
+            csv_class_file : Path to the CSV classes file.
+            base_dir       : Directory w.r.t. where the files are to be searched (defaults to the directory containing the csv_data_file).
+            index_cache    : Load the annotations from a compiled index next to the CSV file (created on first use) instead of parsing the CSV.
+            raw_images     : Path of a raw images file (relative to base_dir) written by data/convert_to_retinanet_multi.py --raw.
+                             Images are read from this memory-mapped file instead of from the .npz file of every image.
+        """
         self.image_names = []
-        self.image_data  = {}
         self.base_dir    = base_dir
 
         # Take base_dir from annotations file if not explicitly specified.
@@ -136,13 +150,25 @@ class CSVGeneratorMULTI(Generator):
         for key, value in self.classes.items():
             self.labels[value] = key
 
-        # csv with img_path, x1, y1, x2, y2, class_name
-        try:
-            with _open_for_csv(csv_data_file) as file:
-                self.image_data, self.image_size = _read_annotations(csv.reader(file, delimiter=','), self.classes)
-        except ValueError as e:
-            raise_from(ValueError('invalid CSV annotations file: {}: {}'.format(csv_data_file, e)), None)
-        self.image_names = list(self.image_data.keys())
+        index = csv_index.load_index(csv_data_file, csv_class_file) if index_cache else None
+        # an index written by CSVGenerator has no image sizes, rebuild it from the CSV file
+        if index is not None and index[2] is not None:
+            self.image_names, self.annotation_store, self.image_sizes = index
+        else:
+            # csv with img_path, width, height, x1, y1, x2, y2, class_name
+            try:
+                with _open_for_csv(csv_data_file) as file:
+                    image_data, image_size = _read_annotations(csv.reader(file, delimiter=','), self.classes)
+            except ValueError as e:
+                raise_from(ValueError('invalid CSV annotations file: {}: {}'.format(csv_data_file, e)), None)
+            self.image_names      = list(image_data.keys())
+            self.annotation_store = AnnotationStore.from_dicts(image_data, self.image_names, self.classes)
+            self.image_sizes      = np.array([[image_size[name]['width'], image_size[name]['height']] for name in self.image_names]).reshape(-1, 2)
+
+            if index_cache:
+                csv_index.save_index(csv_data_file, csv_class_file, self.image_names, self.annotation_store, image_sizes=self.image_sizes)
+
+        self.raw_images = RawImageReader(os.path.join(self.base_dir, raw_images)) if raw_images else None
 
         super(CSVGeneratorMULTI, self).__init__(**kwargs)
 
@@ -161,27 +187,24 @@ class CSVGeneratorMULTI(Generator):
     def image_path(self, image_index):
         return os.path.join(self.base_dir, self.image_names[image_index])
 
+    def dataset_files(self):
+        if self.raw_images is not None:
+            return [self.raw_images.path]
+        return [self.image_path(i) for i in range(self.size())]
+
     def image_aspect_ratio(self, image_index):
-        # image saved in pickle format (array)
-        img_name = self.image_names[image_index]
-        return float(self.image_size[img_name]['width']) / float(self.image_size[img_name]['height'])
+        # image saved in pickle format (array), the size is read from the annotations file
+        width, height = self.image_sizes[image_index]
+        return float(width) / float(height)
 
     def load_image(self, image_index):
+        if self.raw_images is not None:
+            # read-only view on the memory-mapped file
+            return self.raw_images[self.image_names[image_index]]
+
         image = np.load(self.image_path(image_index))
         
         return image['arr_0']
 
     def load_annotations(self, image_index):
-        path   = self.image_names[image_index]
-        annots = self.image_data[path]
-        boxes  = np.zeros((len(annots), 5))
-
-        for idx, annot in enumerate(annots):
-            class_name = annot['class']
-            boxes[idx, 0] = float(annot['x1'])
-            boxes[idx, 1] = float(annot['y1'])
-            boxes[idx, 2] = float(annot['x2'])
-            boxes[idx, 3] = float(annot['y2'])
-            boxes[idx, 4] = self.name_to_label(class_name)
-
-        return boxes
+        return self.annotation_store[image_index]
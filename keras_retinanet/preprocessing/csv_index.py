@@ -0,0 +1,96 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import hashlib
+import os
+import warnings
+
+import numpy as np
+
+from ..utils.npz import decode_strings, encode_strings, save_npz
+from .annotation_store import AnnotationStore
+
+# Increase when the layout of the index file changes, to invalidate existing index files.
+INDEX_VERSION = 1
+
+
+def index_path(csv_data_file):
+    """ Path of the compiled index belonging to a CSV annotations file. """
+    return csv_data_file + '.index.npz'
+
+
+def _index_key(csv_data_file, csv_class_file):
+    """ Hash of the size and modification time of the annotations and classes files.
+
+    The classes file is included because labels are stored as class ids.
+    """
+    parts = ['v{}'.format(INDEX_VERSION)]
+    for path in [csv_data_file, csv_class_file]:
+        stat = os.stat(path)
+        parts.append('{}:{}:{!r}'.format(os.path.abspath(path), stat.st_size, stat.st_mtime))
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def load_index(csv_data_file, csv_class_file):
+    """ Load the compiled index of a CSV annotations file.
+
+    Returns
+        None if there is no index or if it is outdated, otherwise a tuple (image_names, annotation_store, image_sizes).
+        image_sizes is an (num_images, 2) array of (width, height), or None if the index holds no image sizes.
+    """
+    path = index_path(csv_data_file)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path) as index:
+            if str(index['key']) != _index_key(csv_data_file, csv_class_file):
+                return None
+
+            image_names      = decode_strings(index['names'], index['names_offsets'])
+            annotation_store = AnnotationStore(index['boxes'], index['labels'], index['offsets'])
+            image_sizes      = index['image_sizes'] if 'image_sizes' in index.files else None
+    except Exception as e:
+        warnings.warn('Ignoring unreadable CSV index {}: {}'.format(path, e))
+        return None
+
+    return image_names, annotation_store, image_sizes
+
+
+def save_index(csv_data_file, csv_class_file, image_names, annotation_store, image_sizes=None):
+    """ Write the compiled index of a CSV annotations file next to it.
+
+    The index is written to a temporary file first and then moved in place, so readers never see a partial index.
+    Failing to write the index (for example in a read-only directory) only raises a warning.
+    """
+    path                 = index_path(csv_data_file)
+    names, names_offsets = encode_strings(image_names)
+
+    arrays = {
+        'key'           : np.array(_index_key(csv_data_file, csv_class_file)),
+        'names'         : names,
+        'names_offsets' : names_offsets,
+        'boxes'         : annotation_store.boxes,
+        'labels'        : annotation_store.labels,
+        'offsets'       : annotation_store.offsets,
+    }
+    if image_sizes is not None:
+        arrays['image_sizes'] = np.asarray(image_sizes, dtype=np.float64)
+
+    try:
+        save_npz(path, arrays)
+    except (IOError, OSError) as e:
+        warnings.warn('Could not write CSV index {}: {}'.format(path, e))
@@ -15,6 +15,7 @@ limitations under the License.
 """
 
 import numpy as np
+import os
 import random
 seed = 10
 random.seed(seed)
@@ -23,18 +24,28 @@ import warnings
 
 import keras
 
-from ..utils.anchors import anchor_targets_bbox, bbox_transform
+from ..utils.anchors import AnchorCache, anchor_targets_bbox, bbox_transform
 from ..utils.image import (
     TransformParameters,
     adjust_transform_for_image,
     apply_transform,
+    compute_resize_scale,
     preprocess_image,
     resize_image,
+    resize_transform,
+    resized_shape,
 )
-from ..utils.transform import transform_aabb
+from ..utils.transform import transform_aabbs
+from .image_cache import ImageCache
+from .image_metadata import HEIGHT, WIDTH, ImageMetadataCache
 
 
-class Generator(object):
+class Generator(keras.utils.Sequence):
+    """ Abstract generator class.
+
+    Batches can be requested in epoch order with next(), or by index (as a keras.utils.Sequence) with generator[i].
+    The Sequence interface lets fit_generator(workers=N, use_multiprocessing=True) produce every batch exactly once per epoch.
+    """
     def __init__(
         self,
         transform_generator = None,
@@ -45,6 +56,12 @@ class Generator(object):
         image_max_side=1333,
         transform_parameters=None,
         compute_anchor_targets=anchor_targets_bbox,
+        anchor_cache_size=16,
+        image_metadata_cache=True,
+        fused_resize=False,
+        preprocess_in_model=False,
+        image_cache=None,
+        image_cache_resized=False,
         args= None,
     ):
         self.transform_generator    = transform_generator
@@ -55,9 +72,16 @@ class Generator(object):
         self.image_max_side         = image_max_side
         self.transform_parameters   = transform_parameters or TransformParameters()
         self.compute_anchor_targets = compute_anchor_targets
+        self.anchor_cache           = AnchorCache(anchor_cache_size) if anchor_cache_size else None
+        self.image_metadata_cache   = image_metadata_cache
+        self.fused_resize           = fused_resize
+        self.preprocess_in_model    = preprocess_in_model
+        self.image_cache            = ImageCache(image_cache) if image_cache else None
+        self.image_cache_resized    = image_cache_resized
 
         self.group_index = 0
         self.lock        = threading.Lock()
+        self.pid         = os.getpid()
 
         self.group_images()
         self.mean = args.mean
@@ -70,6 +94,29 @@ class Generator(object):
         self.pyramid_levels = args.pyramid_levels
         self.anchor_stride = args.stride
         self.anchor_size = args.size
+
+    def __getstate__(self):
+        # allows sending the generator to worker processes that are not forked, locks can not be pickled
+        state = self.__dict__.copy()
+        state.update(lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def anchor_cache_info(self):
+        """ Returns the hit / miss counters of the anchor cache, or None if caching is disabled. """
+        if self.anchor_cache is None:
+            return None
+        return self.anchor_cache.info()
+
+    def image_cache_info(self):
+        """ Returns the hit / miss counters, size and hit rate of the image cache, or None if caching is disabled. """
+        if self.image_cache is None:
+            return None
+        return self.image_cache.info()
+
     def size(self):
         raise NotImplementedError('size method not implemented')
 
@@ -85,12 +132,68 @@ class Generator(object):
     def image_aspect_ratio(self, image_index):
         raise NotImplementedError('image_aspect_ratio method not implemented')
 
+    def image_paths(self):
+        """ Returns the paths of all image files, or None if the images are not stored as files readable by PIL. """
+        return None
+
+    def dataset_files(self):
+        """ Returns the paths of the files holding the images of a dataset that does not return image_paths, or None if unknown. """
+        return None
+
+    def image_metadata_cache_path(self):
+        """ Returns the path of the image metadata cache of the dataset, or None to not cache the image metadata. """
+        return None
+
+    def image_aspect_ratios(self):
+        """ Returns the aspect ratio of every image, used to group the images by ratio.
+
+        If the generator returns the paths of its images in image_paths, the sizes are read through an ImageMetadataCache.
+        The image_metadata_cache argument selects the cache file: True uses image_metadata_cache_path,
+        a string is used as path to the cache file and False disables the cache.
+        """
+        path  = self.image_metadata_cache_path() if self.image_metadata_cache is True else self.image_metadata_cache
+        paths = self.image_paths() if path else None
+        if paths is None:
+            return [self.image_aspect_ratio(i) for i in range(self.size())]
+
+        cache    = ImageMetadataCache(path)
+        metadata = cache.lookup(paths)
+        return (metadata[:, WIDTH] / metadata[:, HEIGHT]).tolist()
+
     def load_image(self, image_index):
         raise NotImplementedError('load_image method not implemented')
 
     def load_annotations(self, image_index):
         raise NotImplementedError('load_annotations method not implemented')
 
+    def _load_image_for_cache(self, image_index):
+        image = self.load_image(image_index)
+        if self.image_cache_resized:
+            return self.resize_image(image)
+        return image, 1.0
+
+    def load_cached_image(self, image_index):
+        """ Load an image through the decoded image cache.
+
+        The image_cache argument sets the memory budget of the cache in bytes, None disables the cache.
+        With image_cache_resized the images are resized (see resize_image) before they are cached, which fits more
+        images in the budget. Augmentation then transforms the resized image instead of the full resolution image.
+
+        Returns
+            A tuple (image, scale), where scale is the factor the image was resized with before caching (1 if it was not).
+            Cached images are read-only.
+        """
+        if self.image_cache is None:
+            return self.load_image(image_index), 1.0
+        return self.image_cache.get(image_index, self._load_image_for_cache)
+
+    def seed(self, seed):
+        """ Reseed all pseudo-random number generators used by this generator (shuffling and augmentation). """
+        random.seed(seed)
+        np.random.seed(seed)
+        if hasattr(self.transform_generator, 'seed'):
+            self.transform_generator.seed(seed)
+
     def load_annotations_group(self, group):
         return [self.load_annotations(image_index) for image_index in group]
 
@@ -131,8 +234,7 @@ class Generator(object):
 
             # Transform the bounding boxes in the annotations.
             annotations = annotations.copy()
-            for index in range(annotations.shape[0]):
-                annotations[index, :4] = transform_aabb(transform, annotations[index, :4])
+            annotations[:, :4] = transform_aabbs(transform, annotations[:, :4])
 
         return image, annotations
 
@@ -140,9 +242,43 @@ class Generator(object):
         return resize_image(image, min_side=self.image_min_side, max_side=self.image_max_side)
 
     def preprocess_image(self, image):
+        # with preprocess_in_model the images are preprocessed by the model (see models.retinanet.retinanet_preprocessing)
+        if self.preprocess_in_model:
+            return image
         return preprocess_image(image, mean=self.mean, normalize=self.normalize)
 
+    def fused_preprocess_group_entry(self, image, annotations):
+        """ Randomly transform and resize an image with a single warpAffine, then preprocess the resized image.
+
+        The random transformation and the resize scale are composed into one affine matrix, so the full resolution
+        image is only read once and mean subtraction / normalization only runs on the (usually smaller) resized image.
+        Note that areas outside the transformed image are filled with cval before, instead of after, preprocessing.
+        """
+        scale     = compute_resize_scale(image.shape, min_side=self.image_min_side, max_side=self.image_max_side)
+        transform = np.identity(3)
+        if self.transform_generator:
+            transform = adjust_transform_for_image(next(self.transform_generator), image, self.transform_parameters.relative_translation)
+
+        # transform and resize image in one pass
+        output_shape = resized_shape(image.shape, scale)
+        image        = apply_transform(resize_transform(scale).dot(transform), image, self.transform_parameters, output_shape=output_shape)
+        if image.ndim == 2:
+            # cv2 drops the channel axis of single channel images
+            image = np.expand_dims(image, axis=2)
+
+        # preprocess the resized image
+        image = self.preprocess_image(image)
+
+        # apply transformation and resizing to annotations too
+        annotations        = annotations.copy()
+        annotations[:, :4] = transform_aabbs(transform, annotations[:, :4]) * scale
+
+        return image, annotations
+
     def preprocess_group_entry(self, image, annotations):
+        if self.fused_resize:
+            return self.fused_preprocess_group_entry(image, annotations)
+
         # preprocess the image
         image = self.preprocess_image(image)
 
@@ -168,23 +304,40 @@ class Generator(object):
 
         return image_group, annotations_group
 
-    def group_images(self):
+    def compute_groups(self, batch_size, group_method, fill_last=True):
+        """ Divide the images into groups of batch_size images, one group = one batch.
+
+        Args
+            batch_size   : Number of images per group.
+            group_method : One of 'none', 'random', 'ratio'.
+            fill_last    : If true, the last group is filled up with the first images, so all groups have batch_size images.
+
+        Returns
+            A list of lists of image indices.
+        """
         # determine the order of the images
         order = list(range(self.size()))
-        if self.group_method == 'random':
+        if group_method == 'random':
             random.shuffle(order)
-        elif self.group_method == 'ratio':
-            order.sort(key=lambda x: self.image_aspect_ratio(x))
+        elif group_method == 'ratio':
+            ratios = self.image_aspect_ratios()
+            order.sort(key=lambda x: ratios[x])
 
         # divide into groups, one group = one batch
-        self.groups = [[order[x % len(order)] for x in range(i, i + self.batch_size)] for i in range(0, len(order), self.batch_size)]
+        if not fill_last:
+            return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+        return [[order[x % len(order)] for x in range(i, i + batch_size)] for i in range(0, len(order), batch_size)]
+
+    def group_images(self):
+        self.groups = self.compute_groups(self.batch_size, self.group_method)
 
     def compute_inputs(self, image_group):
         # get the max image shape
         max_shape = tuple(max(image.shape[x] for image in image_group) for x in range(3))
 
-        # construct an image batch object
-        image_batch = np.zeros((self.batch_size,) + max_shape, dtype=keras.backend.floatx())
+        # construct an image batch object, unprocessed images keep their (usually uint8) dtype
+        dtype       = image_group[0].dtype if self.preprocess_in_model else keras.backend.floatx()
+        image_batch = np.zeros((len(image_group),) + max_shape, dtype=dtype)
 
         # copy all images to the upper left part of the image batch object
         for image_index, image in enumerate(image_group):
@@ -197,8 +350,8 @@ class Generator(object):
         max_shape = tuple(max(image.shape[x] for image in image_group) for x in range(3))
 
         # compute labels and regression targets
-        labels_group     = [None] * self.batch_size
-        regression_group = [None] * self.batch_size
+        labels_group     = [None] * len(image_group)
+        regression_group = [None] * len(image_group)
         for index, (image, annotations) in enumerate(zip(image_group, annotations_group)):
             # compute regression targets
             labels_group[index], annotations, anchors = self.compute_anchor_targets(
@@ -211,6 +364,7 @@ class Generator(object):
                 scales=self.anchor_scale,
                 strides=self.anchor_stride,
                 sizes=self.anchor_size,
+                anchor_cache=self.anchor_cache,
             )
             regression_group[index] = bbox_transform(anchors, annotations)
 
@@ -218,8 +372,8 @@ class Generator(object):
             anchor_states           = np.max(labels_group[index], axis=1, keepdims=True)
             regression_group[index] = np.append(regression_group[index], anchor_states, axis=1)
 
-        labels_batch     = np.zeros((self.batch_size,) + labels_group[0].shape, dtype=keras.backend.floatx())
-        regression_batch = np.zeros((self.batch_size,) + regression_group[0].shape, dtype=keras.backend.floatx())
+        labels_batch     = np.zeros((len(image_group),) + labels_group[0].shape, dtype=keras.backend.floatx())
+        regression_batch = np.zeros((len(image_group),) + regression_group[0].shape, dtype=keras.backend.floatx())
 
         # copy all labels and regression values to the batch blob
         for index, (labels, regression) in enumerate(zip(labels_group, regression_group)):
@@ -229,10 +383,17 @@ class Generator(object):
         return [regression_batch, labels_batch]
 
     def compute_input_output(self, group):
-        # load images and annotations
-        image_group       = self.load_image_group(group)
+        # load images (through the image cache, if enabled) and annotations
+        images            = [self.load_cached_image(image_index) for image_index in group]
+        image_group       = [image for image, _ in images]
         annotations_group = self.load_annotations_group(group)
 
+        # scale the annotations of images that were resized before they were cached
+        for index, (_, scale) in enumerate(images):
+            if scale != 1:
+                annotations_group[index] = annotations_group[index].copy()
+                annotations_group[index][:, :4] *= scale
+
         # check validity of annotations
         image_group, annotations_group = self.filter_annotations(image_group, annotations_group, group)
 
@@ -247,6 +408,29 @@ class Generator(object):
 
         return inputs, targets
 
+    def __len__(self):
+        """ Number of batches per epoch. """
+        return len(self.groups)
+
+    def __getitem__(self, index):
+        """ Keras sequence method for generating the batch at the given index. """
+        # worker processes inherit the PRNG state when forked, reseed them so they don't produce identical augmentations
+        pid = os.getpid()
+        if pid != self.pid:
+            self.pid = pid
+            self.seed(pid)
+
+        return self.compute_input_output(self.groups[index])
+
+    def shuffle_group_order(self):
+        """ Shuffle the order of the groups, called at the start of every epoch if shuffle_groups is set. """
+        random.shuffle(self.groups)
+
+    def on_epoch_end(self):
+        """ Keras sequence method, reshuffles the groups between epochs. """
+        if self.shuffle_groups:
+            self.shuffle_group_order()
+
     def __next__(self):
         return self.next()
 
@@ -255,7 +439,7 @@ class Generator(object):
         with self.lock:
             if self.group_index == 0 and self.shuffle_groups:
                 # shuffle groups at start of epoch
-                random.shuffle(self.groups)
+                self.shuffle_group_order()
             
             group = self.groups[self.group_index]
             #print(self.image_path[group])
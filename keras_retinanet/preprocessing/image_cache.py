@@ -0,0 +1,106 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import collections
+import threading
+
+
+class ImageCache(object):
+    """ LRU cache of decoded images, limited by the number of bytes of the cached images.
+
+    Cached images are returned read-only, since they are shared between calls. The cache is thread safe, so it can
+    be used by the prefetching threads of the evaluation. Worker processes each get their own copy of the cache.
+
+    Args
+        max_bytes : Maximum total size in bytes of the cached images. Images larger than this are never cached.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.nbytes    = 0
+        self.hits      = 0
+        self.misses    = 0
+        self._cache    = collections.OrderedDict()
+        self._lock     = threading.Lock()
+
+    def __getstate__(self):
+        # a pickled cache starts empty, locks can not be pickled
+        state = self.__dict__.copy()
+        state.update(_cache=collections.OrderedDict(), _lock=None, nbytes=0)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        """ Returns the cached value of key, or calls load(key) and caches the result.
+
+        Args
+            key  : Key of the image, usually the image index.
+            load : Function returning a tuple (image, scale) for a key, the scale is stored along with the image.
+
+        Returns
+            The tuple (image, scale).
+        """
+        with self._lock:
+            entry = self._cache.pop(key, None)
+            if entry is not None:
+                # re-insert to mark as most recently used
+                self._cache[key] = entry
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        image, scale = load(key)
+        image.flags.writeable = False
+        entry = (image, scale)
+
+        if image.nbytes > self.max_bytes:
+            return entry
+
+        with self._lock:
+            # another thread may have loaded the same image in the meantime
+            previous = self._cache.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[0].nbytes
+
+            self._cache[key] = entry
+            self.nbytes += image.nbytes
+            while self.nbytes > self.max_bytes:
+                _, (evicted, _) = self._cache.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+        return entry
+
+    def info(self):
+        """ Returns a dict with the number of hits, misses, cached images, cached bytes and the hit rate. """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits'     : self.hits,
+                'misses'   : self.misses,
+                'size'     : len(self._cache),
+                'bytes'    : self.nbytes,
+                'hit_rate' : float(self.hits) / requests if requests else 0.0,
+            }
+
+    def clear(self):
+        """ Removes all cached images and resets the counters. """
+        with self._lock:
+            self._cache.clear()
+            self.nbytes = 0
+            self.hits   = 0
+            self.misses = 0
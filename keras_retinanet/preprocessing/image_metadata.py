@@ -0,0 +1,146 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import threading
+import warnings
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+from PIL import Image
+
+from ..utils.npz import decode_strings, encode_strings, save_npz
+
+# columns of the metadata arrays
+WIDTH, HEIGHT, CHANNELS, FILE_SIZE, MTIME = range(5)
+
+
+def read_image_metadata(path):
+    """ Read the metadata of an image file without decoding the image.
+
+    Returns
+        A tuple (width, height, channels, file_size, mtime).
+    """
+    stat = os.stat(path)
+    with Image.open(path) as image:
+        width, height = image.size
+        channels      = len(image.getbands())
+    return width, height, channels, stat.st_size, stat.st_mtime
+
+
+class ImageMetadataCache(object):
+    """ On-disk cache of the width, height, number of channels, file size and modification time of image files.
+
+    Entries are keyed on the absolute path of the image and are read again when the size or modification time
+    of the file changed. Missing entries are read in parallel with a thread pool, since reading the image headers
+    is dominated by file system latency (especially on network storage).
+    A cache file belongs to one dataset (see Generator.image_metadata_cache_path), so entries of images that are
+    no longer part of the dataset are dropped by lookup.
+
+    Args
+        path    : Path of the cache file.
+        workers : Number of threads used to read missing entries.
+    """
+    def __init__(self, path, workers=16):
+        self.path    = path
+        self.workers = int(workers)
+        self.entries = {}
+        self.lock    = threading.Lock()
+        self.load()
+
+    def load(self):
+        """ Load the entries of the cache file, if it exists. """
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with np.load(self.path) as cache:
+                paths    = decode_strings(cache['paths'], cache['paths_offsets'])
+                metadata = cache['metadata']
+        except Exception as e:
+            warnings.warn('Ignoring unreadable image metadata cache {}: {}'.format(self.path, e))
+            return
+
+        with self.lock:
+            self.entries.update(zip(paths, map(tuple, metadata.tolist())))
+
+    def save(self):
+        """ Write all entries to the cache file. Failing to write the cache only raises a warning. """
+        with self.lock:
+            paths    = list(self.entries.keys())
+            metadata = np.array([self.entries[p] for p in paths], dtype=np.float64).reshape(-1, 5)
+
+        paths, paths_offsets = encode_strings(paths)
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            save_npz(self.path, {'paths': paths, 'paths_offsets': paths_offsets, 'metadata': metadata})
+        except (IOError, OSError) as e:
+            warnings.warn('Could not write image metadata cache {}: {}'.format(self.path, e))
+
+    def _lookup(self, path, validate):
+        """ Returns the metadata of a single image and whether it had to be read from the image file. """
+        entry = self.entries.get(path)
+        if entry is not None:
+            if not validate:
+                return entry, False
+            stat = os.stat(path)
+            if stat.st_size == entry[FILE_SIZE] and stat.st_mtime == entry[MTIME]:
+                return entry, False
+
+        entry = read_image_metadata(path)
+        with self.lock:
+            self.entries[path] = entry
+        return entry, True
+
+    def lookup(self, image_paths, validate=True):
+        """ Returns the metadata of a list of image files, reading and storing the missing entries.
+
+        Entries of other images than image_paths are removed from the cache.
+
+        Args
+            image_paths : List of paths to image files.
+            validate    : Compare the size and modification time of every file with the cached values.
+                          Disabling this avoids a stat call per image, at the risk of returning outdated entries.
+
+        Returns
+            An array of shape (len(image_paths), 5) with the columns WIDTH, HEIGHT, CHANNELS, FILE_SIZE and MTIME.
+        """
+        paths = [os.path.abspath(p) for p in image_paths]
+
+        def lookup(path):
+            return self._lookup(path, validate)
+
+        if self.workers > 1 and len(paths) > 1:
+            pool = ThreadPool(self.workers)
+            try:
+                results = pool.map(lookup, paths, chunksize=max(1, min(256, len(paths) // (4 * self.workers))))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [lookup(p) for p in paths]
+
+        with self.lock:
+            stale = set(self.entries).difference(paths)
+            for path in stale:
+                del self.entries[path]
+
+        if stale or any(modified for _, modified in results):
+            self.save()
+
+        return np.array([entry for entry, _ in results], dtype=np.float64).reshape(-1, 5)
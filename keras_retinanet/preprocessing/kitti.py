@@ -17,9 +17,9 @@ limitations under the License.
 import csv
 import os.path
 
-import numpy as np
 from PIL import Image
 
+from .annotation_store import AnnotationStore
 from .generator import Generator
 from ..utils.image import read_image_bgr
 
@@ -44,6 +44,7 @@ class KittiGenerator(Generator):
         **kwargs
     ):
         self.base_dir = base_dir
+        self.subset   = subset
 
         label_dir = os.path.join(self.base_dir, subset, 'labels')
         image_dir = os.path.join(self.base_dir, subset, 'images')
@@ -69,7 +70,7 @@ class KittiGenerator(Generator):
         for label, id in kitti_classes.items():
             self.id_to_labels[id] = label
 
-        self.image_data = dict()
+        annotations = []
         self.images = []
         for i, fn in enumerate(os.listdir(label_dir)):
             label_fp = os.path.join(label_dir, fn)
@@ -86,10 +87,11 @@ class KittiGenerator(Generator):
                     label = row['type']
                     cls_id = kitti_classes[label]
 
-                    annotation = {'cls_id': cls_id, 'x1': row['left'], 'x2': row['right'], 'y2': row['bottom'], 'y1': row['top']}
-                    boxes.append(annotation)
+                    boxes.append((float(row['left']), float(row['top']), float(row['right']), float(row['bottom']), cls_id))
 
-                self.image_data[i] = boxes
+                annotations.append(boxes)
+
+        self.annotation_store = AnnotationStore.from_lists(annotations)
 
         super(KittiGenerator, self).__init__(**kwargs)
 
@@ -105,6 +107,12 @@ class KittiGenerator(Generator):
     def label_to_name(self, label):
         return self.id_to_labels[label]
 
+    def image_paths(self):
+        return self.images
+
+    def image_metadata_cache_path(self):
+        return os.path.join(self.base_dir, self.subset, 'image_metadata.npz')
+
     def image_aspect_ratio(self, image_index):
         # PIL is fast for metadata
         image = Image.open(self.images[image_index])
@@ -114,13 +122,4 @@ class KittiGenerator(Generator):
         return read_image_bgr(self.images[image_index])
 
     def load_annotations(self, image_index):
-        annotations = self.image_data[image_index]
-
-        boxes = np.zeros((len(annotations), 5))
-        for idx, ann in enumerate(annotations):
-            boxes[idx, 0] = float(ann['x1'])
-            boxes[idx, 1] = float(ann['y1'])
-            boxes[idx, 2] = float(ann['x2'])
-            boxes[idx, 3] = float(ann['y2'])
-            boxes[idx, 4] = int(ann['cls_id'])
-        return boxes
+        return self.annotation_store[image_index]
@@ -0,0 +1,247 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import threading
+import traceback
+
+import keras
+import numpy as np
+from six.moves import queue
+
+from ..utils.anchors import anchors_for_shape
+from ..utils.processes import get_context
+
+
+class _Slot(object):
+    """ One entry of the shared memory ring buffer, holding a complete batch (image, regression and labels). """
+    def __init__(self, context, capacities):
+        self.buffers = [context.RawArray('b', int(c)) for c in capacities]
+
+    def arrays(self, layout):
+        """ Returns numpy views on the shared buffers, given a list of (shape, dtype) per buffer. """
+        return [
+            np.frombuffer(b, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+            for b, (shape, dtype) in zip(self.buffers, layout)
+        ]
+
+    def fits(self, arrays):
+        return all(a.nbytes <= len(b) for a, b in zip(arrays, self.buffers))
+
+
+def _worker(generator, seed, slots, capped, task_queue, result_queue):
+    """ Worker process main loop: compute batches for the received groups and write them into the shared slots. """
+    generator.seed(seed)
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, slot_index, group = task
+
+        try:
+            inputs, targets = generator.compute_input_output(group)
+            arrays = [inputs] + list(targets)
+            slot   = slots[slot_index]
+
+            if slot.fits(arrays):
+                layout = [(a.shape, a.dtype.str) for a in arrays]
+                for source, target in zip(arrays, slot.arrays(layout)):
+                    target[...] = source
+                result_queue.put((task_id, slot_index, layout, None))
+            elif capped:
+                # batch is larger than the capped buffers, fall back to sending it through the queue
+                result_queue.put((task_id, slot_index, None, arrays))
+            else:
+                raise ValueError(
+                    'Batch with shapes {} does not fit in the shared memory buffer, which holds images of at most {} x {} '
+                    '(image_max_side). Set max_slot_bytes to send larger batches through a queue.'.format(
+                        [a.shape for a in arrays], generator.image_max_side, generator.image_max_side
+                    )
+                )
+        except Exception:
+            result_queue.put((task_id, slot_index, traceback.format_exc(), None))
+
+
+class MultiprocessGenerator(object):
+    """ Produces the batches of a Generator in worker processes.
+
+    Each worker runs `compute_input_output` for the groups it is given and writes the resulting image, regression and
+    labels batches into a ring of preallocated shared memory buffers, so batches are not pickled between processes.
+    Groups are assigned to workers round robin and every worker is seeded with `seed + worker_index`, which makes the
+    produced batches deterministic for a given seed and number of workers.
+
+    Batches are returned in epoch order (shuffled like Generator.next) and are copied out of the shared buffers,
+    so they remain valid after the buffer is reused. If a worker process dies (for example killed for running out of
+    memory) next raises a RuntimeError instead of waiting forever. Call close to stop the workers.
+
+    The workers are started with forkserver (or spawn), because forking a process that already runs tensorflow is not
+    safe. The generator is pickled to the workers, so it has to be picklable (see ShapesCallback for the shapes callback
+    of vgg and densenet backbones).
+
+    The shared buffers are allocated up front: every one of the prefetch buffers holds a batch of
+    image_max_side x image_max_side images plus their regression and labels targets. For the defaults (batch size 1,
+    image_max_side 1333, 80 classes, float32) that is about 75 MB per buffer, so 8 workers with the default prefetch
+    depth allocate about 1.2 GB. A batch with larger images (for example from a generator that does not resize its
+    images) raises a RuntimeError. Use max_slot_bytes to cap the size of a buffer, batches that do not fit in their
+    buffer are then sent through a queue instead (which is slower, but uses memory only while the batch is in transit).
+
+    Args
+        generator      : The Generator to produce batches for, it is pickled to the worker processes.
+        workers        : Number of worker processes.
+        prefetch       : Number of batches that are computed ahead (the number of shared memory buffers), defaults to 2 * workers.
+        seed           : Base seed for the workers.
+        max_slot_bytes : Maximum size in bytes of the shared memory of one buffer (defaults to the size of the largest batch).
+        poll_interval  : Interval in seconds at which the workers are checked while waiting for a batch.
+    """
+    def __init__(self, generator, workers=4, prefetch=None, seed=0, max_slot_bytes=None, poll_interval=1.0):
+        self.generator      = generator
+        self.workers        = int(workers)
+        self.prefetch       = int(prefetch) if prefetch else 2 * self.workers
+        self.seed           = seed
+        self.max_slot_bytes = max_slot_bytes
+        self.poll_interval  = poll_interval
+
+        if self.workers < 1:
+            raise ValueError('MultiprocessGenerator requires at least one worker, received {}.'.format(workers))
+        if self.prefetch < 1:
+            raise ValueError('MultiprocessGenerator requires a prefetch depth of at least one, received {}.'.format(prefetch))
+
+        context    = get_context()
+        capacities = self._capacities()
+        capped     = max_slot_bytes is not None and sum(capacities) > max_slot_bytes
+        if capped:
+            scale      = float(max_slot_bytes) / sum(capacities)
+            capacities = [int(c * scale) for c in capacities]
+        self.slots = [_Slot(context, capacities) for _ in range(self.prefetch)]
+
+        self.free_slots   = list(range(self.prefetch))
+        self.next_task    = 0
+        self.next_result  = 0
+        self.results      = {}
+        self.group_index  = 0
+        self.lock         = threading.Lock()
+        self.task_queues  = [context.Queue() for _ in range(self.workers)]
+        self.result_queue = context.Queue()
+
+        self.processes = []
+        for i in range(self.workers):
+            process = context.Process(
+                target=_worker,
+                args=(generator, seed + i, self.slots, capped, self.task_queues[i], self.result_queue)
+            )
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+        with self.lock:
+            self._submit()
+
+    def _capacities(self):
+        """ Upper bound on the size in bytes of the image, regression and labels batch.
+
+        Resized images never exceed image_max_side in either dimension, the anchors are counted for the guessed
+        shapes of the pyramid levels, which are never smaller than those of a shapes callback.
+        """
+        generator   = self.generator
+        side        = generator.image_max_side
+        channels    = generator.load_image(0).shape[2]
+        num_anchors = anchors_for_shape(
+            (side, side, channels),
+            pyramid_levels=generator.pyramid_levels,
+            ratios=generator.anchor_ratio,
+            scales=generator.anchor_scale,
+            strides=generator.anchor_stride,
+            sizes=generator.anchor_size,
+        ).shape[0]
+
+        itemsize   = np.dtype(keras.backend.floatx()).itemsize
+        capacities = [
+            generator.batch_size * side * side * channels * itemsize,
+            generator.batch_size * num_anchors * 5 * itemsize,
+            generator.batch_size * num_anchors * generator.num_classes() * itemsize,
+        ]
+        return capacities
+
+    def _next_group(self):
+        """ Returns the next group in epoch order, shuffling the groups at the start of every epoch. """
+        if self.group_index == 0 and self.generator.shuffle_groups:
+            self.generator.shuffle_group_order()
+
+        group = self.generator.groups[self.group_index]
+        self.group_index = (self.group_index + 1) % len(self.generator.groups)
+        return group
+
+    def _submit(self):
+        """ Fill all free slots with new tasks. """
+        while self.free_slots:
+            slot_index = self.free_slots.pop(0)
+            self.task_queues[self.next_task % self.workers].put((self.next_task, slot_index, self._next_group()))
+            self.next_task += 1
+
+    def size(self):
+        return self.generator.size()
+
+    def __len__(self):
+        return len(self.generator.groups)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.next()
+
+    def next(self):
+        with self.lock:
+            # wait for the next batch in order, buffering any batches that finish early
+            while self.next_result not in self.results:
+                try:
+                    task_id, slot_index, layout, arrays = self.result_queue.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    self._check_workers()
+                    continue
+                self.results[task_id] = (slot_index, layout, arrays)
+
+            slot_index, layout, arrays = self.results.pop(self.next_result)
+            self.next_result += 1
+
+            error = layout if isinstance(layout, str) else None
+            if error is None and arrays is None:
+                arrays = [a.copy() for a in self.slots[slot_index].arrays(layout)]
+
+            # release the slot and schedule the next group
+            self.free_slots.append(slot_index)
+            self._submit()
+
+        if error is not None:
+            raise RuntimeError('Exception in batch producing worker:\n{}'.format(error))
+
+        return arrays[0], arrays[1:]
+
+    def _check_workers(self):
+        """ Raise a RuntimeError if a worker process has stopped. """
+        for i, process in enumerate(self.processes):
+            if not process.is_alive():
+                raise RuntimeError('Batch producing worker {} (pid {}) died with exit code {}.'.format(i, process.pid, process.exitcode))
+
+    def close(self):
+        """ Stop all worker processes. """
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
@@ -103,6 +103,12 @@ class PascalVocGenerator(Generator):
     def label_to_name(self, label):
         return self.labels[label]
 
+    def image_paths(self):
+        return [os.path.join(self.data_dir, 'JPEGImages', name + self.image_extension) for name in self.image_names]
+
+    def image_metadata_cache_path(self):
+        return os.path.join(self.data_dir, 'ImageSets', 'Main', self.set_name + '.image_metadata.npz')
+
     def image_aspect_ratio(self, image_index):
         path  = os.path.join(self.data_dir, 'JPEGImages', self.image_names[image_index] + self.image_extension)
         image = Image.open(path)
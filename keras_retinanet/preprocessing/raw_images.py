@@ -0,0 +1,164 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+
+import numpy as np
+
+from ..utils.npz import decode_strings, encode_strings, save_npz
+
+# Increase when the layout of the index file changes.
+RAW_IMAGES_VERSION = 1
+
+
+def index_path(path):
+    """ Path of the index belonging to a raw images file. """
+    return path + '.index.npz'
+
+
+def _load_index(path):
+    """ Load the (names, offsets, shapes) of the index of a raw images file. """
+    with np.load(index_path(path)) as index:
+        version = int(index['version'])
+        if version != RAW_IMAGES_VERSION:
+            raise ValueError('Unsupported raw images version {} in {}, expected {}.'.format(version, index_path(path), RAW_IMAGES_VERSION))
+        return decode_strings(index['names'], index['names_offsets']), index['offsets'], index['shapes']
+
+
+class RawImageWriter(object):
+    """ Writes uint8 images (height, width, channels) one after the other into a single uncompressed file.
+
+    The name, byte offset and shape of every image are stored in an index next to the file (see index_path).
+    The index is only rewritten by flush and close, images added after the last flush are discarded when appending.
+
+    Args
+        path   : Path of the raw images file.
+        append : Add images to an existing file instead of overwriting it.
+    """
+    def __init__(self, path, append=False):
+        self.path    = path
+        self.names   = []
+        self.offsets = [0]
+        self.shapes  = []
+
+        if append and os.path.exists(path) and os.path.exists(index_path(path)):
+            self.names, offsets, shapes = _load_index(path)
+            self.offsets = [int(o) for o in offsets]
+            self.shapes  = [tuple(int(s) for s in shape) for shape in shapes]
+            self.file    = open(path, 'r+b')
+
+            # drop data of images written after the last flush
+            self.file.truncate(self.offsets[-1])
+            self.file.seek(self.offsets[-1])
+        else:
+            self.file = open(path, 'wb')
+
+        self.lookup = set(self.names)
+
+    def __contains__(self, name):
+        return name in self.lookup
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, image):
+        """ Append an image. A (height, width) image is stored with a single channel. """
+        image = np.asarray(image)
+        if image.dtype != np.uint8:
+            raise ValueError('Raw images have to be uint8, received {} for {}.'.format(image.dtype, name))
+        if image.ndim == 2:
+            image = image[:, :, np.newaxis]
+        if image.ndim != 3:
+            raise ValueError('Raw images have to be (height, width, channels), received shape {} for {}.'.format(image.shape, name))
+        if name in self.lookup:
+            raise ValueError('Duplicate raw image name: {}'.format(name))
+
+        self.file.write(np.ascontiguousarray(image).tobytes())
+        self.names.append(name)
+        self.offsets.append(self.offsets[-1] + image.nbytes)
+        self.shapes.append(image.shape)
+        self.lookup.add(name)
+
+    def flush(self):
+        """ Write all added images to disk and update the index. """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+        names, names_offsets = encode_strings(self.names)
+        save_npz(index_path(self.path), {
+            'version'       : np.array(RAW_IMAGES_VERSION),
+            'names'         : names,
+            'names_offsets' : names_offsets,
+            'offsets'       : np.array(self.offsets, dtype=np.int64),
+            'shapes'        : np.array(self.shapes, dtype=np.int64).reshape(-1, 3),
+        })
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RawImageReader(object):
+    """ Reads the images of a file written by RawImageWriter.
+
+    The file is memory-mapped, images are returned as read-only views on the mapping without copying or decoding.
+    The mapping is opened on first use and is not pickled, so every worker process opens its own mapping.
+
+    Args
+        path : Path of the raw images file.
+    """
+    def __init__(self, path):
+        self.path                             = path
+        self.names, self.offsets, self.shapes = _load_index(path)
+        self.lookup                           = {name: i for i, name in enumerate(self.names)}
+        self._data                            = None
+
+    def __getstate__(self):
+        state          = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def data(self):
+        """ The memory-mapped content of the file. """
+        if self._data is None:
+            # mapping an empty file fails
+            if self.offsets[-1] == 0:
+                self._data = np.zeros((0,), dtype=np.uint8)
+            else:
+                self._data = np.memmap(self.path, dtype=np.uint8, mode='r', shape=(int(self.offsets[-1]),))
+        return self._data
+
+    def __contains__(self, name):
+        return name in self.lookup
+
+    def __len__(self):
+        return len(self.names)
+
+    def shape(self, name):
+        """ Shape (height, width, channels) of an image, without reading it. """
+        return tuple(self.shapes[self.lookup[name]])
+
+    def __getitem__(self, name):
+        i = self.lookup[name]
+        return self.data()[self.offsets[i]:self.offsets[i + 1]].reshape(self.shapes[i])
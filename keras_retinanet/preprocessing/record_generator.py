@@ -0,0 +1,175 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import collections
+import io
+import os
+import random
+import threading
+
+import numpy as np
+from six.moves import zip_longest
+
+from .generator import Generator
+from .records import INDEX_NAME, RecordsIndex, ShardReader
+from ..utils.image import read_image_bgr
+
+
+class RecordGenerator(Generator):
+    """ Generate data from sharded record files written by keras_retinanet/bin/pack_records.py.
+
+    Every shard is divided in blocks of consecutive images of at most buffer_size bytes, which are read with a single
+    read. With group_method 'shard' (the default) the shards are read sequentially, block by block, instead of reading
+    many small files in a random order. Every epoch the order of the shards is shuffled, the blocks of interleave shards
+    are read at the same time and the images of those blocks are shuffled together.
+    The other group methods ('none', 'random', 'ratio') are supported as well, but read every image separately.
+    """
+    def __init__(
+        self,
+        records_dir,
+        buffer_size=16 * 2 ** 20,
+        interleave=4,
+        group_method='shard',
+        **kwargs
+    ):
+        """ Initialize a record data generator.
+
+        Args
+            records_dir : Directory with the record files and their index.
+            buffer_size : Size in bytes of the read buffer of a shard, the shards are read in blocks of this size.
+            interleave  : Number of shards read at the same time with the 'shard' group method.
+        """
+        self.records_dir      = records_dir
+        self.index            = RecordsIndex(records_dir)
+        self.annotation_store = self.index.annotation_store
+        self.classes          = self.index.classes
+        self.readers          = [ShardReader(path, buffer_size=buffer_size) for path in self.index.shards]
+        self.interleave       = max(1, int(interleave))
+        self.open_shards      = collections.deque()
+        self.shards_lock      = threading.Lock()
+        self.compute_blocks(buffer_size)
+
+        self.labels = {}
+        for key, value in self.classes.items():
+            self.labels[value] = key
+
+        super(RecordGenerator, self).__init__(group_method=group_method, **kwargs)
+
+    def __getstate__(self):
+        state = super(RecordGenerator, self).__getstate__()
+        state.update(shards_lock=None)
+        return state
+
+    def __setstate__(self, state):
+        super(RecordGenerator, self).__setstate__(state)
+        self.shards_lock = threading.Lock()
+
+    def size(self):
+        return len(self.index.names)
+
+    def num_classes(self):
+        return max(self.classes.values()) + 1
+
+    def name_to_label(self, name):
+        return self.classes[name]
+
+    def label_to_name(self, label):
+        return self.labels[label]
+
+    def dataset_files(self):
+        return [os.path.join(self.records_dir, INDEX_NAME)]
+
+    def image_aspect_ratio(self, image_index):
+        width, height = self.index.image_sizes[image_index]
+        return float(width) / float(height)
+
+    def image_aspect_ratios(self):
+        # the sizes are stored in the index, there are no image files to read them from
+        return (self.index.image_sizes[:, 0] / self.index.image_sizes[:, 1]).tolist()
+
+    def compute_blocks(self, buffer_size):
+        """ Divide every shard in blocks of consecutive images of at most buffer_size bytes (or a single larger image).
+
+        Sets blocks, with for every shard a list of blocks with the indices of their images, and the block_start and
+        block_stop offsets of the block of every image.
+        """
+        self.blocks      = [[] for _ in self.readers]
+        self.block_start = np.zeros(self.size(), dtype=np.int64)
+        self.block_stop  = np.zeros(self.size(), dtype=np.int64)
+
+        offsets = self.index.offsets
+        stops   = offsets + self.index.lengths
+        for image_index in np.lexsort((offsets, self.index.shard)):
+            blocks = self.blocks[self.index.shard[image_index]]
+            if not blocks or stops[image_index] - offsets[blocks[-1][0]] > buffer_size:
+                blocks.append([])
+            blocks[-1].append(image_index)
+
+        for blocks in self.blocks:
+            for block in blocks:
+                self.block_start[block] = offsets[block[0]]
+                self.block_stop[block]  = stops[block[-1]]
+
+    def compute_groups(self, batch_size, group_method, fill_last=True):
+        """ Divide the images into groups, see Generator.compute_groups.
+
+        The 'shard' group method reads interleave shards at the same time, with the shards in a random order.
+        It takes the next block of each of these shards and shuffles the images of those blocks.
+        """
+        if group_method != 'shard':
+            return super(RecordGenerator, self).compute_groups(batch_size, group_method, fill_last=fill_last)
+
+        shards = list(range(len(self.readers)))
+        random.shuffle(shards)
+
+        order = []
+        for i in range(0, len(shards), self.interleave):
+            for blocks in zip_longest(*[self.blocks[shard] for shard in shards[i:i + self.interleave]]):
+                window = [image_index for block in blocks if block is not None for image_index in block]
+                random.shuffle(window)
+                order.extend(window)
+
+        if not fill_last:
+            return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+        return [[order[x % len(order)] for x in range(i, i + batch_size)] for i in range(0, len(order), batch_size)]
+
+    def shuffle_group_order(self):
+        """ Shuffle the order of the shards and images, or the groups if the images are not grouped by shard. """
+        if self.group_method == 'shard':
+            self.group_images()
+        else:
+            super(RecordGenerator, self).shuffle_group_order()
+
+    def load_image(self, image_index):
+        shard = self.index.shard[image_index]
+
+        # only keep the read buffers of the shards that are being read, images can be loaded by several threads
+        with self.shards_lock:
+            if shard not in self.open_shards:
+                self.open_shards.append(shard)
+                if len(self.open_shards) > self.interleave:
+                    self.readers[self.open_shards.popleft()].release()
+
+        offset, length = self.index.offsets[image_index], self.index.lengths[image_index]
+        if self.group_method == 'shard':
+            data = self.readers[shard].read(offset, length, start=self.block_start[image_index], stop=self.block_stop[image_index])
+        else:
+            # images are read in a random order, don't read the rest of their block
+            data = self.readers[shard].read(offset, length, stop=offset + length)
+        return read_image_bgr(io.BytesIO(data))
+
+    def load_annotations(self, image_index):
+        return self.annotation_store[image_index]
@@ -0,0 +1,241 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import io
+import os
+import random
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from ..utils.npz import decode_strings, encode_strings, save_npz
+from .annotation_store import AnnotationStore
+
+# Increase when the layout of the record files changes.
+RECORDS_VERSION = 1
+
+INDEX_NAME = 'index.npz'
+
+
+def shard_name(shard_index):
+    return 'records-{:05d}.rec'.format(shard_index)
+
+
+def _encoded_image(generator, image_index, paths):
+    """ Returns the encoded image file of an image of a generator, re-encoding it as PNG if it is not stored as a file. """
+    if paths is not None:
+        path = paths[image_index]
+    elif hasattr(generator, 'image_path'):
+        path = generator.image_path(image_index)
+    else:
+        path = None
+
+    if path is not None:
+        with open(path, 'rb') as f:
+            return f.read()
+
+    # generators return BGR images, like cv2 expects
+    success, data = cv2.imencode('.png', generator.load_image(image_index))
+    if not success:
+        raise ValueError('Could not encode image {}.'.format(image_index))
+    return data.tobytes()
+
+
+def write_records(generator, directory, shard_size=256 * 2 ** 20, shuffle=True, seed=0, progress=None):
+    """ Pack the images and annotations of a generator into sharded record files.
+
+    The encoded image files are appended, unmodified, to shard files of about shard_size bytes.
+    The annotations, image sizes, class names and the location of every image in the shards are stored in an index
+    next to the shards. The images are written in a random order (if shuffle is set), so a RecordGenerator can read
+    the shards sequentially and only needs to shuffle the images locally.
+
+    Args
+        generator  : Generator providing the images and annotations to pack.
+        directory  : Output directory of the shards and the index.
+        shard_size : Size in bytes after which a new shard is started.
+        shuffle    : Write the images in a random order.
+        seed       : Seed of the random order.
+        progress   : Optional function called with the number of written images after every image.
+
+    Returns
+        The number of shards written.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    order = list(range(generator.size()))
+    if shuffle:
+        random.Random(seed).shuffle(order)
+
+    paths       = generator.image_paths()
+    shards      = []
+    shard       = np.zeros(len(order), dtype=np.int32)
+    offsets     = np.zeros(len(order), dtype=np.int64)
+    lengths     = np.zeros(len(order), dtype=np.int64)
+    image_sizes = np.zeros((len(order), 2), dtype=np.float64)
+    names       = []
+    annotations = []
+
+    output = None
+    try:
+        for i, image_index in enumerate(order):
+            if output is None or output.tell() >= shard_size:
+                if output is not None:
+                    output.close()
+                shards.append(shard_name(len(shards)))
+                output = open(os.path.join(directory, shards[-1]), 'wb')
+
+            data = _encoded_image(generator, image_index, paths)
+
+            shard[i]       = len(shards) - 1
+            offsets[i]     = output.tell()
+            lengths[i]     = len(data)
+            image_sizes[i] = Image.open(io.BytesIO(data)).size
+            output.write(data)
+
+            names.append(os.path.basename(paths[image_index]) if paths is not None else str(image_index))
+            annotations.append([tuple(a) for a in np.asarray(generator.load_annotations(image_index)).reshape(-1, 5)])
+
+            if progress is not None:
+                progress(i + 1)
+    finally:
+        if output is not None:
+            output.close()
+
+    labels      = range(generator.num_classes())
+    class_names = []
+    class_ids   = []
+    for label in labels:
+        try:
+            class_names.append(generator.label_to_name(label))
+            class_ids.append(label)
+        except KeyError:
+            # labels do not have to be contiguous
+            pass
+
+    store                       = AnnotationStore.from_lists(annotations)
+    names_data, names_offsets   = encode_strings(names)
+    shards_data, shards_offsets = encode_strings(shards)
+    class_data, class_offsets   = encode_strings(class_names)
+
+    save_npz(os.path.join(directory, INDEX_NAME), {
+        'version'        : np.array(RECORDS_VERSION),
+        'shards'         : shards_data,
+        'shards_offsets' : shards_offsets,
+        'shard'          : shard,
+        'offsets'        : offsets,
+        'lengths'        : lengths,
+        'image_sizes'    : image_sizes,
+        'names'          : names_data,
+        'names_offsets'  : names_offsets,
+        'boxes'          : store.boxes,
+        'labels'         : store.labels,
+        'box_offsets'    : store.offsets,
+        'class_ids'      : np.array(class_ids, dtype=np.int32),
+        'class_names'    : class_data,
+        'class_offsets'  : class_offsets,
+    })
+
+    return len(shards)
+
+
+class RecordsIndex(object):
+    """ The index of a directory of record files written by write_records. """
+    def __init__(self, directory):
+        path = os.path.join(directory, INDEX_NAME)
+        with np.load(path) as index:
+            version = int(index['version'])
+            if version != RECORDS_VERSION:
+                raise ValueError('Unsupported records version {} in {}, expected {}.'.format(version, path, RECORDS_VERSION))
+
+            self.shards           = [os.path.join(directory, s) for s in decode_strings(index['shards'], index['shards_offsets'])]
+            self.shard            = index['shard']
+            self.offsets          = index['offsets']
+            self.lengths          = index['lengths']
+            self.image_sizes      = index['image_sizes']
+            self.names            = decode_strings(index['names'], index['names_offsets'])
+            self.annotation_store = AnnotationStore(index['boxes'], index['labels'], index['box_offsets'])
+            self.classes          = dict(zip(decode_strings(index['class_names'], index['class_offsets']), index['class_ids'].tolist()))
+
+
+class ShardReader(object):
+    """ Reads records from a shard file through a read buffer.
+
+    By default a read outside the buffer fills the buffer with buffer_size bytes starting at the requested record,
+    so reading the records of a shard in order results in few large sequential reads. The bytes to fill the buffer
+    with can be given per read, for example to only read the record itself when the records are read in random order.
+    The file is opened on first use and again in every (forked) process, open files are not pickled.
+
+    Args
+        path        : Path of the shard file.
+        buffer_size : Size in bytes of the read buffer.
+    """
+    def __init__(self, path, buffer_size=16 * 2 ** 20):
+        self.path         = path
+        self.buffer_size  = int(buffer_size)
+        self.buffer       = b''
+        self.buffer_start = 0
+        self.reads        = 0
+        self.file         = None
+        self.pid          = None
+        self.lock         = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(file=None, pid=None, lock=None, buffer=b'', buffer_start=0)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def release(self):
+        """ Drop the read buffer and close the file, they are recreated by the next read. """
+        with self.lock:
+            self.buffer       = b''
+            self.buffer_start = 0
+            if self.file is not None and self.pid == os.getpid():
+                self.file.close()
+            self.file = None
+
+    def read(self, offset, length, start=None, stop=None):
+        """ Returns length bytes starting at offset.
+
+        Args
+            offset : Offset of the record in the file.
+            length : Length of the record.
+            start  : Offset from which the buffer is filled if the record is not buffered (defaults to offset).
+            stop   : Offset up to which the buffer is filled (defaults to buffer_size bytes after start).
+        """
+        with self.lock:
+            position = offset - self.buffer_start
+            if position < 0 or position + length > len(self.buffer):
+                if self.file is None or self.pid != os.getpid():
+                    self.file = open(self.path, 'rb')
+                    self.pid  = os.getpid()
+
+                start = offset if start is None else min(start, offset)
+                stop  = start + self.buffer_size if stop is None else stop
+
+                self.file.seek(start)
+                self.buffer       = self.file.read(max(stop, offset + length) - start)
+                self.buffer_start = start
+                self.reads       += 1
+                position          = offset - start
+
+            return self.buffer[position:position + length]
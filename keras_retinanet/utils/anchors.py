@@ -14,6 +14,9 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import collections
+import threading
+
 import numpy as np
 
 
@@ -24,18 +27,45 @@ def anchor_targets_bbox(
     mask_shape=None,
     negative_overlap=0.4,
     positive_overlap=0.5,
+    anchor_cache=None,
+    assignment='dense',
     **kwargs
 ):
-    anchors = anchors_for_shape(image_shape, **kwargs)
+    """ Generate anchor targets for bbox detection.
+
+    Args
+        image_shape      : Shape of the (padded) image batch.
+        annotations      : np.array of shape (N, 5) for (x1, y1, x2, y2, label).
+        num_classes      : Number of classes to predict.
+        mask_shape       : If the image is padded with zeros, mask_shape can be used to mark the relevant part of the image.
+        negative_overlap : IoU overlap for negative anchors (all anchors with overlap < negative_overlap are negative).
+        positive_overlap : IoU overlap or positive anchors (all anchors with overlap > positive_overlap are positive).
+        anchor_cache     : Optional AnchorCache used to look up the anchors instead of computing them.
+        assignment       : Either 'dense' (full anchors x annotations IoU matrix) or 'sparse' (only IoU of possibly overlapping pairs).
+
+    Returns
+        labels      : np.array of shape (A, num_classes) where a row consists of 0 for negative and 1 for positive for a certain class.
+        annotations : np.array of shape (A, 5) for (x1, y1, x2, y2, label) containing the annotations corresponding to each anchor.
+        anchors     : np.array of shape (A, 4) for (x1, y1, x2, y2) containing the anchor boxes.
+    """
+    if anchor_cache is not None:
+        anchors = anchor_cache(image_shape, **kwargs)
+    else:
+        anchors = anchors_for_shape(image_shape, **kwargs)
 
     # label: 1 is positive, 0 is negative, -1 is dont care
     labels = np.ones((anchors.shape[0], num_classes)) * -1
 
     if annotations.shape[0]:
         # obtain indices of gt annotations with the greatest overlap
-        overlaps             = compute_overlap(anchors, annotations)
-        argmax_overlaps_inds = np.argmax(overlaps, axis=1)
-        max_overlaps         = overlaps[np.arange(overlaps.shape[0]), argmax_overlaps_inds]
+        if assignment == 'dense':
+            overlaps             = compute_overlap(anchors, annotations)
+            argmax_overlaps_inds = np.argmax(overlaps, axis=1)
+            max_overlaps         = overlaps[np.arange(overlaps.shape[0]), argmax_overlaps_inds]
+        elif assignment == 'sparse':
+            argmax_overlaps_inds, max_overlaps = compute_max_overlap_sparse(anchors, annotations)
+        else:
+            raise ValueError('Invalid anchor assignment method received: {}'.format(assignment))
 
         # assign bg labels first so that positive labels can clobber them
         labels[max_overlaps < negative_overlap, :] = 0
@@ -83,13 +113,58 @@ def layer_shapes(image_shape, model):
     return shape
 
 
-def make_shapes_callback(model):
-    def get_shapes(image_shape, pyramid_levels):
-        shape = layer_shapes(image_shape, model)
-        image_shapes = [shape["P{}".format(level)][1:3] for level in pyramid_levels]
-        return image_shapes
+class ShapesCallback(object):
+    """ Computes the shapes of the pyramid levels for an image shape with the layers of a model.
 
-    return get_shapes
+    The model can not be pickled. When the callback is sent to a worker process it is replaced by a table with the
+    shapes of the pyramid levels for every image side up to max_side, which is computed once. The layers of the
+    backbones treat the rows and columns independently, so one table serves both.
+
+    Args
+        model    : The model to compute the layer shapes with.
+        max_side : Largest image side the callback is used for in worker processes (None if it is never pickled).
+    """
+    def __init__(self, model, max_side=None):
+        self.model    = model
+        self.max_side = max_side
+        self.table    = None
+
+    def __call__(self, image_shape, pyramid_levels):
+        if self.model is not None:
+            shape = layer_shapes(image_shape, self.model)
+            return [shape["P{}".format(level)][1:3] for level in pyramid_levels]
+
+        if max(image_shape[:2]) > self.max_side:
+            raise ValueError('Image shape {} is larger than the largest side of the shapes table ({}).'.format(image_shape, self.max_side))
+        return [self.table[level][list(image_shape[:2])] for level in pyramid_levels]
+
+    def compute_table(self):
+        """ Returns for every pyramid level of the model an array with the size of that level for every image side. """
+        channels = self.model.input_shape[-1]
+        table    = collections.defaultdict(lambda: np.zeros(self.max_side + 1, dtype=int))
+        for side in range(1, self.max_side + 1):
+            shape = layer_shapes((side, side, channels), self.model)
+            for name in shape:
+                if name.startswith('P') and name[1:].isdigit():
+                    table[int(name[1:])][side] = shape[name][1]
+        return dict(table)
+
+    def __getstate__(self):
+        if self.max_side is None:
+            raise TypeError('A ShapesCallback without max_side can not be pickled.')
+        if self.table is None:
+            self.table = self.compute_table()
+        return {'model': None, 'max_side': self.max_side, 'table': self.table}
+
+
+def make_shapes_callback(model, max_side=None):
+    """ Returns a shapes callback that computes the shapes of the pyramid levels with the layers of model.
+
+    Args
+        model    : The model to compute the layer shapes with.
+        max_side : Largest image side, needed to send the callback to worker processes (see ShapesCallback).
+    """
+    return ShapesCallback(model, max_side=max_side)
 
 
 def guess_shapes(image_shape, pyramid_levels):
@@ -130,13 +205,107 @@ def anchors_for_shape(
     image_shapes = shapes_callback(image_shape, pyramid_levels)
 
     # compute anchors over all pyramid levels
-    all_anchors = np.zeros((0, 4))
+    all_anchors = [np.zeros((0, 4))]
     for idx, p in enumerate(pyramid_levels):
         anchors         = generate_anchors(base_size=sizes[idx], ratios=ratios, scales=scales)
         shifted_anchors = shift(image_shapes[idx], strides[idx], anchors)
-        all_anchors     = np.append(all_anchors, shifted_anchors, axis=0)
+        all_anchors.append(shifted_anchors)
 
-    return all_anchors
+    return np.concatenate(all_anchors, axis=0)
+
+
+def _cache_key_part(value):
+    """ Convert an anchor parameter (None, scalar, list or np.ndarray) to something hashable. """
+    if value is None:
+        return None
+    return tuple(np.asarray(value).ravel().tolist())
+
+
+class AnchorCache(object):
+    """ LRU cache for the output of anchors_for_shape.
+
+    Batches grouped by aspect ratio share a handful of padded shapes, so the same anchor grid is requested over and over.
+    The cache is keyed by the image shape, the anchor parameters and the identity of the shapes callback.
+    Cached anchors are returned read-only, since they are shared between calls.
+
+    Args
+        max_size : Maximum number of anchor grids to keep in memory.
+    """
+    def __init__(self, max_size=16):
+        self.max_size = max_size
+        self.hits     = 0
+        self.misses   = 0
+        self._cache   = collections.OrderedDict()
+        self._lock    = threading.Lock()
+
+    def __getstate__(self):
+        # a pickled cache starts empty, locks can not be pickled
+        state = self.__dict__.copy()
+        state.update(_cache=collections.OrderedDict(), _lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __call__(
+        self,
+        image_shape,
+        pyramid_levels=None,
+        ratios=None,
+        scales=None,
+        strides=None,
+        sizes=None,
+        shapes_callback=None,
+    ):
+        key = (
+            tuple(image_shape),
+            _cache_key_part(pyramid_levels),
+            _cache_key_part(ratios),
+            _cache_key_part(scales),
+            _cache_key_part(strides),
+            _cache_key_part(sizes),
+            shapes_callback,
+        )
+
+        with self._lock:
+            anchors = self._cache.pop(key, None)
+            if anchors is not None:
+                # re-insert to mark as most recently used
+                self._cache[key] = anchors
+                self.hits += 1
+                return anchors
+            self.misses += 1
+
+        anchors = anchors_for_shape(
+            image_shape,
+            pyramid_levels=pyramid_levels,
+            ratios=ratios,
+            scales=scales,
+            strides=strides,
+            sizes=sizes,
+            shapes_callback=shapes_callback,
+        )
+        anchors.flags.writeable = False
+
+        with self._lock:
+            self._cache[key] = anchors
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+        return anchors
+
+    def info(self):
+        """ Returns a dict with the number of hits, misses and currently cached anchor grids. """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache)}
+
+    def clear(self):
+        """ Removes all cached anchors and resets the counters. """
+        with self._lock:
+            self._cache.clear()
+            self.hits   = 0
+            self.misses = 0
 
 
 def shift(shape, stride, anchors):
@@ -257,3 +426,115 @@ def compute_overlap(a, b):
     intersection = iw * ih
 
     return intersection / ua
+
+
+def _ranges_to_indices(starts, ends):
+    """ Concatenate np.arange(start, end) for all (start, end) pairs without a Python loop.
+
+    Returns
+        indices : The concatenated ranges.
+        owner   : For every element in indices, the index of the range it came from.
+    """
+    lengths = np.maximum(ends - starts, 0)
+    total   = lengths.sum()
+    owner   = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    indices = np.arange(total) - np.repeat(offsets, lengths) + np.repeat(starts, lengths)
+    return indices, owner
+
+
+def _overlap_candidates(anchors, boxes):
+    """ Find all (anchor, box) pairs whose extents can overlap.
+
+    Anchors are bucketed by size (one or two buckets per pyramid level) and, within a bucket, by the grid cell of their center.
+    For every box only the cells covering the box dilated by half the largest anchor of the bucket can contain overlapping anchors.
+
+    Yields, per bucket
+        anchor_indices : Indices into anchors.
+        box_indices    : Indices into boxes (in ascending order), such that (anchor_indices[i], box_indices[i]) is a candidate pair.
+    """
+    widths   = anchors[:, 2] - anchors[:, 0]
+    heights  = anchors[:, 3] - anchors[:, 1]
+    centers  = np.stack([anchors[:, 0] + anchors[:, 2], anchors[:, 1] + anchors[:, 3]], axis=1) / 2
+    max_side = np.maximum(np.maximum(widths, heights), np.finfo(float).eps)
+    buckets  = np.floor(np.log2(max_side)).astype(int)
+
+    for bucket in np.unique(buckets):
+        bucket_indices = np.where(buckets == bucket)[0]
+        half_w         = widths[bucket_indices].max() / 2
+        half_h         = heights[bucket_indices].max() / 2
+        cell           = max_side[bucket_indices].max() / 4
+
+        # hash anchor centers into grid cells and sort them row major
+        cells_x = np.maximum(np.floor(centers[bucket_indices, 0] / cell).astype(int), 0)
+        cells_y = np.maximum(np.floor(centers[bucket_indices, 1] / cell).astype(int), 0)
+        columns = cells_x.max() + 1
+        rows    = cells_y.max() + 1
+        keys    = cells_y * columns + cells_x
+        order   = np.argsort(keys, kind='mergesort')
+        keys    = keys[order]
+
+        # cell ranges in which an anchor center must lie to possibly overlap a box
+        x_lo = np.clip(np.floor((boxes[:, 0] - half_w) / cell).astype(int), 0, columns - 1)
+        x_hi = np.clip(np.floor((boxes[:, 2] + half_w) / cell).astype(int), 0, columns - 1)
+        y_lo = np.clip(np.floor((boxes[:, 1] - half_h) / cell).astype(int), 0, rows - 1)
+        y_hi = np.clip(np.floor((boxes[:, 3] + half_h) / cell).astype(int), 0, rows - 1)
+
+        # one contiguous slice of the sorted anchors per (box, row) pair
+        row_indices, row_owner = _ranges_to_indices(y_lo, y_hi + 1)
+        starts = np.searchsorted(keys, row_indices * columns + x_lo[row_owner], side='left')
+        ends   = np.searchsorted(keys, row_indices * columns + x_hi[row_owner], side='right')
+
+        sorted_indices, slice_owner = _ranges_to_indices(starts, ends)
+        yield bucket_indices[order[sorted_indices]], row_owner[slice_owner]
+
+
+def compute_max_overlap_sparse(anchors, boxes):
+    """ Compute for every anchor the box with the highest IoU, without materializing the (N, K) overlap matrix.
+
+    IoU values are only computed for anchor / box pairs whose extents can overlap.
+    The result is identical to np.argmax / np.max over the rows of compute_overlap(anchors, boxes).
+
+    Parameters
+    ----------
+    anchors: (N, 4) ndarray of float
+    boxes: (K, 4) ndarray of float
+    Returns
+    -------
+    argmax_overlaps: (N,) ndarray of int, index of the box with the highest overlap for each anchor
+    max_overlaps: (N,) ndarray of float, the highest overlap for each anchor
+    """
+    argmax_overlaps = np.zeros((anchors.shape[0],), dtype=np.int64)
+    max_overlaps    = np.zeros((anchors.shape[0],))
+
+    for anchor_indices, box_indices in _overlap_candidates(anchors, boxes):
+        a = anchors[anchor_indices]
+        b = boxes[box_indices]
+
+        # same operations (and order) as compute_overlap, applied pairwise
+        area = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+
+        iw = np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0])
+        ih = np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1])
+
+        iw = np.maximum(iw, 0)
+        ih = np.maximum(ih, 0)
+
+        ua = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1]) + area - iw * ih
+
+        ua = np.maximum(ua, np.finfo(float).eps)
+
+        overlaps = (iw * ih) / ua
+
+        # boxes are visited in ascending order and only strictly higher overlaps are kept,
+        # so ties resolve to the lowest box index, like np.argmax
+        bounds = np.searchsorted(box_indices, np.arange(boxes.shape[0] + 1))
+        for box_index in range(boxes.shape[0]):
+            indices = anchor_indices[bounds[box_index]:bounds[box_index + 1]]
+            values  = overlaps[bounds[box_index]:bounds[box_index + 1]]
+            better  = values > max_overlaps[indices]
+
+            max_overlaps[indices[better]]    = values[better]
+            argmax_overlaps[indices[better]] = box_index
+
+    return argmax_overlaps, max_overlaps
@@ -0,0 +1,71 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import functools
+
+import numpy as np
+
+from .anchors import anchor_targets_bbox, make_shapes_callback
+
+
+def list_callbacks(parse):
+    """ Parse a comma separated list of python expressions (for example '2 ** 0, 2 ** 0.5') into an array. """
+    return np.array([eval(s) for s in parse.split(',')])
+
+
+def add_generator_args(parser):
+    """ Add the arguments that the generators read (preprocessing, pyramid levels and anchors) to parser.
+
+    Returns
+        The parser.
+    """
+    parser.add_argument('--remove-mean', dest='mean', help='Preprocessing : remove mean, default False', default='False')
+    parser.add_argument('--normalize', dest='norm', help='Preprocessing : normalize image, if 1 then value = [0, 1], if -1 then value = [-1, 1] else no normalization', type=int, default=0)
+    parser.add_argument('--use-P2', dest='P2', help='Use P2 layer (more consuming) for training and testing in the FPN (only for resnet).', action='store_true')
+    parser.add_argument('--scale', help='list of the scale use in the network.', type=list_callbacks, default='2 ** 0, 2 ** (1.0 / 3.0), 2 ** (2.0 / 3.0)')
+    parser.add_argument('--ratio', help='list of the ratio use in the network.', type=list_callbacks, default='0.5, 1, 2')
+    return parser
+
+
+def set_pyramid_args(parsed_args):
+    """ Set the pyramid levels and the anchor strides and sizes, which depend on the --use-P2 argument. """
+    parsed_args.pyramid_levels = [2, 3, 4, 5, 6, 7] if parsed_args.P2 else [3, 4, 5, 6, 7]
+    parsed_args.stride = [2 ** x for x in parsed_args.pyramid_levels]
+    parsed_args.size = [2 ** (x + 2) for x in parsed_args.pyramid_levels]
+    return parsed_args
+
+
+def configure_anchor_targets(generators, args, model=None):
+    """ Set the anchor target computation of the generators according to the arguments.
+
+    Args
+        generators : List of generators, None entries are skipped.
+        args       : Parsed arguments, uses backbone and sparse_assignment.
+        model      : The model, used to compute the backbone layer shapes of vgg and densenet (skipped if None).
+    """
+    anchor_targets_kwargs = {}
+    if model is not None and ('vgg' in args.backbone or 'densenet' in args.backbone):
+        max_side = max(generator.image_max_side for generator in generators if generator is not None)
+        anchor_targets_kwargs['shapes_callback'] = make_shapes_callback(model, max_side=max_side)
+    if args.sparse_assignment:
+        anchor_targets_kwargs['assignment'] = 'sparse'
+    if not anchor_targets_kwargs:
+        return
+
+    compute_anchor_targets = functools.partial(anchor_targets_bbox, **anchor_targets_kwargs)
+    for generator in generators:
+        if generator is not None:
+            generator.compute_anchor_targets = compute_anchor_targets
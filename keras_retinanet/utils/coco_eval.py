@@ -18,62 +18,135 @@ from __future__ import print_function
 
 from pycocotools.cocoeval import COCOeval
 
-import numpy as np
-import json
+from .eval import BackgroundWriter, predict_images
 
+import json
+import numpy as np
+import os
+
+
+def _coco_results(image_id, boxes, scores, labels, coco_labels, threshold):
+    """ Convert the detections of one image to rows of (image_id, x, y, w, h, score, category_id).
+
+    Args
+        image_id    : The COCO id of the image.
+        boxes       : Array of shape (D, 4) with the (x1, y1, x2, y2) of the detections.
+        scores      : Array of shape (D,) with the scores of the detections.
+        labels      : Array of shape (D,) with the labels of the detections.
+        coco_labels : Array mapping labels to COCO category ids.
+        threshold   : The score threshold to use.
+
+    Returns
+        An array of shape (n, 7), the format accepted by COCO.loadRes.
+    """
+    keep   = scores >= threshold
+    boxes  = boxes[keep]
+
+    # change to (x, y, w, h) (MS COCO standard)
+    results       = np.empty((boxes.shape[0], 7))
+    results[:, 0] = image_id
+    results[:, 1] = boxes[:, 0]
+    results[:, 2] = boxes[:, 1]
+    results[:, 3] = boxes[:, 2] - boxes[:, 0]
+    results[:, 4] = boxes[:, 3] - boxes[:, 1]
+    results[:, 5] = scores[keep]
+    results[:, 6] = coco_labels[labels[keep]]
+    return results
+
+
+def _write_json_rows(f, rows, first):
+    """ Append rows of (image_id, x, y, w, h, score, category_id) to a JSON list of COCO results, without whitespace. """
+    for row in rows.tolist():
+        if not first:
+            f.write(',')
+        first = False
+        f.write('{{"image_id":{},"category_id":{},"bbox":[{!r},{!r},{!r},{!r}],"score":{!r}}}'.format(
+            int(row[0]), int(row[6]), row[1], row[2], row[3], row[4], row[5]
+        ))
+
+
+class _JsonResultsWriter(object):
+    """ Streams COCO results to a compact JSON file from a background thread, while the model runs.
+
+    Args
+        path : Path of the JSON file.
+    """
+    def __init__(self, path):
+        self.file   = open(path, 'w')
+        self.first  = True
+        self.writer = BackgroundWriter()
+        self.file.write('[')
+
+    def _write(self, rows):
+        _write_json_rows(self.file, rows, self.first)
+        self.first = self.first and rows.shape[0] == 0
+
+    def write(self, rows):
+        self.writer.submit(self._write, rows)
+
+    def close(self):
+        try:
+            self.writer.close()
+            self.file.write(']')
+        finally:
+            self.file.close()
+
+
+def evaluate_coco(generator, model, threshold=0.05, batch_size=1, prefetch=0, results_path=None):
+    """ Use the pycocotools to evaluate a COCO model on a dataset.
+
+    Detections are collected in one preallocated (N, 7) array, which is passed to COCO.loadRes directly.
+
+    Args
+        generator    : The generator for generating the evaluation data.
+        model        : The model to evaluate.
+        threshold    : The score threshold to use.
+        batch_size   : Number of images per prediction (see utils.eval.predict_images).
+        prefetch     : Number of batches loaded ahead by a pool of threads, while the model runs.
+        results_path : If given, the results are also written to this file in the COCO results format (compact JSON),
+                       from a background thread while the model runs. The ids of the evaluated images are written to
+                       <results_path without extension>_image_ids.json.
+    """
+    coco_labels = np.array([generator.label_to_coco_label(label) for label in range(generator.num_classes())])
+    writer      = _JsonResultsWriter(results_path) if results_path else None
 
-def evaluate_coco(generator, model, threshold=0.05):
     # start collecting results
-    results = []
+    results   = None
+    count     = 0
     image_ids = []
-    for index in range(generator.size()):
-        image = generator.load_image(index)
-        image = generator.preprocess_image(image)
-        image, scale = generator.resize_image(image)
-
-        # run network
-        boxes, scores, labels = model.predict_on_batch(np.expand_dims(image, axis=0))
-
-        # correct boxes for image scale
-        boxes /= scale
-
-        # change to (x, y, w, h) (MS COCO standard)
-        boxes[:, :, 2] -= boxes[:, :, 0]
-        boxes[:, :, 3] -= boxes[:, :, 1]
-
-        # compute predicted labels and scores
-        for box, score, label in zip(boxes[0], scores[0], labels[0]):
-            # scores are sorted, so we can break
-            if score < threshold:
-                break
-
-            # append detection for each positively labeled class
-            image_result = {
-                'image_id'    : generator.image_ids[index],
-                'category_id' : generator.label_to_coco_label(label),
-                'score'       : float(score),
-                'bbox'        : box.tolist(),
-            }
-
-            # append detection to results
-            results.append(image_result)
-
-        # append image to list of processed images
-        image_ids.append(generator.image_ids[index])
-
-        # print progress
-        print('{}/{}'.format(index + 1, generator.size()), end='\r')
-
-    if not len(results):
+    try:
+        predictions = predict_images(generator, model, batch_size=batch_size, prefetch=prefetch)
+        for progress, (index, _, boxes, scores, labels) in enumerate(predictions):
+            image_results = _coco_results(generator.image_ids[index], boxes[0], scores[0], labels[0], coco_labels, threshold)
+
+            # every image has at most as many detections as the model outputs
+            if results is None:
+                results = np.empty((generator.size() * boxes.shape[1], 7))
+            results[count:count + image_results.shape[0]] = image_results
+            count += image_results.shape[0]
+
+            if writer is not None:
+                writer.write(image_results)
+
+            # append image to list of processed images
+            image_ids.append(generator.image_ids[index])
+
+            # print progress
+            print('{}/{}'.format(progress + 1, generator.size()), end='\r')
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if results_path:
+        with open(os.path.splitext(results_path)[0] + '_image_ids.json', 'w') as f:
+            json.dump(image_ids, f)
+
+    if not count:
         return
 
-    # write output
-    json.dump(results, open('{}_bbox_results.json'.format(generator.set_name), 'w'), indent=4)
-    json.dump(image_ids, open('{}_processed_image_ids.json'.format(generator.set_name), 'w'), indent=4)
-
     # load results in COCO evaluation tool
     coco_true = generator.coco
-    coco_pred = coco_true.loadRes('{}_bbox_results.json'.format(generator.set_name))
+    coco_pred = coco_true.loadRes(results[:count])
 
     # run COCO evaluation
     coco_eval = COCOeval(coco_true, coco_pred, 'bbox')
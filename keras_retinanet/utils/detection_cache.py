@@ -0,0 +1,208 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import hashlib
+import json
+import os
+import warnings
+
+import numpy as np
+
+from .npz import save_npz
+
+# Increase when the layout of the cache file changes, to invalidate existing cache files.
+CACHE_VERSION = 1
+
+
+def weights_hash(model):
+    """ Hash of the shapes, dtypes and values of all weights of a model. """
+    sha1 = hashlib.sha1()
+    for weight in model.get_weights():
+        weight = np.ascontiguousarray(weight)
+        sha1.update('{}:{}|'.format(weight.shape, weight.dtype.str).encode('utf-8'))
+        sha1.update(weight.tobytes())
+    return sha1.hexdigest()
+
+
+def config_hash(model):
+    """ Hash of the configuration of a model, which includes the settings of its layers (for example FilterDetections). """
+    config = json.dumps(model.get_config(), sort_keys=True, default=str)
+    return hashlib.sha1(config.encode('utf-8')).hexdigest()
+
+
+def dataset_hash(generator):
+    """ Hash identifying the images of a dataset.
+
+    This is the list of image paths if the generator returns them, otherwise the paths, sizes and modification times
+    of the files returned by generator.dataset_files.
+
+    Returns
+        The hash, or None if the generator does not identify its images.
+    """
+    paths = generator.image_paths()
+    if paths is not None:
+        return hashlib.sha1('\n'.join(paths).encode('utf-8')).hexdigest()
+
+    files = generator.dataset_files()
+    if files is None:
+        return None
+
+    sha1 = hashlib.sha1()
+    for path in files:
+        stat = os.stat(path)
+        sha1.update('{}:{}:{}\n'.format(os.path.abspath(path), stat.st_size, stat.st_mtime).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def detection_cache_key(model, generator, batch_size=1):
+    """ Key of the detections of a model on a dataset.
+
+    Next to the weights and the configuration of the model, the key includes everything that changes the raw detections:
+    the dataset (its size and the identity of its images), the preprocessing and size of the images and the batch
+    size (padding).
+
+    Returns
+        The key, or None if the generator does not identify its images (see dataset_hash), so the detections can not be cached.
+    """
+    dataset = dataset_hash(generator)
+    if dataset is None:
+        return None
+
+    parts = [
+        'v{}'.format(CACHE_VERSION),
+        weights_hash(model),
+        config_hash(model),
+        type(generator).__name__,
+        str(generator.size()),
+        dataset,
+        str(getattr(generator, 'image_min_side', None)),
+        str(getattr(generator, 'image_max_side', None)),
+        str(getattr(generator, 'mean', None)),
+        str(getattr(generator, 'normalize', None)),
+        str(getattr(generator, 'preprocess_in_model', None)),
+        str(batch_size),
+    ]
+
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+class DetectionCache(object):
+    """ On-disk cache of the raw detections of a model on every image of a dataset.
+
+    All detections are stored columnar in one file: boxes (N, 4) float32, scores (N,) float32 and labels (N,) int32,
+    where the detections of image i are the rows offsets[i]:offsets[i + 1]. A per-image mask records which images
+    were computed, so an interrupted evaluation only computes the remaining images when it runs again.
+    Detections are stored before applying a score threshold or limiting the number of detections,
+    so those can be changed without running the model again.
+
+    Args
+        path       : Path of the cache file.
+        key        : Key of the model and dataset (see detection_cache_key), a file with a different key is ignored.
+        num_images : Number of images in the dataset.
+    """
+    def __init__(self, path, key, num_images):
+        self.path       = path
+        self.key        = key
+        self.num_images = num_images
+        self.boxes      = [None] * num_images
+        self.scores     = [None] * num_images
+        self.labels     = [None] * num_images
+        self.modified   = False
+        self.load()
+
+    @classmethod
+    def for_model(cls, directory, model, generator, batch_size=1):
+        """ Create the cache of a model on a dataset, stored in directory as <key>.npz.
+
+        Returns None, with a warning, if the detections on the dataset can not be cached (see detection_cache_key).
+        """
+        key = detection_cache_key(model, generator, batch_size=batch_size)
+        if key is None:
+            warnings.warn('Not caching detections, {} does not identify the images of its dataset.'.format(type(generator).__name__))
+            return None
+        return cls(os.path.join(directory, key + '.npz'), key, generator.size())
+
+    def load(self):
+        """ Load the detections of the cache file, if it exists and matches the key. """
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with np.load(self.path) as cache:
+                if str(cache['key']) != self.key or cache['computed'].shape[0] != self.num_images:
+                    return
+
+                boxes    = cache['boxes']
+                scores   = cache['scores']
+                labels   = cache['labels']
+                offsets  = cache['offsets']
+                computed = cache['computed']
+        except Exception as e:
+            warnings.warn('Ignoring unreadable detection cache {}: {}'.format(self.path, e))
+            return
+
+        for i in np.where(computed)[0]:
+            start, end     = offsets[i], offsets[i + 1]
+            self.boxes[i]  = boxes[start:end]
+            self.scores[i] = scores[start:end]
+            self.labels[i] = labels[start:end]
+
+    def save(self):
+        """ Write all detections to the cache file. Failing to write the cache only raises a warning. """
+        computed = np.array([b is not None for b in self.boxes], dtype=bool)
+        counts   = [0 if b is None else b.shape[0] for b in self.boxes]
+
+        def concatenate(items, shape, dtype):
+            return np.concatenate([np.zeros(shape, dtype=dtype)] + [i for i in items if i is not None]).astype(dtype)
+
+        arrays = {
+            'key'      : np.array(self.key),
+            'boxes'    : concatenate(self.boxes, (0, 4), np.float32),
+            'scores'   : concatenate(self.scores, (0,), np.float32),
+            'labels'   : concatenate(self.labels, (0,), np.int32),
+            'offsets'  : np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]),
+            'computed' : computed,
+        }
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            save_npz(self.path, arrays)
+            self.modified = False
+        except (IOError, OSError) as e:
+            warnings.warn('Could not write detection cache {}: {}'.format(self.path, e))
+
+    def missing(self):
+        """ Returns the indices of the images without cached detections. """
+        return [i for i, b in enumerate(self.boxes) if b is None]
+
+    def __contains__(self, image_index):
+        return self.boxes[image_index] is not None
+
+    def __getitem__(self, image_index):
+        """ Returns the (boxes, scores, labels) of an image. """
+        return self.boxes[image_index], self.scores[image_index], self.labels[image_index]
+
+    def __setitem__(self, image_index, detections):
+        """ Store the (boxes, scores, labels) of an image. Padding detections (with a negative label) are dropped. """
+        boxes, scores, labels = detections
+        keep = np.asarray(labels).reshape(-1) >= 0
+
+        self.boxes[image_index]  = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)[keep]
+        self.scores[image_index] = np.asarray(scores, dtype=np.float32).reshape(-1)[keep]
+        self.labels[image_index] = np.asarray(labels, dtype=np.int32).reshape(-1)[keep]
+        self.modified = True
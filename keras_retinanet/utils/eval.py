@@ -17,17 +17,23 @@ limitations under the License.
 from __future__ import print_function
 
 from .anchors import compute_overlap
+from .detection_cache import DetectionCache
+from .processes import get_context
 from .visualization import draw_detections, draw_annotations
 
+import collections
+import multiprocessing
 import numpy as np
 import os
+import threading
+from multiprocessing.pool import ThreadPool
+from six.moves import queue
 
 import cv2
 
 # tensorboard
 import io
 from PIL import Image
-import tensorflow as tf
 
 def TensorboardImage(writer, image, number=0, step=0, channel=None):
     '''
@@ -35,6 +41,8 @@ def TensorboardImage(writer, image, number=0, step=0, channel=None):
         images : image OPENCV format.  we cast in uint8 because need for tensorboard buffer format.
         
     '''
+    # imported here, so the worker processes of compute_average_precisions do not import tensorflow
+    import tensorflow as tf
     
 
     height, width, c = image.shape
@@ -79,6 +87,10 @@ def TensorboardImage(writer, image, number=0, step=0, channel=None):
         summary =  tf.Summary(value=[tf.Summary.Value(tag='image_'+str(number)+'_channel_'+str(channel), image=img )])
         writer.add_summary(summary, step)
 
+# IoU thresholds of the COCO metric, mAP@[.5:.95] is the mean average precision over these thresholds
+COCO_IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
 def _compute_ap(recall, precision):
     """ Compute the average precision, given the recall and precision curves.
 
@@ -108,7 +120,187 @@ def _compute_ap(recall, precision):
     return ap
 
 
-def _get_detections(generator, model, score_threshold=0.05, max_detections=100, save_path=None, writer=None, steps=0, number=0, separate_channels=False):
+def _load_batch(generator, group):
+    """ Load (through the image cache of the generator), preprocess and resize the images of a group and pad them into one batch.
+
+    # Returns
+        A tuple (raw_images, inputs, image_shapes, scales).
+        The raw image is None for images that were resized before they were cached.
+    """
+    raw_images = []
+    images     = []
+    scales     = []
+    for i in group:
+        raw_image, cache_scale = generator.load_cached_image(i)
+        image        = generator.preprocess_image(raw_image.copy())
+        image, scale = generator.resize_image(image)
+        images.append(image)
+        scales.append(scale * cache_scale)
+
+        # images resized before caching are not suitable for drawing the detections on, those are loaded again if needed
+        raw_images.append(raw_image if cache_scale == 1 else None)
+
+    return raw_images, generator.compute_inputs(images), [image.shape for image in images], scales
+
+
+def _load_batches(generator, groups, prefetch=0):
+    """ Yields the result of _load_batch for every group in order.
+
+    With prefetch > 0, a pool of prefetch threads loads up to prefetch batches ahead, while the caller runs the model.
+    """
+    if prefetch <= 0:
+        for group in groups:
+            yield _load_batch(generator, group)
+        return
+
+    pool    = ThreadPool(prefetch)
+    pending = collections.deque()
+    groups  = iter(groups)
+    try:
+        while True:
+            # keep up to prefetch batches in flight
+            while len(pending) < prefetch:
+                group = next(groups, None)
+                if group is None:
+                    break
+                pending.append(pool.apply_async(_load_batch, (generator, group)))
+
+            if not pending:
+                break
+
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def predict_images(generator, model, batch_size=1, prefetch=0, image_indices=None):
+    """ Run the model on all images of the generator, batch_size images at a time.
+
+    With batch_size > 1 the images are grouped by aspect ratio (see Generator.compute_groups) to limit padding,
+    padded into one batch (see Generator.compute_inputs) and the boxes are clipped to the size of every image.
+    Note that detections close to the image border can differ slightly from unbatched predictions due to the padding.
+
+    # Arguments
+        generator  : The generator used to load and preprocess the images.
+        model      : The inference model to run on the images, returning (boxes, scores, labels).
+        batch_size : Number of images per prediction.
+        prefetch   : Number of batches that are loaded and preprocessed ahead by a pool of threads, while the model runs.
+        image_indices : Indices of the images to run the model on, defaults to all images.
+    # Returns
+        A generator of tuples (image_index, raw_image, boxes, scores, labels) for every image, in batch order.
+        The boxes, scores and labels have a batch dimension of 1 and the boxes are scaled to the raw image.
+    """
+    if image_indices is None:
+        image_indices = list(range(generator.size()))
+    else:
+        image_indices = list(image_indices)
+
+    if batch_size > 1:
+        ratios = generator.image_aspect_ratios()
+        image_indices.sort(key=lambda x: ratios[x])
+    groups = [image_indices[i:i + batch_size] for i in range(0, len(image_indices), batch_size)]
+
+    for group, (raw_images, inputs, image_shapes, scales) in zip(groups, _load_batches(generator, groups, prefetch=prefetch)):
+        # run network
+        boxes, scores, labels = model.predict_on_batch(inputs)
+
+        for j, image_index in enumerate(group):
+            image_boxes = boxes[j:j + 1]
+
+            # clip boxes to the image, instead of to the padded batch
+            if len(group) > 1:
+                image_boxes[..., 0::2] = np.clip(image_boxes[..., 0::2], 0, image_shapes[j][1])
+                image_boxes[..., 1::2] = np.clip(image_boxes[..., 1::2], 0, image_shapes[j][0])
+
+            # correct boxes for image scale
+            image_boxes /= scales[j]
+
+            yield image_index, raw_images[j], image_boxes, scores[j:j + 1], labels[j:j + 1]
+
+
+class BackgroundWriter(object):
+    """ Runs tasks (drawing detections, encoding and writing images) in a background thread, so they do not block inference.
+
+    # Arguments
+        max_pending : Maximum number of queued tasks, submit blocks when the queue is full.
+    """
+    def __init__(self, max_pending=16):
+        self.queue  = queue.Queue(max_pending)
+        self.error  = None
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                break
+
+            # keep consuming after an error, so submit never blocks
+            if self.error is None:
+                try:
+                    task[0](*task[1:])
+                except Exception as e:
+                    self.error = e
+
+    def submit(self, function, *args):
+        self.queue.put((function,) + args)
+
+    def close(self):
+        """ Wait for all submitted tasks to finish, re-raising the first error of a task. """
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def _draw_image(generator, i, raw_image, image_boxes, image_scores, image_labels, save_path, writer, steps, separate_channels):
+    """ Draw the annotations and detections of an image and write it to save_path or to TensorBoard. """
+    if raw_image is None:
+        raw_image = generator.load_image(i)
+    elif not raw_image.flags.writeable:
+        # images from the image cache are shared
+        raw_image = raw_image.copy()
+
+    if save_path is not None: # testing
+        draw_annotations(raw_image, generator.load_annotations(i), label_to_name=generator.label_to_name)
+        draw_detections(raw_image, image_boxes, image_scores, image_labels, label_to_name=generator.label_to_name)
+        cv2.imwrite(os.path.join(save_path, '{}.png'.format(i)), raw_image)
+    elif separate_channels: # training
+        _, _, channel = raw_image.shape
+        for chan in range(0, channel):
+            img = np.repeat(np.expand_dims(raw_image[:,:,chan], axis=2), 3, axis=2)
+            draw_annotations(img, generator.load_annotations(i), label_to_name=generator.label_to_name)
+            draw_detections(img, image_boxes, image_scores, image_labels, label_to_name=generator.label_to_name)
+            TensorboardImage(writer=writer, image=img, number=i, step=steps, channel=chan)
+    else:
+        draw_annotations(raw_image, generator.load_annotations(i), label_to_name=generator.label_to_name)
+        draw_detections(raw_image, image_boxes, image_scores, image_labels, label_to_name=generator.label_to_name)
+        TensorboardImage(writer=writer, image=raw_image, number=i, step=steps, channel=None)
+
+
+def _select_detections(boxes, scores, labels, score_threshold, max_detections):
+    """ Select the max_detections highest scoring detections above score_threshold, of a single image.
+
+    # Returns
+        A tuple (boxes, scores, labels) of the selected detections, sorted by decreasing score.
+    """
+    # select indices which have a score above the threshold
+    indices = np.where(scores > score_threshold)[0]
+
+    # select those scores
+    scores = scores[indices]
+
+    # find the order with which to sort the scores
+    scores_sort = np.argsort(-scores)[:max_detections]
+
+    # select detections
+    return boxes[indices[scores_sort], :], scores[scores_sort], labels[indices[scores_sort]]
+
+
+def _get_detections(generator, model, score_threshold=0.05, max_detections=100, save_path=None, writer=None, steps=0, number=0, separate_channels=False, batch_size=1, prefetch=0, cache_dir=None):
     """ Get the detections from the model using the generator.
 
     The result is a list of lists such that the size is:
@@ -120,64 +312,64 @@ def _get_detections(generator, model, score_threshold=0.05, max_detections=100,
         score_threshold : The score confidence threshold to use.
         max_detections  : The maximum number of detections to use per image.
         save_path       : The path to save the images with visualized detections to.
+        batch_size      : Number of images per prediction (see predict_images).
+        prefetch        : Number of batches loaded ahead by a pool of threads (see predict_images).
+        cache_dir       : Directory of the detection caches (see utils.detection_cache.DetectionCache).
+                          The model only runs on the images without cached detections.
     # Returns
         A list of lists containing the detections for each image in the generator.
     """
-    all_detections = [[None for i in range(generator.num_classes())] for j in range(generator.size())]
+    all_detections    = [[None for i in range(generator.num_classes())] for j in range(generator.size())]
+    cache             = DetectionCache.for_model(cache_dir, model, generator, batch_size=batch_size) if cache_dir else None
+    background_writer = BackgroundWriter()
 
-    for i in range(generator.size()):
-        raw_image    = generator.load_image(i)
-        image        = generator.preprocess_image(raw_image.copy())
-        image, scale = generator.resize_image(image)
-
-        # run network
-        boxes, scores, labels = model.predict_on_batch(np.expand_dims(image, axis=0))
-
-        # correct boxes for image scale
-        boxes /= scale
-
-        # select indices which have a score above the threshold
-        indices = np.where(scores[0, :] > score_threshold)[0]
-
-        # select those scores
-        scores = scores[0][indices]
-
-        # find the order with which to sort the scores
-        scores_sort = np.argsort(-scores)[:max_detections]
-
-        # select detections
-        image_boxes      = boxes[0, indices[scores_sort], :]
-        image_scores     = scores[scores_sort]
-        image_labels     = labels[0, indices[scores_sort]]
+    def add_detections(i, raw_image, boxes, scores, labels):
+        image_boxes, image_scores, image_labels = _select_detections(boxes, scores, labels, score_threshold, max_detections)
         image_detections = np.concatenate([image_boxes, np.expand_dims(image_scores, axis=1), np.expand_dims(image_labels, axis=1)], axis=1)
 
-        if save_path is not None: # testing 
-            draw_annotations(raw_image, generator.load_annotations(i), label_to_name=generator.label_to_name)
-            draw_detections(raw_image, image_boxes, image_scores, image_labels, label_to_name=generator.label_to_name)
-            cv2.imwrite(os.path.join(save_path, '{}.png'.format(i)), raw_image)
-        else: # training
-            if writer is not None and i<number:
-                if separate_channels:
-                    _, _, channel = raw_image.shape
-                    for chan in range(0, channel):
-                        img = np.repeat(np.expand_dims(raw_image[:,:,chan], axis=2), 3, axis=2)
-                        draw_annotations(img, generator.load_annotations(i), label_to_name=generator.label_to_name)
-                        draw_detections(img, image_boxes, image_scores, image_labels, label_to_name=generator.label_to_name)
-                        TensorboardImage(writer=writer, image=img, number=i, step=steps, channel=chan)
-                else:
-                    draw_annotations(raw_image, generator.load_annotations(i), label_to_name=generator.label_to_name)
-                    draw_detections(raw_image, image_boxes, image_scores, image_labels, label_to_name=generator.label_to_name)
-                    TensorboardImage(writer=writer, image=raw_image, number=i, step=steps, channel=None)
+        # drawing and writing images happens in a background thread
+        if save_path is not None or (writer is not None and i < number):
+            background_writer.submit(_draw_image, generator, i, raw_image, image_boxes, image_scores, image_labels, save_path, writer, steps, separate_channels)
 
         # copy detections to all_detections
         for label in range(generator.num_classes()):
             all_detections[i][label] = image_detections[image_detections[:, -1] == label, :-1]
 
-        print('{}/{}'.format(i + 1, generator.size()), end='\r')
+    image_indices = None
+    num_cached    = 0
+    if cache is not None:
+        image_indices = cache.missing()
+        num_cached    = generator.size() - len(image_indices)
+        for i in range(generator.size()):
+            if i in cache:
+                add_detections(i, None, *cache[i])
+
+    try:
+        predictions = predict_images(generator, model, batch_size=batch_size, prefetch=prefetch, image_indices=image_indices)
+        for progress, (i, raw_image, boxes, scores, labels) in enumerate(predictions):
+            if cache is not None:
+                cache[i] = (boxes[0], scores[0], labels[0])
+                boxes, scores, labels = cache[i]
+            else:
+                boxes, scores, labels = boxes[0], scores[0], labels[0]
+
+            add_detections(i, raw_image, boxes, scores, labels)
+
+            print('{}/{}'.format(num_cached + progress + 1, generator.size()), end='\r')
+    finally:
+        # keep the detections computed so far, also when evaluation is interrupted
+        if cache is not None and cache.modified:
+            cache.save()
+        background_writer.close()
 
     return all_detections
 
 
+def _split_annotations(annotations, num_classes):
+    """ Split the (N, 5) annotations of an image into a list with the (n, 4) annotations of every class. """
+    return [annotations[annotations[:, 4] == label, :4].copy() for label in range(num_classes)]
+
+
 def _get_annotations(generator):
     """ Get the ground truth annotations from the generator.
 
@@ -189,21 +381,204 @@ def _get_annotations(generator):
     # Returns
         A list of lists containing the annotations for each image in the generator.
     """
-    all_annotations = [[None for i in range(generator.num_classes())] for j in range(generator.size())]
+    all_annotations = [None for j in range(generator.size())]
 
     for i in range(generator.size()):
-        # load the annotations
-        annotations = generator.load_annotations(i)
-
-        # copy detections to all_annotations
-        for label in range(generator.num_classes()):
-            all_annotations[i][label] = annotations[annotations[:, 4] == label, :4].copy()
+        # load the annotations and split them per class
+        all_annotations[i] = _split_annotations(generator.load_annotations(i), generator.num_classes())
 
         print('{}/{}'.format(i + 1, generator.size()), end='\r')
 
     return all_annotations
 
 
+def _match_detections(detections, annotations, iou_threshold):
+    """ Greedily match the detections of one class in one image to the annotations of that class.
+
+    Detections are processed in the given order. A detection is a true positive if the annotation it overlaps most with
+    has an IoU of at least iou_threshold and was not matched by an earlier detection, otherwise it is a false positive.
+    The IoU of all detection / annotation pairs is computed once, also when matching at several IoU thresholds.
+
+    # Arguments
+        detections    : Array of shape (D, 4 + ...) with the (x1, y1, x2, y2, ...) of the detections.
+        annotations   : Array of shape (A, 4) with the (x1, y1, x2, y2) of the annotations.
+        iou_threshold : The threshold used to consider when a detection is positive or negative, or a list of T thresholds.
+    # Returns
+        A tuple (true_positives, false_positives) of arrays of shape (D,) holding 1 or 0 for every detection.
+        The arrays have shape (T, D) if iou_threshold is a list.
+    """
+    thresholds     = np.atleast_1d(iou_threshold)
+    true_positives = np.zeros((thresholds.shape[0], detections.shape[0]))
+
+    if detections.shape[0] and annotations.shape[0]:
+        overlaps             = compute_overlap(detections, annotations)
+        assigned_annotations = np.argmax(overlaps, axis=1)
+        max_overlaps         = overlaps[np.arange(detections.shape[0]), assigned_annotations]
+
+        for t, threshold in enumerate(thresholds):
+            # only the first detection (in order) above the threshold for an annotation is a true positive
+            candidates = np.where(max_overlaps >= threshold)[0]
+            if candidates.shape[0] > 1:
+                _, first   = np.unique(assigned_annotations[candidates], return_index=True)
+                candidates = candidates[first]
+            true_positives[t, candidates] = 1
+
+    if np.ndim(iou_threshold) == 0:
+        true_positives = true_positives[0]
+
+    return true_positives, 1 - true_positives
+
+
+def _average_precision(detections, annotations, iou_threshold):
+    """ Compute the average precision of a single class.
+
+    # Arguments
+        detections    : List with the (num_detections, 5) detections of this class for every image.
+        annotations   : List with the (num_annotations, 4) annotations of this class for every image.
+        iou_threshold : The threshold used to consider when a detection is positive or negative, or a list of T thresholds.
+    # Returns
+        The average precision, 0 if there are no annotations of this class.
+        An array of shape (T,) with the average precision at every threshold if iou_threshold is a list.
+    """
+    thresholds      = np.atleast_1d(iou_threshold)
+    false_positives = [np.zeros((thresholds.shape[0], 0))]
+    true_positives  = [np.zeros((thresholds.shape[0], 0))]
+    scores          = [np.zeros((0,))]
+    num_annotations = 0.0
+
+    for image_detections, image_annotations in zip(detections, annotations):
+        num_annotations += image_annotations.shape[0]
+
+        image_true_positives, image_false_positives = _match_detections(image_detections, image_annotations, thresholds)
+        true_positives.append(image_true_positives)
+        false_positives.append(image_false_positives)
+        scores.append(image_detections[:, 4])
+
+    false_positives = np.concatenate(false_positives, axis=1)
+    true_positives  = np.concatenate(true_positives, axis=1)
+    scores          = np.concatenate(scores)
+
+    # no annotations -> AP for this class is 0 (is this correct?)
+    if num_annotations == 0:
+        return 0 if np.ndim(iou_threshold) == 0 else np.zeros(thresholds.shape)
+
+    # sort by score
+    indices         = np.argsort(-scores)
+    false_positives = false_positives[:, indices]
+    true_positives  = true_positives[:, indices]
+
+    # compute false positives and true positives
+    false_positives = np.cumsum(false_positives, axis=1)
+    true_positives  = np.cumsum(true_positives, axis=1)
+
+    # compute recall and precision
+    recall    = true_positives / num_annotations
+    precision = true_positives / np.maximum(true_positives + false_positives, np.finfo(np.float64).eps)
+
+    # compute average precision at every threshold
+    average_precisions = np.array([_compute_ap(r, p) for r, p in zip(recall, precision)])
+    if np.ndim(iou_threshold) == 0:
+        return average_precisions[0]
+    return average_precisions
+
+
+class _SharedArray(object):
+    """ A numpy array in shared memory, which can be passed to worker processes without copying its data. """
+    def __init__(self, array):
+        self.shape  = array.shape
+        self.dtype  = array.dtype.str
+        self.buffer = multiprocessing.RawArray('b', max(1, array.nbytes))
+        self.array()[...] = array
+
+    def array(self):
+        return np.frombuffer(self.buffer, dtype=self.dtype, count=int(np.prod(self.shape))).reshape(self.shape)
+
+
+def _pack(all_items, num_columns):
+    """ Pack a list of lists of (n, num_columns) arrays in one shared array, with offsets of every item in that array.
+
+    Items are ordered by image first and label second, so item [image][label] is row offsets[image * num_classes + label].
+    """
+    items   = [item for image_items in all_items for item in image_items]
+    dtype   = np.result_type(*items) if items else np.float64
+    offsets = np.concatenate([[0], np.cumsum([item.shape[0] for item in items], dtype=np.int64)])
+    data    = np.concatenate([np.zeros((0, num_columns), dtype=dtype)] + [item.reshape(-1, num_columns) for item in items]).astype(dtype)
+    return _SharedArray(data), _SharedArray(offsets)
+
+
+# shared detections and annotations used by the worker processes of compute_average_precisions
+_shared = {}
+
+
+def _init_average_precision_worker(detections, detection_offsets, annotations, annotation_offsets, num_images, num_classes, iou_threshold):
+    _shared.update(
+        detections=detections.array(),
+        detection_offsets=detection_offsets.array(),
+        annotations=annotations.array(),
+        annotation_offsets=annotation_offsets.array(),
+        num_images=num_images,
+        num_classes=num_classes,
+        iou_threshold=iou_threshold,
+    )
+
+
+def _average_precision_worker(label):
+    items = [i * _shared['num_classes'] + label for i in range(_shared['num_images'])]
+
+    def unpack(data, offsets):
+        return [data[offsets[i]:offsets[i + 1]] for i in items]
+
+    return _average_precision(
+        unpack(_shared['detections'], _shared['detection_offsets']),
+        unpack(_shared['annotations'], _shared['annotation_offsets']),
+        _shared['iou_threshold'],
+    )
+
+
+def compute_average_precisions(all_detections, all_annotations, num_classes, iou_threshold=0.5, n_jobs=1):
+    """ Compute the average precision of every class, given all detections and annotations.
+
+    With n_jobs > 1 the classes are distributed over a pool of processes. The detections and annotations are
+    copied once into shared memory for all processes, instead of being pickled.
+
+    # Arguments
+        all_detections  : List such that all_detections[image][label] = detections[num_detections, 5] (x1, y1, x2, y2, score).
+        all_annotations : List such that all_annotations[image][label] = annotations[num_annotations, 4].
+        num_classes     : Number of classes.
+        iou_threshold   : The threshold used to consider when a detection is positive or negative.
+                          With a list of thresholds (for example COCO_IOU_THRESHOLDS), the average precisions at all
+                          thresholds are computed from a single IoU computation per image and class.
+        n_jobs          : Number of processes used to compute the average precisions.
+    # Returns
+        A dict mapping labels to average precisions.
+        With a list of thresholds, every average precision is an array with the average precision at every threshold.
+    """
+    if n_jobs > 1 and num_classes > 1:
+        detections, detection_offsets   = _pack(all_detections, 5)
+        annotations, annotation_offsets = _pack(all_annotations, 4)
+
+        pool = get_context().Pool(
+            min(n_jobs, num_classes),
+            initializer=_init_average_precision_worker,
+            initargs=(detections, detection_offsets, annotations, annotation_offsets, len(all_detections), num_classes, iou_threshold),
+        )
+        try:
+            return dict(enumerate(pool.map(_average_precision_worker, range(num_classes), chunksize=1)))
+        finally:
+            pool.close()
+            pool.join()
+
+    average_precisions = {}
+    for label in range(num_classes):
+        average_precisions[label] = _average_precision(
+            [image_detections[label] for image_detections in all_detections],
+            [image_annotations[label] for image_annotations in all_annotations],
+            iou_threshold,
+        )
+
+    return average_precisions
+
+
 def evaluate(
     generator,
     model,
@@ -214,83 +589,44 @@ def evaluate(
     writer=None,
     steps=0,
     number=0,
-    separate_channels=False
+    separate_channels=False,
+    n_jobs=1,
+    batch_size=1,
+    prefetch=0,
+    cache_dir=None,
 ):
     """ Evaluate a given dataset using a given model.
 
     # Arguments
         generator       : The generator that represents the dataset to evaluate.
         model           : The model to evaluate.
-        iou_threshold   : The threshold used to consider when a detection is positive or negative.
+        iou_threshold   : The threshold used to consider when a detection is positive or negative, or a list of thresholds
+                          (see compute_average_precisions). Use average_precision_table to get a (threshold, class) table.
         score_threshold : The score confidence threshold to use for detections.
         max_detections  : The maximum number of detections to use per image.
         save_path       : The path to save images with visualized detections to.
+        n_jobs          : Number of processes used to compute the average precisions.
+        batch_size      : Number of images per prediction.
+        prefetch        : Number of batches loaded ahead by a pool of threads, while the model runs.
+        cache_dir       : Directory to store the raw detections of the model in. Evaluating the same model on the same
+                          dataset again (for example with another score or IoU threshold) reuses the stored detections.
     # Returns
         A dict mapping class names to mAP scores.
     """
     # gather all detections and annotations
-    all_detections     = _get_detections(generator, model, score_threshold=score_threshold, max_detections=max_detections, save_path=save_path, writer=writer, steps=steps, number=number, separate_channels=separate_channels)
+    all_detections     = _get_detections(generator, model, score_threshold=score_threshold, max_detections=max_detections, save_path=save_path, writer=writer, steps=steps, number=number, separate_channels=separate_channels, batch_size=batch_size, prefetch=prefetch, cache_dir=cache_dir)
     all_annotations    = _get_annotations(generator)
-    average_precisions = {}
 
-    # all_detections = pickle.load(open('all_detections.pkl', 'rb'))
-    # all_annotations = pickle.load(open('all_annotations.pkl', 'rb'))
-    # pickle.dump(all_detections, open('all_detections.pkl', 'wb'))
-    # pickle.dump(all_annotations, open('all_annotations.pkl', 'wb'))
+    return compute_average_precisions(all_detections, all_annotations, generator.num_classes(), iou_threshold=iou_threshold, n_jobs=n_jobs)
 
-    # process detections and annotations
-    for label in range(generator.num_classes()):
-        false_positives = np.zeros((0,))
-        true_positives  = np.zeros((0,))
-        scores          = np.zeros((0,))
-        num_annotations = 0.0
 
-        for i in range(generator.size()):
-            detections           = all_detections[i][label]
-            annotations          = all_annotations[i][label]
-            num_annotations     += annotations.shape[0]
-            detected_annotations = []
-
-            for d in detections:
-                scores = np.append(scores, d[4])
-
-                if annotations.shape[0] == 0:
-                    false_positives = np.append(false_positives, 1)
-                    true_positives  = np.append(true_positives, 0)
-                    continue
-
-                overlaps            = compute_overlap(np.expand_dims(d, axis=0), annotations)
-                assigned_annotation = np.argmax(overlaps, axis=1)
-                max_overlap         = overlaps[0, assigned_annotation]
-
-                if max_overlap >= iou_threshold and assigned_annotation not in detected_annotations:
-                    false_positives = np.append(false_positives, 0)
-                    true_positives  = np.append(true_positives, 1)
-                    detected_annotations.append(assigned_annotation)
-                else:
-                    false_positives = np.append(false_positives, 1)
-                    true_positives  = np.append(true_positives, 0)
-
-        # no annotations -> AP for this class is 0 (is this correct?)
-        if num_annotations == 0:
-            average_precisions[label] = 0
-            continue
-
-        # sort by score
-        indices         = np.argsort(-scores)
-        false_positives = false_positives[indices]
-        true_positives  = true_positives[indices]
-
-        # compute false positives and true positives
-        false_positives = np.cumsum(false_positives)
-        true_positives  = np.cumsum(true_positives)
-
-        # compute recall and precision
-        recall    = true_positives / num_annotations
-        precision = true_positives / np.maximum(true_positives + false_positives, np.finfo(np.float64).eps)
-
-        # compute average precision
-        average_precision  = _compute_ap(recall, precision)
-        average_precisions[label] = average_precision
+def average_precision_table(average_precisions):
+    """ Convert the result of evaluate with a list of IoU thresholds to a table.
 
-    return average_precisions
+    # Arguments
+        average_precisions : Dict mapping labels to arrays with the average precision at every IoU threshold.
+    # Returns
+        An array of shape (num_thresholds, num_classes), with the classes in order of their label.
+        The mean of this table over all thresholds and classes is the mAP, for example mAP@[.5:.95] for COCO_IOU_THRESHOLDS.
+    """
+    return np.stack([np.atleast_1d(average_precisions[label]) for label in sorted(average_precisions)], axis=1)
@@ -134,7 +134,7 @@ class TransformParameters:
             return cv2.INTER_LANCZOS4
 
 
-def apply_transform(matrix, image, params):
+def apply_transform(matrix, image, params, output_shape=None):
     """
     Apply a transformation to an image.
 
@@ -147,6 +147,7 @@ def apply_transform(matrix, image, params):
       matrix: A homogeneous 3 by 3 matrix holding representing the transformation to apply.
       image:  The image to transform.
       params: The transform parameters (see TransformParameters)
+      output_shape: The (rows, cols) of the generated image, defaults to the shape of the original image.
     """
     if params.channel_axis != 2:
         image = np.moveaxis(image, params.channel_axis, 2)
@@ -154,7 +155,7 @@ def apply_transform(matrix, image, params):
     output = cv2.warpAffine(
         image,
         matrix[:2, :],
-        dsize       = (image.shape[1], image.shape[0]),
+        dsize       = (output_shape[1], output_shape[0]) if output_shape else (image.shape[1], image.shape[0]),
         flags       = params.cvInterpolation(),
         borderMode  = params.cvBorderMode(),
         borderValue = params.cval,
@@ -165,8 +166,17 @@ def apply_transform(matrix, image, params):
     return output
 
 
-def resize_image(img, min_side=800, max_side=1333):
-    (rows, cols, _) = img.shape
+def compute_resize_scale(image_shape, min_side=800, max_side=1333):
+    """ Compute the scale that resize_image uses for an image of the given shape.
+
+    # Arguments
+        image_shape: The (rows, cols, channels) of the image.
+        min_side:    The image is scaled so the smallest side is min_side...
+        max_side:    ... unless that makes the largest side larger than max_side.
+    # Returns
+        The scale as a float.
+    """
+    (rows, cols, _) = image_shape
 
     smallest_side = min(rows, cols)
 
@@ -179,6 +189,30 @@ def resize_image(img, min_side=800, max_side=1333):
     if largest_side * scale > max_side:
         scale = max_side / largest_side
 
+    return scale
+
+
+def resized_shape(image_shape, scale):
+    """ The (rows, cols) of an image of the given shape after resizing with cv2.resize(fx=scale, fy=scale). """
+    return int(round(image_shape[0] * scale)), int(round(image_shape[1] * scale))
+
+
+def resize_transform(scale):
+    """ Homogeneous matrix that maps pixel coordinates of an image to the image resized by scale.
+
+    Pixel centers are aligned the same way as with cv2.resize, so warping an image with this matrix matches resize_image.
+    """
+    offset = 0.5 * (scale - 1)
+    return np.array([
+        [scale, 0,     offset],
+        [0,     scale, offset],
+        [0,     0,     1],
+    ])
+
+
+def resize_image(img, min_side=800, max_side=1333):
+    scale = compute_resize_scale(img.shape, min_side=min_side, max_side=max_side)
+
     # resize the image with the computed scale
     img = cv2.resize(img, None, fx=scale, fy=scale)
 
@@ -0,0 +1,52 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+
+def encode_strings(strings):
+    """ Encode a list of strings as one utf-8 byte array plus (len(strings) + 1,) offsets into the decoded text.
+
+    This stores many strings far more compactly (and faster to load) than a numpy array of python objects.
+    """
+    data    = np.frombuffer(u''.join(strings).encode('utf-8'), dtype=np.uint8)
+    offsets = np.concatenate([[0], np.cumsum([len(s) for s in strings], dtype=np.int64)])
+    return data, offsets
+
+
+def decode_strings(data, offsets):
+    """ Inverse of encode_strings. """
+    text = data.tobytes().decode('utf-8')
+    return [text[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def save_npz(path, arrays):
+    """ Write a dictionary of arrays to an uncompressed .npz file.
+
+    The file is written to a temporary file in the same directory first and then moved in place,
+    so concurrent readers never see a partially written file.
+    """
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            np.savez(f, **arrays)
+        getattr(os, 'replace', os.rename)(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
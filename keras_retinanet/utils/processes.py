@@ -0,0 +1,34 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import multiprocessing
+
+
+def get_context(start_methods=('forkserver', 'spawn')):
+    """ Returns a multiprocessing context using the first available start method of start_methods.
+
+    The default start methods start the worker processes from a fresh interpreter, because forking a process that
+    runs tensorflow is not safe. This module does not import keras or tensorflow, so that worker functions defined
+    in modules that only import it do not load them either.
+    Falls back to the default start method if none of them is available (or on python 2, which only forks).
+    """
+    if hasattr(multiprocessing, 'get_context'):
+        for start_method in start_methods:
+            try:
+                return multiprocessing.get_context(start_method)
+            except ValueError:
+                pass
+    return multiprocessing
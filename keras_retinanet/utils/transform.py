@@ -38,6 +38,34 @@ def transform_aabb(transform, aabb):
     return [min_corner[0], min_corner[1], max_corner[0], max_corner[1]]
 
 
+def transform_aabbs(transform, aabbs):
+    """ Apply a transformation to an array of axis aligned bounding boxes.
+
+    Batched version of transform_aabb: the corners of all boxes are transformed with a single matrix product.
+
+    # Arguments
+        transform: The transformation to apply.
+        aabbs:     Array of shape (N, 4) with the (x1, y1, x2, y2) of N AABBs.
+    # Returns
+        The new AABBs as an array of shape (N, 4).
+    """
+    aabbs = np.asarray(aabbs, dtype=np.float64).reshape(-1, 4)
+    x1, y1, x2, y2 = aabbs.T
+
+    # Transform all 4 corners of all AABBs, shape (3, 4 * N).
+    points = transform.dot(np.stack([
+        np.concatenate([x1, x2, x1, x2]),
+        np.concatenate([y1, y2, y2, y1]),
+        np.ones(4 * aabbs.shape[0]),
+    ])).reshape(3, 4, -1)
+
+    # Extract the min and max corners again.
+    min_corner = points.min(axis=1)
+    max_corner = points.max(axis=1)
+
+    return np.stack([min_corner[0], min_corner[1], max_corner[0], max_corner[1]], axis=1)
+
+
 def _random_vector(min, max, prng=DEFAULT_PRNG):
     """ Construct a random vector between min and max.
     # Arguments
@@ -269,5 +297,28 @@ def random_transform_generator(prng=None, **kwargs):
         # RandomState automatically seeds using the best available method.
         prng = np.random.RandomState()
 
-    while True:
-        yield random_transform(prng=prng, **kwargs)
+    return RandomTransformGenerator(prng, **kwargs)
+
+
+class RandomTransformGenerator(object):
+    """ Infinite iterator over random transformations, as created by random_transform_generator.
+
+    Unlike a plain Python generator, the PRNG can be reseeded afterwards (for example in forked worker processes,
+    which would otherwise all produce the same sequence of transformations).
+    """
+    def __init__(self, prng, **kwargs):
+        self.prng   = prng
+        self.kwargs = kwargs
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return random_transform(prng=self.prng, **self.kwargs)
+
+    # Python 2 compatibility
+    next = __next__
+
+    def seed(self, seed):
+        """ Reseed the pseudo-random number generator. """
+        self.prng.seed(seed)
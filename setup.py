@@ -18,6 +18,8 @@ setuptools.setup(
             'retinanet-evaluate=keras_retinanet.bin.evaluate:main',
             'retinanet-debug=keras_retinanet.bin.debug:main',
             'retinanet-convert-model=keras_retinanet.bin.convert_model:main',
+            'retinanet-pack-records=keras_retinanet.bin.pack_records:main',
+            'retinanet-benchmark-generator=keras_retinanet.bin.benchmark_generator:main',
         ],
     }
 )
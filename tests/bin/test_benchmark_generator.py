@@ -0,0 +1,47 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import keras_retinanet.bin.benchmark_generator
+
+import warnings
+
+
+def test_csv(tmpdir):
+    # ignore warnings in this test
+    warnings.simplefilter('ignore')
+
+    annotations, classes = keras_retinanet.bin.benchmark_generator.write_synthetic_dataset(str(tmpdir), 3)
+    keras_retinanet.bin.benchmark_generator.main([
+        '--num-batches=2',
+        '--warmup=1',
+        '--sparse-assignment',
+        'csv',
+        annotations,
+        classes,
+    ])
+
+
+def test_synthetic(tmpdir):
+    # ignore warnings in this test
+    warnings.simplefilter('ignore')
+
+    keras_retinanet.bin.benchmark_generator.main([
+        '--num-batches=2',
+        '--warmup=0',
+        '--batch-size=2',
+        '--synthetic=4',
+        '--synthetic-dir={}'.format(tmpdir),
+    ])
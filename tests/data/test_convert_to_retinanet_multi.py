@@ -0,0 +1,117 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import importlib.util
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+from keras_retinanet.preprocessing.raw_images import RawImageReader
+
+# the conversion script is not part of the package, register it so the worker pool can pickle its functions
+spec    = importlib.util.spec_from_file_location('convert_to_retinanet_multi', os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'convert_to_retinanet_multi.py'))
+convert = sys.modules.setdefault(spec.name, importlib.util.module_from_spec(spec))
+spec.loader.exec_module(convert)
+
+
+def write_dataset(tmpdir, num_images=3, channels=2):
+    """ Write the channel images of a dataset and its txt file, returns the path of the txt file and the images. """
+    prng   = np.random.RandomState(0)
+    images = []
+    lines  = []
+    for i in range(num_images):
+        image     = prng.randint(0, 256, size=(20, 30, channels)).astype(np.uint8)
+        filenames = [str(tmpdir.join('image{}_channel{}.png'.format(i, c))) for c in range(channels)]
+        for c, path in enumerate(filenames):
+            cv2.imwrite(path, image[:, :, c])
+        images.append((filenames, image))
+        lines.append(','.join(filenames + ['30', '20', '1', '2', '10', '12', 'a', 'training' if i % 2 else 'test']) + '\n')
+
+    filename = tmpdir.join('dataset.txt')
+    filename.write(''.join(lines))
+    return str(filename), images
+
+
+def converted_name(filenames, new='features', extension='.npz'):
+    return filenames[0][:filenames[0].rfind('_') + 1] + new + extension
+
+
+def convert_dataset(filename, **kwargs):
+    convert.ConvertToRetinaNetFormatMultiCSV(filename, channels=2, new='features', workers=2, **kwargs)
+
+
+def test_resume_npz(tmpdir):
+    filename, images = write_dataset(tmpdir)
+
+    # the first conversion fails for an image with a missing channel
+    os.rename(images[1][0][1], images[1][0][1] + '.missing')
+    convert_dataset(filename)
+    assert os.path.exists(converted_name(images[0][0]))
+    assert not os.path.exists(converted_name(images[1][0]))
+    assert not tmpdir.listdir(lambda p: p.ext == '.tmp')
+
+    manifest = convert.Manifest(filename.replace('.txt', '_manifest.txt'))
+    assert converted_name(images[0][0]) in manifest
+    assert converted_name(images[1][0]) not in manifest
+    manifest.close()
+
+    # a second run retries the failed image and skips the converted images, so it does not see the modified channel
+    os.rename(images[1][0][1] + '.missing', images[1][0][1])
+    cv2.imwrite(images[0][0][0], np.zeros((20, 30), dtype=np.uint8))
+    convert_dataset(filename)
+
+    for filenames, image in images:
+        with np.load(converted_name(filenames)) as converted:
+            np.testing.assert_array_equal(converted['arr_0'], image)
+
+
+def test_resume_raw_images(tmpdir):
+    filename, images = write_dataset(tmpdir)
+    raw_path = str(tmpdir.join('images.raw'))
+
+    os.rename(images[1][0][1], images[1][0][1] + '.missing')
+    convert_dataset(filename, directory='', raw_images=raw_path)
+    assert len(RawImageReader(raw_path)) == 2
+
+    # the index of the raw images file records the converted images
+    os.rename(images[1][0][1] + '.missing', images[1][0][1])
+    cv2.imwrite(images[0][0][0], np.zeros((20, 30), dtype=np.uint8))
+    convert_dataset(filename, directory='', raw_images=raw_path)
+
+    reader = RawImageReader(raw_path)
+    assert len(reader) == len(images)
+    for filenames, image in images:
+        np.testing.assert_array_equal(reader[converted_name(filenames, extension='')], image)
+
+
+@pytest.mark.parametrize('raw_images', [None, 'images.raw'])
+def test_no_resume(tmpdir, raw_images):
+    filename, images = write_dataset(tmpdir)
+    raw_path = str(tmpdir.join(raw_images)) if raw_images else None
+    convert_dataset(filename, raw_images=raw_path)
+
+    # without resume all images are converted again, so removed channels are an error
+    os.remove(images[0][0][0])
+    convert_dataset(filename, raw_images=raw_path, resume=False)
+    if raw_images:
+        assert len(RawImageReader(raw_path)) == len(images) - 1
+    else:
+        manifest = convert.Manifest(filename.replace('.txt', '_manifest.txt'))
+        assert converted_name(images[0][0]) not in manifest
+        manifest.close()
@@ -170,3 +170,102 @@ class TestFilterDetections(object):
         np.testing.assert_array_equal(actual_boxes, expected_boxes)
         np.testing.assert_array_equal(actual_scores, expected_scores)
         np.testing.assert_array_equal(actual_labels, expected_labels)
+
+    def test_batched_nms(self):
+        # create random input with many overlapping boxes of several classes
+        prng  = np.random.RandomState(0)
+        xy    = prng.uniform(0, 200, size=(2, 100, 2))
+        boxes = np.concatenate([xy, xy + prng.uniform(10, 100, size=(2, 100, 2))], axis=2).astype(keras.backend.floatx())
+        boxes = keras.backend.variable(boxes)
+
+        classification = prng.uniform(0, 1, size=(2, 100, 4)).astype(keras.backend.floatx())
+        classification = keras.backend.variable(classification)
+
+        # compute output with NMS per class and with a single NMS for all classes
+        expected = keras_retinanet.layers.FilterDetections().call([boxes, classification])
+        actual   = keras_retinanet.layers.FilterDetections(batched_nms=True).call([boxes, classification])
+
+        # assert actual and expected are equal
+        for a, e in zip(actual, expected):
+            np.testing.assert_array_equal(keras.backend.eval(a), keras.backend.eval(e))
+
+    def test_batched_nms_negative_coordinates(self):
+        # boxes partially outside the image, around the origin
+        prng  = np.random.RandomState(1)
+        xy    = prng.uniform(-100, 50, size=(1, 100, 2))
+        boxes = np.concatenate([xy, xy + prng.uniform(10, 100, size=(1, 100, 2))], axis=2).astype(keras.backend.floatx())
+        boxes = keras.backend.variable(boxes)
+
+        classification = prng.uniform(0, 1, size=(1, 100, 4)).astype(keras.backend.floatx())
+        classification = keras.backend.variable(classification)
+
+        # compute output with NMS per class and with a single NMS for all classes
+        expected = keras_retinanet.layers.FilterDetections().call([boxes, classification])
+        actual   = keras_retinanet.layers.FilterDetections(batched_nms=True).call([boxes, classification])
+
+        # assert actual and expected are equal
+        for a, e in zip(actual, expected):
+            np.testing.assert_array_equal(keras.backend.eval(a), keras.backend.eval(e))
+
+    def test_class_agnostic(self):
+        # create simple FilterDetections layer
+        filter_detections_layer = keras_retinanet.layers.FilterDetections(class_specific_filter=False)
+
+        # create simple input
+        boxes = np.array([[
+            [0, 0, 10, 10],  # this will be suppressed, even though it has another label
+            [0, 0, 10, 10],
+        ]], dtype=keras.backend.floatx())
+        boxes = keras.backend.variable(boxes)
+
+        classification = np.array([[
+            [0.9, 0],
+            [0,   1],
+        ]], dtype=keras.backend.floatx())
+        classification = keras.backend.variable(classification)
+
+        # compute output
+        actual_boxes, actual_scores, actual_labels = filter_detections_layer.call([boxes, classification])
+        actual_boxes  = keras.backend.eval(actual_boxes)
+        actual_scores = keras.backend.eval(actual_scores)
+        actual_labels = keras.backend.eval(actual_labels)
+
+        # define expected output
+        expected_boxes = -1 * np.ones((1, 300, 4), dtype=keras.backend.floatx())
+        expected_boxes[0, 0, :] = [0, 0, 10, 10]
+
+        expected_scores = -1 * np.ones((1, 300), dtype=keras.backend.floatx())
+        expected_scores[0, 0] = 1
+
+        expected_labels = -1 * np.ones((1, 300), dtype=keras.backend.floatx())
+        expected_labels[0, 0] = 1
+
+        # assert actual and expected are equal
+        np.testing.assert_array_equal(actual_boxes, expected_boxes)
+        np.testing.assert_array_equal(actual_scores, expected_scores)
+        np.testing.assert_array_equal(actual_labels, expected_labels)
+
+    def test_vectorized(self):
+        # create random input with many overlapping boxes of several classes, batch_size=3
+        prng  = np.random.RandomState(1)
+        xy    = prng.uniform(0, 200, size=(3, 100, 2))
+        boxes = np.concatenate([xy, xy + prng.uniform(10, 100, size=(3, 100, 2))], axis=2).astype(keras.backend.floatx())
+        boxes = keras.backend.variable(boxes)
+
+        classification = prng.uniform(0, 1, size=(3, 100, 4)).astype(keras.backend.floatx())
+        classification[2] = 0  # no detections in the last image
+        classification = keras.backend.variable(classification)
+
+        other = [keras.backend.variable(prng.uniform(0, 1, size=(3, 100, 2)).astype(keras.backend.floatx()))]
+
+        for class_specific_filter in [True, False]:
+            for max_detections in [300, 10]:
+                kwargs = dict(class_specific_filter=class_specific_filter, max_detections=max_detections)
+
+                # compute output one image at a time and for the whole batch at once
+                expected = keras_retinanet.layers.FilterDetections(**kwargs).call([boxes, classification] + other)
+                actual   = keras_retinanet.layers.FilterDetections(vectorized=True, **kwargs).call([boxes, classification] + other)
+
+                # assert actual and expected are equal
+                for a, e in zip(actual, expected):
+                    np.testing.assert_array_equal(keras.backend.eval(a), keras.backend.eval(e))
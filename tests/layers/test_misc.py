@@ -16,6 +16,7 @@ limitations under the License.
 
 import keras
 import keras_retinanet.layers
+from keras_retinanet.utils.image import preprocess_image
 
 import numpy as np
 
@@ -209,3 +210,43 @@ class TestRegressBoxes(object):
         ], dtype=keras.backend.floatx())
 
         np.testing.assert_array_almost_equal(actual, expected, decimal=2)
+
+
+class TestPreprocessImage(object):
+    def test_matches_preprocess_image(self):
+        image = np.random.RandomState(0).randint(0, 256, size=(2, 5, 7, 4)).astype(np.uint8)
+
+        for mean in [False, True]:
+            for normalize in [0, 1, -1]:
+                preprocess_layer = keras_retinanet.layers.PreprocessImage(mean=mean, normalize=normalize)
+
+                # compute output
+                actual = preprocess_layer.call(keras.backend.constant(image, dtype='uint8'))
+                actual = keras.backend.eval(actual)
+
+                expected = preprocess_image(image, mean=mean, normalize=normalize)
+                np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-5)
+
+
+class TestSelectTopCandidates(object):
+    def test_mini_batch(self):
+        prng = np.random.RandomState(0)
+
+        # two pyramid levels with 6 and 3 anchors, batch_size=2
+        level_anchors  = [prng.uniform(0, 100, size=(2, n, 4)).astype(keras.backend.floatx()) for n in [6, 3]]
+        regression     = prng.uniform(-1, 1, size=(2, 9, 4)).astype(keras.backend.floatx())
+        classification = prng.uniform(0, 1, size=(2, 9, 3)).astype(keras.backend.floatx())
+
+        # compute output
+        select_layer = keras_retinanet.layers.SelectTopCandidates(k=4, num_levels=2)
+        actual       = select_layer.call([keras.backend.variable(a) for a in level_anchors + [regression, classification]])
+        actual       = [keras.backend.eval(a) for a in actual]
+
+        # the 4 best anchors of the first level and all 3 anchors of the second level, by their best score
+        anchors = np.concatenate(level_anchors, axis=1)
+        scores  = np.max(classification, axis=2)
+        for b in range(2):
+            indices  = np.concatenate([np.argsort(-scores[b, :6])[:4], 6 + np.argsort(-scores[b, 6:])])
+            expected = [anchors[b, indices], regression[b, indices], classification[b, indices]]
+            for a, e in zip(actual, expected):
+                np.testing.assert_array_equal(a[b], e)
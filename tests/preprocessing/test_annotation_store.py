@@ -0,0 +1,66 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+import pytest
+
+from keras_retinanet.preprocessing.annotation_store import AnnotationStore
+
+
+def test_from_lists():
+    store = AnnotationStore.from_lists([
+        [(0, 1, 2, 3, 1), (4, 5, 6, 7, 2)],
+        [],
+        [(8, 9, 10, 11, 0)],
+    ])
+
+    assert len(store) == 3
+    assert store.num_annotations(1) == 0
+    np.testing.assert_array_equal(store[0], [[0, 1, 2, 3, 1], [4, 5, 6, 7, 2]])
+    np.testing.assert_array_equal(store[1], np.zeros((0, 5)))
+    np.testing.assert_array_equal(store[2], [[8, 9, 10, 11, 0]])
+
+
+def test_returns_copy():
+    store = AnnotationStore.from_lists([[(0, 1, 2, 3, 1)]])
+
+    annotations = store[0]
+    annotations[:, :4] *= 2
+
+    np.testing.assert_array_equal(store[0], [[0, 1, 2, 3, 1]])
+
+
+def test_invalid_offsets():
+    with pytest.raises(ValueError):
+        AnnotationStore(np.zeros((2, 4)), np.zeros((2,)), [0, 1])
+
+
+def test_from_dicts():
+    image_data = {
+        'a.png': [{'x1': 0, 'y1': 1, 'x2': 2, 'y2': 3, 'class': 'b'}],
+        'b.png': [],
+    }
+    store = AnnotationStore.from_dicts(image_data, ['b.png', 'a.png'], {'a': 0, 'b': 1})
+
+    assert len(store) == 2
+    np.testing.assert_array_equal(store[0], np.zeros((0, 5)))
+    np.testing.assert_array_equal(store[1], [[0, 1, 2, 3, 1]])
+
+
+def test_float_precision():
+    # fractional coordinates (like KITTI's) are not rounded to float32
+    store = AnnotationStore.from_lists([[(587.01, 173.33, 614.12, 200.12, 0)]])
+    np.testing.assert_array_equal(store[0], [[587.01, 173.33, 614.12, 200.12, 0]])
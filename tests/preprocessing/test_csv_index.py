@@ -0,0 +1,80 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+
+import numpy as np
+
+from keras_retinanet.preprocessing import csv_index
+from keras_retinanet.preprocessing.annotation_store import AnnotationStore
+from keras_retinanet.preprocessing.csv_generator_multi import CSVGeneratorMULTI
+from .test_generator import default_args
+
+
+def write_dataset(tmpdir):
+    data_file  = tmpdir.join('annotations.csv')
+    class_file = tmpdir.join('classes.csv')
+    data_file.write('a.png,1,2,3,4,a\nb.png,,,,,\n')
+    class_file.write('a,0\n')
+    return str(data_file), str(class_file)
+
+
+def test_round_trip(tmpdir):
+    data_file, class_file = write_dataset(tmpdir)
+    names = [u'a.png', u'été/b.png']
+    store = AnnotationStore.from_lists([[(1, 2, 3, 4, 0)], []])
+    sizes = np.array([[640, 480], [320, 240]])
+
+    assert csv_index.load_index(data_file, class_file) is None
+    csv_index.save_index(data_file, class_file, names, store, image_sizes=sizes)
+
+    loaded_names, loaded_store, loaded_sizes = csv_index.load_index(data_file, class_file)
+    assert loaded_names == names
+    np.testing.assert_array_equal(loaded_store.boxes, store.boxes)
+    np.testing.assert_array_equal(loaded_store.labels, store.labels)
+    np.testing.assert_array_equal(loaded_store.offsets, store.offsets)
+    np.testing.assert_array_equal(loaded_sizes, sizes)
+
+
+def test_outdated_index(tmpdir):
+    data_file, class_file = write_dataset(tmpdir)
+    store = AnnotationStore.from_lists([[(1, 2, 3, 4, 0)], []])
+    csv_index.save_index(data_file, class_file, ['a.png', 'b.png'], store)
+    assert csv_index.load_index(data_file, class_file) is not None
+
+    # modifying the classes file invalidates the index
+    with open(class_file, 'a') as f:
+        f.write('b,1\n')
+    assert csv_index.load_index(data_file, class_file) is None
+    assert os.path.exists(csv_index.index_path(data_file))
+
+
+def test_index_without_image_sizes(tmpdir):
+    data_file  = tmpdir.join('annotations.csv')
+    class_file = tmpdir.join('classes.csv')
+    data_file.write('a.npy,6,4,1,1,3,3,a\n')
+    class_file.write('a,0\n')
+
+    # an index written by CSVGenerator does not store image sizes
+    store = AnnotationStore.from_lists([[(1, 1, 3, 3, 0)]])
+    csv_index.save_index(str(data_file), str(class_file), ['a.npy'], store)
+
+    generator = CSVGeneratorMULTI(str(data_file), str(class_file), args=default_args())
+    assert generator.image_aspect_ratio(0) == 1.5
+
+    # the index is rebuilt with the image sizes
+    _, _, sizes = csv_index.load_index(str(data_file), str(class_file))
+    np.testing.assert_array_equal(sizes, [[6, 4]])
@@ -16,17 +16,35 @@ limitations under the License.
 
 import keras.backend
 from keras_retinanet.preprocessing.generator import Generator
+from keras_retinanet.utils.transform import rotation, scaling, translation
 
+import argparse
 import numpy as np
 import pytest
 
 
+def default_args():
+    pyramid_levels = [3, 4, 5, 6, 7]
+    return argparse.Namespace(
+        mean=False,
+        norm=0,
+        P2=False,
+        ratio=np.array([0.5, 1, 2]),
+        scale=np.array([2 ** 0, 2 ** (1.0 / 3.0), 2 ** (2.0 / 3.0)]),
+        pyramid_levels=pyramid_levels,
+        stride=[2 ** x for x in pyramid_levels],
+        size=[2 ** (x + 2) for x in pyramid_levels],
+    )
+
+
 class SimpleGenerator(Generator):
-    def __init__(self, annotations_group, num_classes=0, image=None):
+    def __init__(self, annotations_group, num_classes=0, image=None, **kwargs):
         self.annotations_group = annotations_group
         self.num_classes_      = num_classes
         self.image             = image
-        super(SimpleGenerator, self).__init__(group_method='none', shuffle_groups=False)
+        kwargs.setdefault('group_method', 'none')
+        kwargs.setdefault('shuffle_groups', False)
+        super(SimpleGenerator, self).__init__(args=default_args(), **kwargs)
 
     def num_classes(self):
         return self.num_classes_
@@ -179,3 +197,136 @@ class TestFilterAnnotations(object):
         # test that only object with class 0 is present in labels_batch
         labels = np.unique(np.argmax(labels_batch == 1, axis=2))
         assert(len(labels) == 1 and labels[0] == 0), 'Expected only class 0 to be present, but got classes {}'.format(labels)
+
+
+class TestSequence(object):
+    def test_len_and_getitem(self):
+        def annotations_group():
+            return [np.array([[0, 0, 50, 50, 0]], dtype=keras.backend.floatx()) for _ in range(5)]
+
+        input_image = np.zeros((100, 100, 3), dtype=np.uint8)
+
+        simple_generator = SimpleGenerator(annotations_group(), image=input_image, num_classes=1, batch_size=2)
+        assert len(simple_generator) == 3
+
+        # compute the expected batch with a separate generator, since preprocessing modifies the annotations in place
+        expected_generator = SimpleGenerator(annotations_group(), image=input_image, num_classes=1, batch_size=2)
+
+        inputs, [regression_batch, labels_batch] = simple_generator[1]
+        expected_inputs, [expected_regression, expected_labels] = expected_generator.compute_input_output(expected_generator.groups[1])
+        np.testing.assert_array_equal(inputs, expected_inputs)
+        np.testing.assert_array_equal(regression_batch, expected_regression)
+        np.testing.assert_array_equal(labels_batch, expected_labels)
+
+    def test_partial_group(self):
+        input_annotations_group = [np.array([[0, 0, 50, 50, 0]], dtype=keras.backend.floatx()) for _ in range(3)]
+        input_image             = np.zeros((100, 100, 3), dtype=np.uint8)
+
+        # the last group of an epoch can be smaller than the batch size
+        simple_generator = SimpleGenerator(input_annotations_group, image=input_image, num_classes=1, batch_size=2)
+        inputs, [regression_batch, labels_batch] = simple_generator.compute_input_output([2])
+        assert inputs.shape[0] == regression_batch.shape[0] == labels_batch.shape[0] == 1
+        assert not np.isnan(regression_batch).any()
+
+    def test_on_epoch_end(self):
+        input_annotations_group = [np.zeros((0, 5)) for _ in range(20)]
+
+        simple_generator = SimpleGenerator(input_annotations_group, shuffle_groups=True)
+        groups = [list(g) for g in simple_generator.groups]
+        simple_generator.on_epoch_end()
+
+        # every group is still visited exactly once per epoch
+        assert sorted(simple_generator.groups) == sorted(groups)
+
+
+class TestFusedResize(object):
+    def test_matches_separate_resize(self):
+        y, x  = np.mgrid[0:400, 0:600]
+        image = np.stack([x % 200, y % 200, (x + y) % 200], axis=2).astype(np.uint8)
+        annotations = np.array([[10, 20, 300, 200, 0]], dtype=float)
+
+        separate = SimpleGenerator([annotations], image=image, image_min_side=200, image_max_side=400)
+        fused    = SimpleGenerator([annotations], image=image, image_min_side=200, image_max_side=400, fused_resize=True)
+
+        expected_image, expected_annotations = separate.preprocess_group_entry(image, annotations.copy())
+        image_, annotations_ = fused.preprocess_group_entry(image, annotations.copy())
+
+        assert image_.shape == expected_image.shape
+        assert image_.dtype == expected_image.dtype
+        np.testing.assert_allclose(image_[1:-1, 1:-1], expected_image[1:-1, 1:-1], atol=1)
+        np.testing.assert_almost_equal(annotations_, expected_annotations)
+
+    def test_matches_separate_transform(self):
+        y, x  = np.mgrid[0:400, 0:600]
+        image = (127.5 + 60 * np.stack([np.sin(x / 40.0), np.cos(y / 30.0), np.sin((x + y) / 50.0)], axis=2)).astype(np.uint8)
+        annotations = np.array([[100, 80, 300, 200, 0]], dtype=float)
+
+        # a fixed flip, rotation, scaling and translation (every generator gets a copy, it is adjusted in place)
+        transform = translation([0.05, -0.03]).dot(rotation(0.1)).dot(scaling([-1.1, 1.1]))
+        separate  = SimpleGenerator([annotations], image=image, image_min_side=200, image_max_side=400, transform_generator=iter([transform.copy()]))
+        fused     = SimpleGenerator([annotations], image=image, image_min_side=200, image_max_side=400, transform_generator=iter([transform.copy()]), fused_resize=True)
+
+        expected_image, expected_annotations = separate.preprocess_group_entry(image, annotations.copy())
+        image_, annotations_ = fused.preprocess_group_entry(image, annotations.copy())
+
+        assert image_.shape == expected_image.shape
+        np.testing.assert_allclose(image_, expected_image, atol=2)
+        np.testing.assert_almost_equal(annotations_, expected_annotations)
+
+
+class TestPreprocessInModel(object):
+    def test_uint8_batch(self):
+        image       = np.random.RandomState(0).randint(0, 256, size=(100, 150, 3)).astype(np.uint8)
+        annotations = np.array([[10, 20, 60, 80, 0]], dtype=float)
+
+        generator = SimpleGenerator([annotations], num_classes=1, image=image, image_min_side=50, image_max_side=100, preprocess_in_model=True)
+        inputs, _ = generator.compute_input_output(generator.groups[0])
+
+        assert inputs.dtype == np.uint8
+        assert inputs.shape == (1, 50, 75, 3)
+
+
+class CopyingGenerator(SimpleGenerator):
+    """ Loads a copy of the annotations, like the dataset generators, since preprocessing modifies them in place. """
+    def load_annotations(self, image_index):
+        return self.annotations_group[image_index].copy()
+
+
+class TestImageCache(object):
+    def test_cached_images(self):
+        image       = np.random.RandomState(0).randint(0, 256, size=(100, 150, 3)).astype(np.uint8)
+        annotations = np.array([[10, 20, 60, 80, 0]], dtype=float)
+
+        expected  = CopyingGenerator([annotations], num_classes=1, image=image, image_min_side=50, image_max_side=100)
+        generator = CopyingGenerator([annotations], num_classes=1, image=image, image_min_side=50, image_max_side=100, image_cache=10 ** 6)
+
+        for _ in range(2):
+            inputs, targets = generator.compute_input_output([0])
+            expected_inputs, expected_targets = expected.compute_input_output([0])
+            np.testing.assert_array_equal(inputs, expected_inputs)
+            for t, e in zip(targets, expected_targets):
+                np.testing.assert_array_equal(t, e)
+
+        assert generator.image_cache_info()['hits'] == 1
+        assert expected.image_cache_info() is None
+
+    def test_resized_images(self):
+        image       = np.random.RandomState(0).randint(0, 256, size=(100, 150, 3)).astype(np.uint8)
+        annotations = np.array([[10, 20, 60, 80, 0]], dtype=float)
+
+        expected  = CopyingGenerator([annotations], num_classes=1, image=image, image_min_side=50, image_max_side=100)
+        generator = CopyingGenerator(
+            [annotations], num_classes=1, image=image, image_min_side=50, image_max_side=100, image_cache=10 ** 6, image_cache_resized=True
+        )
+
+        cached_image, scale = generator.load_cached_image(0)
+        assert cached_image.shape == (50, 75, 3)
+        assert scale == 0.5
+
+        # annotations are scaled along with the cached image
+        for _ in range(2):
+            inputs, targets = generator.compute_input_output([0])
+            expected_inputs, expected_targets = expected.compute_input_output([0])
+            assert inputs.shape == expected_inputs.shape == (1, 50, 75, 3)
+            for t, e in zip(targets, expected_targets):
+                np.testing.assert_array_equal(t, e)
@@ -0,0 +1,70 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+from keras_retinanet.preprocessing.image_cache import ImageCache
+
+
+class CountingLoader(object):
+    """ Loads 100 byte images, counting how often every image was loaded. """
+    def __init__(self):
+        self.loads = {}
+
+    def __call__(self, key):
+        self.loads[key] = self.loads.get(key, 0) + 1
+        return np.full((10, 10), key, dtype=np.uint8), 0.5
+
+
+def test_hits_and_read_only():
+    cache = ImageCache(1000)
+    load  = CountingLoader()
+
+    image, scale = cache.get(1, load)
+    assert scale == 0.5
+    assert not image.flags.writeable
+
+    image_, _ = cache.get(1, load)
+    assert image_ is image
+    assert load.loads == {1: 1}
+    assert cache.info() == {'hits': 1, 'misses': 1, 'size': 1, 'bytes': 100, 'hit_rate': 0.5}
+
+
+def test_byte_budget_lru():
+    cache = ImageCache(300)
+    load  = CountingLoader()
+
+    for key in [0, 1, 2]:
+        cache.get(key, load)
+
+    # mark 0 as most recently used, then evict the least recently used image (1)
+    cache.get(0, load)
+    cache.get(3, load)
+    assert cache.info()['bytes'] == 300
+    assert cache.info()['size'] == 3
+
+    cache.get(1, load)
+    assert load.loads == {0: 1, 1: 2, 2: 1, 3: 1}
+
+
+def test_too_large():
+    cache = ImageCache(50)
+    load  = CountingLoader()
+
+    cache.get(0, load)
+    cache.get(0, load)
+    assert load.loads == {0: 2}
+    assert cache.info()['size'] == 0
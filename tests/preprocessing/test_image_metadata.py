@@ -0,0 +1,91 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+
+import numpy as np
+from PIL import Image
+
+from keras_retinanet.preprocessing import image_metadata
+from keras_retinanet.preprocessing.csv_generator import CSVGenerator
+from keras_retinanet.preprocessing.image_metadata import ImageMetadataCache
+from .test_generator import default_args
+
+
+def write_image(path, width, height, mode='RGB'):
+    Image.new(mode, (width, height)).save(path)
+    return path
+
+
+def test_lookup(tmpdir):
+    paths = [
+        write_image(str(tmpdir.join('a.png')), 40, 20),
+        write_image(str(tmpdir.join('b.png')), 10, 30, mode='L'),
+    ]
+    cache_path = str(tmpdir.join('cache', 'metadata.npz'))
+
+    metadata = ImageMetadataCache(cache_path, workers=2).lookup(paths)
+    np.testing.assert_array_equal(metadata[:, [image_metadata.WIDTH, image_metadata.HEIGHT, image_metadata.CHANNELS]], [[40, 20, 3], [10, 30, 1]])
+    assert metadata[0, image_metadata.FILE_SIZE] == os.path.getsize(paths[0])
+    assert os.path.exists(cache_path)
+
+    # a new cache reads the entries from disk and only re-reads modified images
+    cache = ImageMetadataCache(cache_path)
+    assert len(cache.entries) == 2
+
+    write_image(paths[0], 50, 20)
+    os.utime(paths[0], (0, 12345))
+    metadata = cache.lookup(paths)
+    np.testing.assert_array_equal(metadata[:, image_metadata.WIDTH], [50, 10])
+    assert ImageMetadataCache(cache_path).entries[os.path.abspath(paths[0])][image_metadata.MTIME] == 12345
+
+
+def test_stale_entries(tmpdir):
+    paths = [
+        write_image(str(tmpdir.join('a.png')), 40, 20),
+        write_image(str(tmpdir.join('b.png')), 10, 30),
+    ]
+    cache_path = str(tmpdir.join('metadata.npz'))
+    ImageMetadataCache(cache_path).lookup(paths)
+
+    # images that are no longer looked up are removed from the cache file
+    ImageMetadataCache(cache_path).lookup(paths[1:])
+    assert list(ImageMetadataCache(cache_path).entries.keys()) == [os.path.abspath(paths[1])]
+
+
+def test_csv_generator_cache_path(tmpdir):
+    write_image(str(tmpdir.join('a.png')), 40, 20)
+    write_image(str(tmpdir.join('b.png')), 10, 30)
+    tmpdir.join('annotations.csv').write('a.png,1,1,3,3,a\nb.png,1,1,3,3,a\n')
+    tmpdir.join('classes.csv').write('a,0\n')
+    cache_path = str(tmpdir.join('annotations.csv.image_metadata.npz'))
+
+    def create_generator(image_metadata_cache):
+        return CSVGenerator(
+            str(tmpdir.join('annotations.csv')),
+            str(tmpdir.join('classes.csv')),
+            index_cache=False,
+            image_metadata_cache=image_metadata_cache,
+            args=default_args(),
+        )
+
+    create_generator(False)
+    assert not os.path.exists(cache_path)
+
+    # the cache is stored next to the annotations file
+    generator = create_generator(True)
+    assert os.path.exists(cache_path)
+    np.testing.assert_allclose(generator.image_aspect_ratios(), [2, 1.0 / 3])
@@ -0,0 +1,129 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from keras_retinanet.preprocessing.multiprocess import MultiprocessGenerator
+from .test_generator import SimpleGenerator
+
+
+class IndexGenerator(SimpleGenerator):
+    """ Produces batches filled with the index of the first image of the group, optionally failing for some groups. """
+    def __init__(self, num_images, fail=None, crash=None, delay=None, side=32, **kwargs):
+        self.fail  = fail
+        self.crash = crash
+        self.delay = delay
+        self.side  = side
+        annotations = [np.zeros((0, 5)) for _ in range(num_images)]
+        super(IndexGenerator, self).__init__(
+            annotations, num_classes=2, image=np.zeros((32, 32, 3), dtype=np.uint8), image_min_side=32, image_max_side=32, **kwargs
+        )
+
+    def compute_input_output(self, group):
+        index = group[0]
+        if index == self.fail:
+            raise ValueError('failing group {}'.format(index))
+        if index == self.crash:
+            os._exit(1)
+        if self.delay:
+            # make the workers finish out of order
+            time.sleep(self.delay * (index % 3))
+
+        inputs  = np.full((len(group), self.side, self.side, 3), index, dtype=np.float32)
+        targets = [np.full((len(group), 10, 5), index, dtype=np.float32), np.full((len(group), 10, 3), index, dtype=np.float32)]
+        return inputs, targets
+
+
+def test_order():
+    generator = IndexGenerator(12, delay=0.01)
+    producer  = MultiprocessGenerator(generator, workers=3, prefetch=4)
+    try:
+        # two epochs, the batches are returned in the order of the groups of each epoch
+        for _ in range(2):
+            groups = None
+            for i in range(len(producer)):
+                inputs, targets = producer.next()
+                if groups is None:
+                    groups = [g[0] for g in generator.groups]
+                assert np.all(inputs == groups[i])
+                assert all(np.all(t == groups[i]) for t in targets)
+            assert sorted(groups) == list(range(12))
+    finally:
+        producer.close()
+
+
+def test_too_large_for_slot():
+    generator = IndexGenerator(4, shuffle_groups=False)
+    producer  = MultiprocessGenerator(generator, workers=2, max_slot_bytes=1024)
+    try:
+        for i in range(4):
+            inputs, _ = producer.next()
+            assert np.all(inputs == i)
+    finally:
+        producer.close()
+
+
+def test_larger_than_max_side():
+    # images that were not resized to image_max_side do not fit in the buffers
+    generator = IndexGenerator(4, side=40, shuffle_groups=False)
+    producer  = MultiprocessGenerator(generator, workers=2)
+    try:
+        with pytest.raises(RuntimeError) as e:
+            producer.next()
+        assert 'image_max_side' in str(e.value)
+    finally:
+        producer.close()
+
+
+def test_worker_exception():
+    generator = IndexGenerator(4, fail=1, shuffle_groups=False)
+    producer  = MultiprocessGenerator(generator, workers=2)
+    try:
+        producer.next()
+        with pytest.raises(RuntimeError) as e:
+            producer.next()
+        assert 'failing group 1' in str(e.value)
+
+        # the other workers keep producing batches
+        inputs, _ = producer.next()
+        assert np.all(inputs == 2)
+    finally:
+        producer.close()
+
+
+def test_worker_died():
+    generator = IndexGenerator(4, crash=1, shuffle_groups=False)
+    producer  = MultiprocessGenerator(generator, workers=2, poll_interval=0.1)
+    try:
+        producer.next()
+        with pytest.raises(RuntimeError) as e:
+            producer.next()
+        assert 'died' in str(e.value)
+    finally:
+        producer.close()
+
+
+def test_close():
+    producer  = MultiprocessGenerator(IndexGenerator(4), workers=2)
+    processes = list(producer.processes)
+    producer.close()
+
+    assert producer.processes == []
+    assert not any(process.is_alive() for process in processes)
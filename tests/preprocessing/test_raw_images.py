@@ -0,0 +1,113 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import pickle
+
+import numpy as np
+import pytest
+
+from keras_retinanet.preprocessing.csv_generator_multi import CSVGeneratorMULTI
+from keras_retinanet.preprocessing.raw_images import RawImageReader, RawImageWriter
+from .test_generator import default_args
+
+
+def random_images(prng):
+    return {
+        u'a_features': prng.randint(0, 256, size=(4, 6, 5)).astype(np.uint8),
+        u'été_features': prng.randint(0, 256, size=(3, 2, 5)).astype(np.uint8),
+        u'gray': prng.randint(0, 256, size=(5, 7)).astype(np.uint8),
+    }
+
+
+def test_round_trip(tmpdir):
+    path   = str(tmpdir.join('images.raw'))
+    images = random_images(np.random.RandomState(0))
+
+    with RawImageWriter(path) as writer:
+        for name, image in images.items():
+            writer.add(name, image)
+
+    reader = RawImageReader(path)
+    assert len(reader) == 3
+    assert reader.shape(u'gray') == (5, 7, 1)
+    for name, image in images.items():
+        loaded = reader[name]
+        assert isinstance(loaded, np.memmap)
+        assert not loaded.flags.writeable
+        np.testing.assert_array_equal(loaded, image.reshape(loaded.shape))
+
+    # the mapping is not pickled, but opened again when used
+    copy = pickle.loads(pickle.dumps(reader))
+    np.testing.assert_array_equal(copy[u'a_features'], images[u'a_features'])
+
+
+def test_append(tmpdir):
+    path   = str(tmpdir.join('images.raw'))
+    images = random_images(np.random.RandomState(0))
+
+    writer = RawImageWriter(path)
+    writer.add(u'a_features', images[u'a_features'])
+    writer.flush()
+
+    # images added after the last flush are lost when the writer is not closed
+    writer.add(u'gray', images[u'gray'])
+    writer.file.close()
+
+    with RawImageWriter(path, append=True) as writer:
+        assert u'a_features' in writer
+        assert u'gray' not in writer
+        writer.add(u'été_features', images[u'été_features'])
+
+    reader = RawImageReader(path)
+    assert reader.names == [u'a_features', u'été_features']
+    np.testing.assert_array_equal(reader[u'a_features'], images[u'a_features'])
+    np.testing.assert_array_equal(reader[u'été_features'], images[u'été_features'])
+
+
+def test_invalid_images(tmpdir):
+    with RawImageWriter(str(tmpdir.join('images.raw'))) as writer:
+        with pytest.raises(ValueError):
+            writer.add('float', np.zeros((2, 2, 1), dtype=np.float32))
+        with pytest.raises(ValueError):
+            writer.add('4d', np.zeros((2, 2, 1, 1), dtype=np.uint8))
+
+        writer.add('image', np.zeros((2, 2, 1), dtype=np.uint8))
+        with pytest.raises(ValueError):
+            writer.add('image', np.zeros((2, 2, 1), dtype=np.uint8))
+
+
+def test_empty(tmpdir):
+    path = str(tmpdir.join('images.raw'))
+    RawImageWriter(path).close()
+    assert len(RawImageReader(path)) == 0
+
+
+def test_csv_generator_multi(tmpdir):
+    images = random_images(np.random.RandomState(0))
+    with RawImageWriter(str(tmpdir.join('images.raw'))) as writer:
+        writer.add(u'a_features', images[u'a_features'])
+
+    tmpdir.join('annotations.csv').write('a_features,6,4,1,1,3,3,a\n')
+    tmpdir.join('classes.csv').write('a,0\n')
+
+    generator = CSVGeneratorMULTI(
+        str(tmpdir.join('annotations.csv')),
+        str(tmpdir.join('classes.csv')),
+        index_cache=False,
+        raw_images='images.raw',
+        args=default_args(),
+    )
+    np.testing.assert_array_equal(generator.load_image(0), images[u'a_features'])
@@ -0,0 +1,193 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import pickle
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+from PIL import Image
+
+from keras_retinanet.preprocessing.record_generator import RecordGenerator
+from keras_retinanet.preprocessing.records import ShardReader, write_records
+from .test_generator import SimpleGenerator, default_args
+
+
+class FileGenerator(SimpleGenerator):
+    """ Generator with one PNG file and one annotation per image. """
+    def __init__(self, directory, num_images, **kwargs):
+        prng        = np.random.RandomState(0)
+        self.paths  = []
+        self.images = []
+        for i in range(num_images):
+            image = prng.randint(0, 256, size=(20 + i, 30, 3)).astype(np.uint8)
+            path  = os.path.join(directory, 'image_{}.png'.format(i))
+            Image.fromarray(image[:, :, ::-1]).save(path)
+            self.paths.append(path)
+            self.images.append(image)
+
+        annotations = [np.array([[1, 2, 10 + i, 12, i % 2]], dtype=float) for i in range(num_images)]
+        super(FileGenerator, self).__init__(annotations, num_classes=2, **kwargs)
+
+    def image_paths(self):
+        return self.paths
+
+    def label_to_name(self, label):
+        return ['a', 'b'][label]
+
+    def load_image(self, image_index):
+        return self.images[image_index]
+
+
+def test_round_trip(tmpdir):
+    source      = FileGenerator(str(tmpdir), 10)
+    records_dir = str(tmpdir.join('records'))
+
+    # small shards, so the images are spread over several shards
+    assert write_records(source, records_dir, shard_size=3000) > 2
+
+    generator = RecordGenerator(records_dir, args=default_args())
+    assert generator.size() == 10
+    assert generator.classes == {'a': 0, 'b': 1}
+    assert generator.num_classes() == 2
+
+    loaded = {}
+    for i in range(generator.size()):
+        image        = generator.load_image(i)
+        annotations  = generator.load_annotations(i)
+        source_index = int(annotations[0, 2]) - 10
+        np.testing.assert_array_equal(image, source.images[source_index])
+        np.testing.assert_array_equal(annotations, source.annotations_group[source_index])
+        assert generator.image_aspect_ratio(i) == 30.0 / (20 + source_index)
+        loaded[source_index] = i
+
+    # every image was written once, in a shuffled order
+    assert sorted(loaded) == list(range(10))
+    assert [loaded[i] for i in range(10)] != list(range(10))
+
+
+def test_shard_groups(tmpdir):
+    records_dir = str(tmpdir.join('records'))
+    write_records(FileGenerator(str(tmpdir), 20), records_dir, shard_size=3000)
+
+    generator = RecordGenerator(records_dir, buffer_size=1000, interleave=2, batch_size=3, args=default_args())
+    assert max(len(blocks) for blocks in generator.blocks) > 1
+
+    # the block of every image in its shard
+    block = np.zeros(generator.size(), dtype=int)
+    for blocks in generator.blocks:
+        for b, images in enumerate(blocks):
+            block[images] = b
+
+    for _ in range(3):
+        generator.shuffle_group_order()
+        order  = [i for group in generator.groups for i in group][:generator.size()]
+        shards = generator.index.shard[order]
+
+        # every image once, the blocks of a shard in the order they are stored
+        assert sorted(order) == list(range(20))
+        for shard in np.unique(shards):
+            assert np.all(np.diff(block[np.array(order)[shards == shard]]) >= 0)
+
+            # only one other shard is read while reading a shard
+            positions = np.flatnonzero(shards == shard)
+            assert len(np.unique(shards[positions[0]:positions[-1] + 1])) <= 2
+
+
+def test_shard_reads(tmpdir):
+    records_dir = str(tmpdir.join('records'))
+    write_records(FileGenerator(str(tmpdir), 20), records_dir, shard_size=3000)
+
+    generator = RecordGenerator(records_dir, buffer_size=1000, interleave=2, args=default_args())
+    generator.shuffle_group_order()
+    for group in generator.groups:
+        for i in group:
+            generator.load_image(i)
+
+    # one read per block
+    assert sum(reader.reads for reader in generator.readers) == sum(len(blocks) for blocks in generator.blocks)
+
+    # at most interleave shards keep their read buffer
+    assert sum(len(reader.buffer) > 0 for reader in generator.readers) <= 2
+
+
+def test_random_reads(tmpdir):
+    records_dir = str(tmpdir.join('records'))
+    source      = FileGenerator(str(tmpdir), 10)
+    write_records(source, records_dir, shard_size=3000)
+
+    generator = RecordGenerator(records_dir, group_method='random', args=default_args())
+    for i in range(generator.size()):
+        image = generator.load_image(i)
+        np.testing.assert_array_equal(image, source.images[int(generator.load_annotations(i)[0, 2]) - 10])
+
+        # only the record itself is read
+        reader = generator.readers[generator.index.shard[i]]
+        assert len(reader.buffer) == generator.index.lengths[i]
+
+
+def test_concurrent_reads(tmpdir):
+    records_dir = str(tmpdir.join('records'))
+    source      = FileGenerator(str(tmpdir), 20)
+    write_records(source, records_dir, shard_size=3000)
+
+    generator = RecordGenerator(records_dir, buffer_size=1000, interleave=2, args=default_args())
+    expected  = [source.images[int(generator.load_annotations(i)[0, 2]) - 10] for i in range(generator.size())]
+
+    # images are loaded by several threads when evaluating with prefetching
+    pool = ThreadPool(4)
+    try:
+        indices = list(np.random.RandomState(0).randint(0, generator.size(), 400))
+        for i, image in zip(indices, pool.map(generator.load_image, indices)):
+            np.testing.assert_array_equal(image, expected[i])
+    finally:
+        pool.close()
+        pool.join()
+
+    assert len(generator.open_shards) == len(set(generator.open_shards)) <= 2
+
+    # the generator can be sent to worker processes
+    copy = pickle.loads(pickle.dumps(generator))
+    np.testing.assert_array_equal(copy.load_image(0), expected[0])
+
+
+def test_shard_reader(tmpdir):
+    path = str(tmpdir.join('shard.rec'))
+    data = bytes(bytearray(range(256))) * 4
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    reader = ShardReader(path, buffer_size=300)
+    assert reader.read(0, 10) == data[:10]
+    assert reader.read(100, 200) == data[100:300]
+    assert reader.reads == 1
+
+    # reads outside the buffer, and reads larger than the buffer
+    assert reader.read(290, 20) == data[290:310]
+    assert reader.read(0, 1024) == data
+    assert reader.reads == 3
+
+    reader.release()
+    assert reader.read(500, 10) == data[500:510]
+    assert reader.reads == 4
+
+    # the range of the buffer can be given per read
+    reader.release()
+    assert reader.read(600, 10, start=550, stop=650) == data[600:610]
+    assert (reader.buffer_start, len(reader.buffer)) == (550, 100)
+    assert reader.read(700, 10, stop=710) == data[700:710]
+    assert len(reader.buffer) == 10
+    assert reader.reads == 6
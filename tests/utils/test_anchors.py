@@ -0,0 +1,114 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import collections
+import pickle
+
+import numpy as np
+
+from keras_retinanet.utils.anchors import AnchorCache, ShapesCallback, anchors_for_shape, anchor_targets_bbox
+
+
+class TestAnchorCache(object):
+    def test_hit_miss(self):
+        cache = AnchorCache(max_size=2)
+
+        anchors = cache((64, 96, 3))
+        np.testing.assert_array_equal(anchors, anchors_for_shape((64, 96, 3)))
+        assert cache.info() == {'hits': 0, 'misses': 1, 'size': 1}
+
+        # same shape and parameters should hit the cache
+        assert cache((64, 96, 3)) is anchors
+        assert cache.info() == {'hits': 1, 'misses': 1, 'size': 1}
+
+        # different parameters should miss
+        cache((64, 96, 3), ratios=np.array([1.0]))
+        assert cache.info() == {'hits': 1, 'misses': 2, 'size': 2}
+
+    def test_eviction(self):
+        cache = AnchorCache(max_size=2)
+
+        cache((64, 64, 3))
+        cache((64, 96, 3))
+        cache((64, 64, 3))  # mark as most recently used
+        cache((96, 96, 3))  # evicts (64, 96, 3)
+
+        assert cache.info()['size'] == 2
+        cache((64, 64, 3))
+        assert cache.info()['hits'] == 2
+        cache((64, 96, 3))
+        assert cache.info()['misses'] == 4
+
+    def test_read_only(self):
+        anchors = AnchorCache()((64, 64, 3))
+        assert not anchors.flags.writeable
+
+
+Node = collections.namedtuple('Node', ['inbound_layers'])
+
+
+class PoolingLayer(object):
+    """ Layer with the shape arithmetic of a 2x2 max pooling layer with 'valid' padding. """
+    def __init__(self, name, inbound=None):
+        self.name           = name
+        self._inbound_nodes = [Node([inbound])] if inbound else []
+
+    def compute_output_shape(self, input_shape):
+        return (input_shape[0], input_shape[1] // 2, input_shape[2] // 2, input_shape[3])
+
+
+class PoolingModel(object):
+    """ Model with pyramid levels P1 to P5 that round the shapes down, unlike guess_shapes. """
+    def __init__(self):
+        self.input_shape = (None, None, None, 3)
+        self.layers      = [PoolingLayer('input')]
+        for level in range(1, 6):
+            self.layers.append(PoolingLayer('P{}'.format(level), self.layers[-1]))
+
+
+class TestShapesCallback(object):
+    def test_model_shapes(self):
+        callback = ShapesCallback(PoolingModel())
+        np.testing.assert_array_equal(callback((100, 75, 3), [3, 4, 5]), [[12, 9], [6, 4], [3, 2]])
+
+    def test_pickled_table(self):
+        callback = ShapesCallback(PoolingModel(), max_side=200)
+        pickled  = pickle.loads(pickle.dumps(callback))
+        assert pickled.model is None
+
+        for image_shape in [(100, 75, 3), (200, 1, 3), (33, 199, 3)]:
+            np.testing.assert_array_equal(pickled(image_shape, [3, 4, 5]), callback(image_shape, [3, 4, 5]))
+
+
+class TestSparseAssignment(object):
+    def test_identical_to_dense(self):
+        prng        = np.random.RandomState(0)
+        image_shape = (200, 300, 3)
+
+        sizes       = prng.uniform(5, 150, (50, 2))
+        x1          = prng.uniform(0, image_shape[1] - sizes[:, 0])
+        y1          = prng.uniform(0, image_shape[0] - sizes[:, 1])
+        labels      = prng.randint(0, 3, 50)
+        annotations = np.stack([x1, y1, x1 + sizes[:, 0], y1 + sizes[:, 1], labels], axis=1)
+
+        # add boxes aligned to the anchor grid, to check ties and touching boxes
+        annotations = np.concatenate([annotations, [[0, 0, 32, 32, 0], [32, 32, 64, 64, 1], [0, 0, 32, 32, 2]]], axis=0)
+
+        dense  = anchor_targets_bbox(image_shape, annotations, 3, assignment='dense')
+        sparse = anchor_targets_bbox(image_shape, annotations, 3, assignment='sparse')
+
+        for d, s in zip(dense, sparse):
+            np.testing.assert_array_equal(d, s)
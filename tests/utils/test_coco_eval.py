@@ -0,0 +1,84 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pycocotools')
+
+from keras_retinanet.utils.coco_eval import _coco_results, _JsonResultsWriter  # noqa: E402
+
+
+def random_detections(prng, num_detections):
+    xy     = prng.uniform(0, 100, size=(num_detections, 2))
+    boxes  = np.concatenate([xy, xy + prng.uniform(1, 50, size=(num_detections, 2))], axis=1).astype(np.float32)
+    scores = np.sort(prng.uniform(0, 1, size=(num_detections,)).astype(np.float32))[::-1]
+    labels = prng.randint(0, 3, size=(num_detections,)).astype(np.int32)
+    return boxes, scores, labels
+
+
+def reference_results(image_id, boxes, scores, labels, coco_labels, threshold):
+    """ The per detection dicts that evaluate_coco used to build. """
+    results = []
+    for box, score, label in zip(boxes, scores, labels):
+        if score < threshold:
+            break
+        results.append({
+            'image_id'    : image_id,
+            'category_id' : int(coco_labels[label]),
+            'score'       : float(score),
+            'bbox'        : [float(box[0]), float(box[1]), float(box[2] - box[0]), float(box[3] - box[1])],
+        })
+    return results
+
+
+def to_dicts(rows):
+    return [{
+        'image_id'    : int(row[0]),
+        'category_id' : int(row[6]),
+        'score'       : row[5],
+        'bbox'        : row[1:5],
+    } for row in rows.tolist()]
+
+
+def test_coco_results():
+    prng        = np.random.RandomState(0)
+    coco_labels = np.array([1, 5, 90])
+
+    for image_id in range(5):
+        boxes, scores, labels = random_detections(prng, 50)
+        expected = reference_results(image_id, boxes, scores, labels, coco_labels, 0.3)
+        assert to_dicts(_coco_results(image_id, boxes, scores, labels, coco_labels, 0.3)) == expected
+
+
+def test_json_results_writer(tmpdir):
+    prng        = np.random.RandomState(1)
+    coco_labels = np.array([1, 5, 90])
+    path        = str(tmpdir.join('results.json'))
+
+    expected = []
+    writer   = _JsonResultsWriter(path)
+    for image_id in range(5):
+        # include images without detections
+        rows = _coco_results(image_id, *random_detections(prng, 10), coco_labels=coco_labels, threshold=0.5 if image_id else 2)
+        writer.write(rows)
+        expected.extend(to_dicts(rows))
+    writer.close()
+
+    with open(path) as f:
+        assert json.load(f) == expected
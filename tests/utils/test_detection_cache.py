@@ -0,0 +1,149 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from keras_retinanet.utils.detection_cache import DetectionCache, detection_cache_key
+from keras_retinanet.utils.eval import evaluate
+
+from .test_eval import ImagesGenerator
+
+
+class RandomModel(object):
+    """ Fake inference model with random (padded) detections, which counts the number of predicted images. """
+    def __init__(self, seed=0, nms_threshold=0.5):
+        self.weights       = [np.full((3, 3), seed, dtype=np.float32)]
+        self.nms_threshold = nms_threshold
+        self.predicted     = 0
+
+    def get_weights(self):
+        return self.weights
+
+    def get_config(self):
+        return {'layers': [{'class_name': 'FilterDetections', 'config': {'nms_threshold': self.nms_threshold}}]}
+
+    def predict_on_batch(self, inputs):
+        prng   = np.random.RandomState(int(inputs[0, 0, 0, 0]))
+        batch  = inputs.shape[0]
+        xy     = prng.uniform(0, 50, size=(batch, 20, 2))
+        boxes  = np.concatenate([xy, xy + prng.uniform(1, 50, size=(batch, 20, 2))], axis=2).astype(np.float32)
+        scores = prng.uniform(0, 1, size=(batch, 20)).astype(np.float32)
+        labels = prng.randint(0, 2, size=(batch, 20)).astype(np.int32)
+
+        # padding, as produced by FilterDetections
+        scores[:, -5:] = -1
+        labels[:, -5:] = -1
+
+        self.predicted += batch
+        return boxes, scores, labels
+
+
+class DatasetGenerator(ImagesGenerator):
+    """ ImagesGenerator with its images identified by a dataset file. """
+    def __init__(self, images, dataset_file, **kwargs):
+        self.dataset_file = dataset_file
+        super(DatasetGenerator, self).__init__(images, **kwargs)
+
+    def dataset_files(self):
+        return [self.dataset_file] if self.dataset_file else None
+
+
+def make_generator(tmpdir, **kwargs):
+    images = [np.full((100, 100, 3), i, dtype=np.uint8) for i in range(6)]
+    dataset_file = tmpdir.join('dataset.txt')
+    if not dataset_file.check():
+        dataset_file.write('images')
+    generator = DatasetGenerator(images, str(dataset_file), image_min_side=100, image_max_side=100, **kwargs)
+    generator.annotations_group = [np.array([[10, 10, 40, 40, 0], [20, 20, 60, 60, 1]], dtype=np.float64)] * len(images)
+    generator.num_classes_ = 2
+    return generator
+
+
+def test_round_trip(tmpdir):
+    path  = str(tmpdir.join('cache.npz'))
+    cache = DetectionCache(path, 'key', 3)
+    cache[0] = (np.ones((1, 4)), np.array([0.5]), np.array([1]))
+    cache[2] = (np.zeros((2, 4)), np.array([0.5, -1]), np.array([1, -1]))
+    cache.save()
+
+    loaded = DetectionCache(path, 'key', 3)
+    assert loaded.missing() == [1]
+    np.testing.assert_array_equal(loaded[0][0], np.ones((1, 4)))
+    assert loaded[2][0].shape == (1, 4)
+    assert loaded[2][2].tolist() == [1]
+
+    # another key or number of images ignores the cache file
+    assert DetectionCache(path, 'other', 3).missing() == [0, 1, 2]
+    assert DetectionCache(path, 'key', 4).missing() == [0, 1, 2, 3]
+
+
+def test_key(tmpdir):
+    generator = make_generator(tmpdir)
+    key       = detection_cache_key(RandomModel(), generator)
+    assert key == detection_cache_key(RandomModel(), generator)
+    assert key != detection_cache_key(RandomModel(seed=1), generator)
+    assert key != detection_cache_key(RandomModel(nms_threshold=0.3), generator)
+    assert key != detection_cache_key(RandomModel(), generator, batch_size=2)
+    assert key != detection_cache_key(RandomModel(), make_generator(tmpdir, preprocess_in_model=True))
+
+    # modifying the dataset file changes the key
+    tmpdir.join('dataset.txt').write('other images')
+    os.utime(str(tmpdir.join('dataset.txt')), (0, 12345))
+    assert key != detection_cache_key(RandomModel(), generator)
+
+
+def test_unidentified_dataset(tmpdir):
+    generator = make_generator(tmpdir)
+    generator.dataset_file = None
+    assert detection_cache_key(RandomModel(), generator) is None
+
+    # evaluation runs without caching the detections
+    model = RandomModel()
+    with pytest.warns(UserWarning):
+        evaluate(generator, model, cache_dir=str(tmpdir.join('cache')))
+    assert model.predicted == generator.size()
+    assert not tmpdir.join('cache').check()
+
+
+def test_evaluate_reuses_detections(tmpdir):
+    generator = make_generator(tmpdir)
+    cache_dir = str(tmpdir.join('cache'))
+
+    for score_threshold in [0.05, 0.5]:
+        model    = RandomModel()
+        expected = evaluate(generator, model, score_threshold=score_threshold)
+        assert evaluate(generator, model, score_threshold=score_threshold, cache_dir=cache_dir) == expected
+        assert evaluate(generator, model, score_threshold=score_threshold, cache_dir=cache_dir) == expected
+
+        # the model only runs without the cache and for the first evaluation with the cache
+        assert model.predicted == (2 if score_threshold == 0.05 else 1) * generator.size()
+
+
+def test_evaluate_partial_cache(tmpdir):
+    generator = make_generator(tmpdir)
+    model     = RandomModel()
+    cache     = DetectionCache.for_model(str(tmpdir), model, generator)
+    for i, (boxes, scores, labels) in enumerate(zip(*model.predict_on_batch(np.arange(3).reshape(3, 1, 1, 1)))):
+        cache[i] = boxes, scores, labels
+    cache.save()
+
+    model.predicted = 0
+    evaluate(generator, model, cache_dir=str(tmpdir))
+    assert model.predicted == generator.size() - 3
+    assert DetectionCache.for_model(str(tmpdir), model, generator).missing() == []
@@ -0,0 +1,197 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import subprocess
+import sys
+
+import numpy as np
+
+from keras_retinanet.utils.anchors import compute_overlap
+from keras_retinanet.utils.eval import (
+    COCO_IOU_THRESHOLDS,
+    _compute_ap,
+    average_precision_table,
+    compute_average_precisions,
+    predict_images,
+)
+
+from ..preprocessing.test_generator import SimpleGenerator
+
+
+def reference_average_precisions(all_detections, all_annotations, num_classes, iou_threshold):
+    """ Per detection implementation of the AP computation, used as reference. """
+    average_precisions = {}
+    for label in range(num_classes):
+        false_positives = np.zeros((0,))
+        true_positives  = np.zeros((0,))
+        scores          = np.zeros((0,))
+        num_annotations = 0.0
+
+        for i in range(len(all_detections)):
+            detections           = all_detections[i][label]
+            annotations          = all_annotations[i][label]
+            num_annotations     += annotations.shape[0]
+            detected_annotations = []
+
+            for d in detections:
+                scores = np.append(scores, d[4])
+
+                if annotations.shape[0] == 0:
+                    false_positives = np.append(false_positives, 1)
+                    true_positives  = np.append(true_positives, 0)
+                    continue
+
+                overlaps            = compute_overlap(np.expand_dims(d, axis=0), annotations)
+                assigned_annotation = np.argmax(overlaps, axis=1)
+                max_overlap         = overlaps[0, assigned_annotation]
+
+                if max_overlap >= iou_threshold and assigned_annotation not in detected_annotations:
+                    false_positives = np.append(false_positives, 0)
+                    true_positives  = np.append(true_positives, 1)
+                    detected_annotations.append(assigned_annotation)
+                else:
+                    false_positives = np.append(false_positives, 1)
+                    true_positives  = np.append(true_positives, 0)
+
+        if num_annotations == 0:
+            average_precisions[label] = 0
+            continue
+
+        indices         = np.argsort(-scores)
+        false_positives = np.cumsum(false_positives[indices])
+        true_positives  = np.cumsum(true_positives[indices])
+        recall          = true_positives / num_annotations
+        precision       = true_positives / np.maximum(true_positives + false_positives, np.finfo(np.float64).eps)
+        average_precisions[label] = _compute_ap(recall, precision)
+
+    return average_precisions
+
+
+def random_boxes(prng, n):
+    xy = prng.uniform(0, 100, size=(n, 2))
+    wh = prng.uniform(5, 40, size=(n, 2))
+    return np.concatenate([xy, xy + wh], axis=1)
+
+
+def random_dataset(prng, num_classes):
+    all_detections  = []
+    all_annotations = []
+    for _ in range(30):
+        image_detections  = []
+        image_annotations = []
+        for label in range(num_classes):
+            annotations = random_boxes(prng, prng.randint(0, 6))
+
+            # detections near the annotations (with duplicates) and random false positives
+            detections = random_boxes(prng, prng.randint(0, 4))
+            if annotations.shape[0]:
+                near       = annotations[prng.randint(0, annotations.shape[0], size=prng.randint(0, 8))]
+                detections = np.concatenate([detections, near + prng.normal(0, 3, size=near.shape)])
+            scores = np.sort(prng.uniform(size=(detections.shape[0], 1)), axis=0)[::-1]
+
+            image_detections.append(np.concatenate([detections, scores], axis=1).astype(np.float32))
+            image_annotations.append(annotations)
+
+        all_detections.append(image_detections)
+        all_annotations.append(image_annotations)
+
+    return all_detections, all_annotations
+
+
+def test_matches_reference():
+    num_classes = 4
+    all_detections, all_annotations = random_dataset(np.random.RandomState(0), num_classes)
+
+    for iou_threshold in [0.3, 0.5, 0.75]:
+        expected = reference_average_precisions(all_detections, all_annotations, num_classes, iou_threshold)
+        actual   = compute_average_precisions(all_detections, all_annotations, num_classes, iou_threshold=iou_threshold)
+        assert actual == expected
+
+
+def test_parallel():
+    num_classes = 5
+    all_detections, all_annotations = random_dataset(np.random.RandomState(1), num_classes)
+
+    expected = compute_average_precisions(all_detections, all_annotations, num_classes)
+    actual   = compute_average_precisions(all_detections, all_annotations, num_classes, n_jobs=2)
+    assert actual == expected
+
+
+def test_multiple_thresholds():
+    num_classes = 4
+    all_detections, all_annotations = random_dataset(np.random.RandomState(2), num_classes)
+
+    for n_jobs in [1, 2]:
+        average_precisions = compute_average_precisions(all_detections, all_annotations, num_classes, iou_threshold=COCO_IOU_THRESHOLDS, n_jobs=n_jobs)
+        table              = average_precision_table(average_precisions)
+        assert table.shape == (len(COCO_IOU_THRESHOLDS), num_classes)
+
+        # every row equals a separate evaluation at that threshold
+        for iou_threshold, row in zip(COCO_IOU_THRESHOLDS, table):
+            expected = compute_average_precisions(all_detections, all_annotations, num_classes, iou_threshold=iou_threshold)
+            assert row.tolist() == [expected[label] for label in range(num_classes)]
+
+
+class ImagesGenerator(SimpleGenerator):
+    def __init__(self, images, **kwargs):
+        self.images = images
+        super(ImagesGenerator, self).__init__([np.zeros((0, 5))] * len(images), num_classes=1, **kwargs)
+
+    def load_image(self, image_index):
+        return self.images[image_index]
+
+    def image_aspect_ratio(self, image_index):
+        return float(self.images[image_index].shape[1]) / float(self.images[image_index].shape[0])
+
+
+class BoxesModel(object):
+    """ Fake inference model that predicts one box covering the whole (padded) input. """
+    def predict_on_batch(self, inputs):
+        batch, height, width = inputs.shape[:3]
+        boxes = np.tile(np.array([[[0, 0, width, height]]], dtype=np.float32), (batch, 1, 1))
+        return boxes, np.ones((batch, 1)), np.zeros((batch, 1))
+
+
+def test_predict_images_batched():
+    images    = [np.zeros((h, w, 3), dtype=np.uint8) for h, w in [(100, 200), (100, 150), (120, 100), (80, 160), (100, 100)]]
+    generator = ImagesGenerator(images, image_min_side=50, image_max_side=200)
+
+    for batch_size in [1, 2, 3]:
+        results = sorted(predict_images(generator, BoxesModel(), batch_size=batch_size), key=lambda r: r[0])
+        assert [r[0] for r in results] == list(range(len(images)))
+
+        # boxes are clipped to every image and scaled back to the original image
+        for (_, _, boxes, _, _), image in zip(results, images):
+            np.testing.assert_allclose(boxes[0, 0], [0, 0, image.shape[1], image.shape[0]], rtol=1e-5)
+
+
+def test_predict_images_prefetch():
+    images    = [np.full((h, w, 3), i, dtype=np.uint8) for i, (h, w) in enumerate([(100, 200), (100, 150), (120, 100), (80, 160), (100, 100)])]
+    generator = ImagesGenerator(images, image_min_side=50, image_max_side=200)
+
+    expected = list(predict_images(generator, BoxesModel(), batch_size=2))
+    for prefetch in [1, 2, 8]:
+        results = list(predict_images(generator, BoxesModel(), batch_size=2, prefetch=prefetch))
+        assert [r[0] for r in results] == [r[0] for r in expected]
+        for result, expected_result in zip(results, expected):
+            np.testing.assert_array_equal(result[1], expected_result[1])
+            np.testing.assert_array_equal(result[2], expected_result[2])
+
+
+def test_worker_imports():
+    # the worker processes of compute_average_precisions import this module, it should not load tensorflow
+    code = 'import sys, keras_retinanet.utils.eval; print("tensorflow" in sys.modules or "keras" in sys.modules)'
+    assert subprocess.check_output([sys.executable, '-c', code]).strip() == b'False'